@@ -24,18 +24,152 @@ CREATE TABLE parsed_discounts (
     discount_id SERIAL PRIMARY KEY,        -- ID скидки
     service_id INT REFERENCES services(service_id) ON DELETE CASCADE,
     product_name VARCHAR(255),             -- Название товара
-    price_new VARCHAR(50),                 -- Новая цена
-    price_old VARCHAR(50),                 -- Старая цена
+    brand VARCHAR(255),                    -- Бренд
+    price_new BIGINT,                      -- Новая цена в тиынах
+    price_old BIGINT,                      -- Старая цена в тиынах
     discount_percent INT,                  -- Процент скидки
-    parsed_at TIMESTAMP DEFAULT NOW(),     -- Дата парсинга
-    UNIQUE(service_id, product_name)       -- Уникальность скидки по названию
+    rating VARCHAR(50),                    -- Рейтинг
+    sizes TEXT,                            -- Размеры через запятую
+    content_hash CHAR(32),                 -- MD5 полей товара (для записи только изменений)
+    is_active BOOLEAN NOT NULL DEFAULT TRUE, -- Товар есть на сайте
+    deactivated_at TIMESTAMP,              -- Когда товар пропал с сайта
+    parsed_at TIMESTAMP DEFAULT NOW()      -- Дата парсинга (последнего изменения)
 );
+-- Уникальность товара по бренду и названию (бренда может не быть)
+CREATE UNIQUE INDEX uq_parsed_discounts_product ON parsed_discounts (service_id, (COALESCE(brand, '')), product_name);
 
+-- Категории, в которых товар сейчас есть (один товар Lamoda бывает и в women, и в men)
+CREATE TABLE parsed_discount_categories (
+    discount_id INT NOT NULL REFERENCES parsed_discounts(discount_id) ON DELETE CASCADE,
+    category VARCHAR(50) NOT NULL,         -- Категория (women/men/kids для Lamoda)
+    PRIMARY KEY (discount_id, category)
+);
+
+-- Секционирована по месяцам; старые секции удаляет задание хранения в планировщике.
+-- Повторы (user_id, service_id, discount_id) отсекает запрос вставки (NOT EXISTS) под advisory-блокировкой
+-- ведра пользователей (db.lock_sent_buckets).
 CREATE TABLE sent_discounts (
-    sent_id SERIAL PRIMARY KEY,            -- ID отправленной скидки
-    user_id BIGINT REFERENCES users(user_id) ON DELETE CASCADE,
-    service_id INT REFERENCES services(service_id) ON DELETE CASCADE,
-    discount_id INT REFERENCES parsed_discounts(discount_id) ON DELETE CASCADE,
-    sent_at TIMESTAMP DEFAULT NOW(),       -- Время отправки скидки
-    UNIQUE(user_id, service_id, discount_id) -- Уникальность отправки
+    sent_id BIGSERIAL,                     -- ID отправленной скидки
+    user_id BIGINT NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    service_id INT NOT NULL REFERENCES services(service_id) ON DELETE CASCADE,
+    discount_id INT NOT NULL REFERENCES parsed_discounts(discount_id) ON DELETE CASCADE,
+    sent_at TIMESTAMP NOT NULL DEFAULT NOW(), -- Время отправки скидки
+    PRIMARY KEY (sent_id, sent_at)
+) PARTITION BY RANGE (sent_at);
+
+-- Очередь парсинга (worker.py): обход каталога и его страницы
+CREATE TABLE scrape_crawls (
+    crawl_id BIGSERIAL PRIMARY KEY,        -- ID обхода
+    service_name VARCHAR(50) NOT NULL,     -- Сервис (Lamoda, Magnum)
+    category VARCHAR(50),                  -- Категория в parsed_discount_categories
+    city VARCHAR(50),                      -- Город каталога
+    url TEXT NOT NULL,                     -- Первая страница каталога
+    max_pages INT NOT NULL DEFAULT 1,      -- Не больше N страниц
+    status VARCHAR(16) NOT NULL DEFAULT 'pending', -- pending | ingesting | done | failed
+    error TEXT,                            -- Причина неудачи
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    finished_at TIMESTAMP
+);
+
+CREATE TABLE scrape_jobs (
+    job_id BIGSERIAL PRIMARY KEY,          -- ID задания
+    crawl_id BIGINT NOT NULL REFERENCES scrape_crawls(crawl_id) ON DELETE CASCADE,
+    page INT NOT NULL,                     -- Номер страницы каталога
+    url TEXT NOT NULL,                     -- URL страницы
+    probe BOOLEAN NOT NULL DEFAULT FALSE,  -- Страница без пагинации: продолжать, пока приходят новые товары
+    status VARCHAR(16) NOT NULL DEFAULT 'pending', -- pending | running | done | failed
+    attempts INT NOT NULL DEFAULT 0,       -- Сколько раз задание выдавалось воркерам
+    max_attempts INT NOT NULL DEFAULT 3,
+    worker_id TEXT,                        -- Воркер, который держит задание
+    available_at TIMESTAMP NOT NULL DEFAULT NOW(), -- Повтор после ошибки – не раньше этого времени
+    heartbeat_at TIMESTAMP,                -- Последний сигнал воркера
+    lease_expires_at TIMESTAMP,            -- Аренда истекла – задание заберёт другой воркер
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    products INT,                          -- Товаров на странице
+    result BYTEA,                          -- ProductBatch.to_bytes()
+    error TEXT,
+    UNIQUE (crawl_id, page)
+);
+
+-- Шардирование рассылки (DISPATCH_MODE=sharded): живые реплики планировщика и обработанные ведра пользователей
+CREATE TABLE scheduler_replicas (
+    replica_id TEXT PRIMARY KEY,           -- Хост:PID или REPLICA_ID
+    started_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    heartbeat_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    lease_expires_at TIMESTAMP NOT NULL    -- Аренда истекла – ведра реплики делятся между остальными
 );
+
+CREATE TABLE dispatch_claims (
+    tick TIMESTAMP NOT NULL,               -- Минута рассылки (время Алматы)
+    bucket INT NOT NULL,                   -- Ведро пользователей: user_id % DISPATCH_BUCKET_COUNT
+    replica_id TEXT NOT NULL,              -- Реплика, которая рассылает ведро
+    claimed_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    finished_at TIMESTAMP,                 -- Рассылка завершена и отмечена в sent_discounts
+    lease_expires_at TIMESTAMP NOT NULL DEFAULT NOW(),  -- Владелец продлевает, пока рассылает; истекла – ведро забирают
+    PRIMARY KEY (tick, bucket)
+);
+
+-- Создание секции месяца
+CREATE OR REPLACE FUNCTION create_sent_discounts_partition(month DATE) RETURNS TEXT AS $$
+DECLARE
+    start_at DATE := date_trunc('month', month)::DATE;
+    partition_name TEXT := format('sent_discounts_p%s', to_char(start_at, 'YYYYMM'));
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF sent_discounts FOR VALUES FROM (%L) TO (%L)',
+        partition_name, start_at, (start_at + INTERVAL '1 month')::DATE
+    );
+    RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT create_sent_discounts_partition((date_trunc('month', NOW()) + n * INTERVAL '1 month')::DATE)
+FROM generate_series(0, 2) AS n;
+
+CREATE INDEX idx_subscriptions_notification_time ON subscriptions (notification_time);
+CREATE INDEX idx_parsed_discounts_service_percent ON parsed_discounts (service_id, discount_percent) WHERE is_active;
+CREATE INDEX idx_sent_discounts_seen ON sent_discounts (user_id, service_id, discount_id);
+CREATE INDEX idx_sent_discounts_discount_id ON sent_discounts (discount_id);
+CREATE INDEX idx_sent_discounts_sent_at ON sent_discounts (sent_at);
+CREATE INDEX idx_parsed_discount_categories_category ON parsed_discount_categories (category, discount_id);
+CREATE INDEX idx_parsed_discounts_deactivated_at ON parsed_discounts (deactivated_at) WHERE NOT is_active;
+CREATE INDEX idx_scrape_jobs_pending ON scrape_jobs (available_at) WHERE status = 'pending';
+CREATE INDEX idx_scrape_jobs_running ON scrape_jobs (lease_expires_at) WHERE status = 'running';
+CREATE INDEX idx_scrape_crawls_open ON scrape_crawls (service_name, category, city) WHERE status IN ('pending', 'ingesting');
+CREATE INDEX idx_dispatch_claims_unfinished ON dispatch_claims (bucket) WHERE finished_at IS NULL;
+CREATE INDEX idx_dispatch_claims_bucket ON dispatch_claims (bucket, claimed_at);
+CREATE INDEX idx_dispatch_claims_stale ON dispatch_claims (tick) WHERE finished_at IS NULL;
+
+-- Уведомления об изменении подписок для индекса времени рассылки в планировщике
+CREATE OR REPLACE FUNCTION notify_subscription_changed() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND (
+        TG_OP = 'DELETE' OR OLD.user_id <> NEW.user_id OR OLD.service_id <> NEW.service_id
+    ) THEN
+        PERFORM pg_notify('subscriptions_changed', json_build_object(
+            'op', 'delete',
+            'user_id', OLD.user_id,
+            'service_id', OLD.service_id
+        )::text);
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM pg_notify('subscriptions_changed', json_build_object(
+            'op', 'upsert',
+            'user_id', NEW.user_id,
+            'service_id', NEW.service_id,
+            'notification_time', to_char(NEW.notification_time, 'HH24:MI'),
+            'discount_threshold', NEW.discount_threshold
+        )::text);
+        RETURN NEW;
+    END IF;
+
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS subscriptions_changed ON subscriptions;
+CREATE TRIGGER subscriptions_changed
+    AFTER INSERT OR UPDATE OR DELETE ON subscriptions
+    FOR EACH ROW EXECUTE FUNCTION notify_subscription_changed();
@@ -0,0 +1,141 @@
+# bench_dispatch.py – Замер тика рассылки send_discount_notifications с поддельным Telegram Bot
+#
+# Запуск (из корня проекта):
+#   python -m benchmarks.bench_dispatch
+#   python -m benchmarks.bench_dispatch --users 1000 10000 --discounts 50 --latency 40
+#
+# База не используется: план рассылки подставляется синтетический (запросы к базе меряет bench_db),
+# а Bot только считает сообщения. Лимиты Telegram по умолчанию сняты, чтобы мерить накладные
+# расходы самого кода; --telegram-limits включает настоящие (тогда тик упирается в 30 сообщений/сек).
+import argparse
+import asyncio
+import logging
+import os
+
+from benchmarks.common import Report, measure_async, rng
+
+# scheduler создаёт Bot при импорте – нужен токен правильного формата
+os.environ.setdefault("BOT_TOKEN", "123456:bench")
+
+import scheduler  # noqa: E402
+from notification_dispatcher import NotificationDispatcher  # noqa: E402
+
+DEFAULT_USERS = (1_000, 10_000, 50_000)
+SERVICES = ((1, "Magnum"), (2, "Lamoda"))
+UNLIMITED_RATE = 1e9
+
+
+class FakeBot:
+    """Замена telegram.Bot: «отправляет» сообщения за latency секунд и считает их."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.messages = 0
+        self.characters = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.messages += 1
+        self.characters += len(text)
+
+
+class AllDueIndex:
+    """Индекс подписок, у которого в любую минуту есть рассылка для всех пользователей."""
+
+    def __init__(self, user_ids):
+        self._user_ids = user_ids
+
+    def due_user_ids(self, value):
+        return self._user_ids
+
+
+def synthetic_plan(users, discounts):
+    """
+    Строки в формате plan_notifications: у каждого пользователя одна подписка
+    с discounts непросмотренными скидками (каждый десятый – без новых скидок).
+    """
+    gen = rng(f"plan:{users}:{discounts}")
+    plan = []
+    discount_id = 0
+    for user_id in range(1, users + 1):
+        service_id, _ = SERVICES[user_id % len(SERVICES)]
+        row = {"user_id": user_id, "service_id": service_id}
+        if user_id % 10 == 0:
+            plan.append({**row, "discount_id": None, "product_name": None,
+                         "price_new": None, "price_old": None, "discount_percent": None})
+            continue
+        for _ in range(discounts):
+            discount_id += 1
+            old_price = gen.randrange(50_000, 15_000_000, 1000)
+            percent = gen.randrange(10, 80)
+            plan.append({
+                **row, "discount_id": discount_id, "product_name": f"Товар {discount_id}",
+                "price_new": old_price - old_price * percent // 100, "price_old": old_price,
+                "discount_percent": percent,
+            })
+    return plan
+
+
+async def bench_users(users, args, report):
+    plan = synthetic_plan(users, args.discounts)
+    marked = []
+
+    async def plan_notifications(pool, notification_time, user_ids=None):
+        return plan
+
+    async def mark_discounts_as_sent_bulk(pool, sent):
+        marked.append(len(sent))
+        return len(sent)
+
+    async def get_service_names(pool, service_ids=()):
+        return dict(SERVICES)
+
+    bot = FakeBot(args.latency / 1000)
+    if args.telegram_limits:
+        dispatcher = NotificationDispatcher(bot, concurrency=args.concurrency)
+    else:
+        dispatcher = NotificationDispatcher(
+            bot, concurrency=args.concurrency, global_rate=UNLIMITED_RATE, per_chat_rate=UNLIMITED_RATE
+        )
+
+    scheduler.bot = bot
+    scheduler.dispatcher = dispatcher
+    scheduler.subscription_index = AllDueIndex(list(range(1, users + 1)))
+    scheduler.plan_notifications = plan_notifications
+    scheduler.mark_discounts_as_sent_bulk = mark_discounts_as_sent_bulk
+    scheduler.get_service_names = get_service_names
+
+    median_ms, min_ms = await measure_async(lambda: scheduler.send_discount_notifications(None), args.repeat)
+    runs = args.repeat + 1
+    report.add(
+        f"{'send_discount_notifications':<28}{users:>9} польз.", median_ms, min_ms,
+        users=users, messages_per_tick=bot.messages // runs, marked_per_tick=sum(marked) // runs,
+    )
+
+
+async def run(args):
+    report = Report("dispatch")
+    for users in args.users:
+        await bench_users(users, args, report)
+    report.save(args.json)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк тика рассылки уведомлений")
+    parser.add_argument("--users", type=int, nargs="+", default=list(DEFAULT_USERS))
+    parser.add_argument("--discounts", type=int, default=20, help="Непросмотренных скидок на пользователя")
+    parser.add_argument("--latency", type=float, default=0.0, help="Задержка ответа Telegram, мс")
+    parser.add_argument("--concurrency", type=int, default=30)
+    parser.add_argument("--telegram-limits", action="store_true", help="Соблюдать лимиты Telegram")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="Сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    # Логи тика (по строке на каждый запуск) не должны попадать в замер
+    logging.disable(logging.INFO)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
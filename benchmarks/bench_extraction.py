@@ -0,0 +1,78 @@
+# bench_extraction.py – Сравнение скорости бэкендов извлечения карточек на сохранённых страницах
+#
+# Запуск (из корня проекта):
+#   python -m benchmarks.bench_extraction magnum                    # офлайн-страница из benchmarks/fixtures
+#   python -m benchmarks.bench_extraction magnum magnum_test_selenium.html
+#   python -m benchmarks.bench_extraction lamoda lamoda_page.html --repeat 50
+#
+# Страницы сохраняются скриптом test.py (magnum_test_selenium.html), вручную из driver.page_source
+# или парсером с HTTP_RECORD_DIR=...
+import argparse
+
+from benchmarks.common import measure
+from benchmarks.make_fixtures import load_fixture
+from service_parsers.extractors import BACKENDS, CardExtractor
+
+STORES = ("magnum", "lamoda")
+
+
+def load_spec(store):
+    """Спецификация карточек магазина (импорт парсеров тянет Selenium, поэтому лениво)."""
+    if store == "magnum":
+        from service_parsers.magnum_discount_parser import MAGNUM_CARD_SPEC
+        return MAGNUM_CARD_SPEC
+    from service_parsers.lamoda_discount_parser import LAMODA_CARD_SPEC
+    return LAMODA_CARD_SPEC
+
+
+def available_extractors(spec):
+    """Экстракторы для всех установленных бэкендов."""
+    extractors = {}
+    for name, backend_class in BACKENDS.items():
+        try:
+            extractors[name] = CardExtractor(spec, backend_class())
+        except ImportError:
+            print(f"⚠️ Бэкенд {name} не установлен – пропускаем")
+    return extractors
+
+
+def bench(extractor, pages, repeat):
+    """Медиана и минимум времени обработки всех страниц, в мс."""
+    return measure(lambda: [extractor.extract(html) for html in pages], repeat)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк извлечения карточек товаров")
+    parser.add_argument("store", choices=STORES)
+    parser.add_argument("pages", nargs="*", help="Сохранённые HTML-страницы (по умолчанию – benchmarks/fixtures)")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    pages = []
+    for path in args.pages:
+        with open(path, encoding="utf-8") as file:
+            pages.append(file.read())
+    if not pages:
+        pages.append(load_fixture(args.store))
+
+    spec = load_spec(args.store)
+    extractors = available_extractors(spec)
+
+    # Все бэкенды должны давать одинаковый результат
+    reference_name, reference = next(iter(extractors.items()))
+    expected = [reference.extract(html) for html in pages]
+    cards = sum(len(products) for products in expected)
+    for name, extractor in extractors.items():
+        if [extractor.extract(html) for html in pages] != expected:
+            print(f"❌ Результат {name} отличается от {reference_name}")
+
+    print(f"Страниц: {len(pages)}, карточек: {cards}, повторов: {args.repeat}")
+    print(f"{'бэкенд':<12}{'медиана, мс':>14}{'минимум, мс':>14}{'мкс/карточка':>16}")
+    for name, extractor in extractors.items():
+        median_ms, min_ms = bench(extractor, pages, args.repeat)
+        per_card = median_ms * 1000 / cards if cards else 0
+        print(f"{name:<12}{median_ms:>14.2f}{min_ms:>14.2f}{per_card:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+# bench_render.py – Загрузка страницы каталога в Chrome с профилями full и light на записанных страницах
+#
+# Запуск (из корня проекта; нужен Chrome и chromedriver по CHROMEDRIVER_PATH):
+#   python -m benchmarks.bench_render magnum                      # страница из benchmarks/fixtures + типичные ресурсы
+#   python -m benchmarks.bench_render lamoda --url "https://www.lamoda.kz/c/4153/default-women/?is_sale=1"
+#   python -m benchmarks.bench_render magnum --latency 80 --bandwidth 2000 --repeat 5 --json render.json
+#
+# --url берёт записанную страницу из кэша страниц (PAGE_CACHE_DIR, версия PAGE_CACHE_REPLAY_AT).
+# Страницу и всё, на что она ссылается, отдаёт локальный HTTP-сервер: абсолютные URL в разметке
+# переписываются на него, так что в сеть браузер не ходит. Кэш хранит только HTML, поэтому
+# картинки, шрифты, стили и скрипты – заглушки типичного размера; задержка и скорость сети имитируются.
+# Для каждого профиля выводится число извлечённых товаров: профиль light годится для магазина,
+# только если на его записанных страницах товаров столько же, сколько в full.
+import argparse
+import re
+import threading
+import time
+from collections import Counter
+from fnmatch import fnmatchcase
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.common import Report
+from benchmarks.make_fixtures import load_fixture
+from service_parsers import page_cache
+from service_parsers.driver_pool import RENDER_PROFILES, TRACKER_PATTERNS, DriverPool, render_page
+from service_parsers.lamoda_discount_parser import LAMODA_RENDER_ALLOW, lamoda_extractor
+from service_parsers.magnum_discount_parser import MAGNUM_RENDER_ALLOW, magnum_extractor
+
+# Карточка, которую ждёт парсер, список разрешённого магазина и извлечение товаров
+STORES = {
+    "magnum": ("product-block", MAGNUM_RENDER_ALLOW, magnum_extractor),
+    "lamoda": ("x-product-card__card", LAMODA_RENDER_ALLOW, lamoda_extractor),
+}
+
+# Тип заглушки по URL (браузер блокирует по типу ресурса, а серверу он известен только по пути)
+STUB_PATTERNS = {
+    "images": ("*.png*", "*.jpg*", "*.jpeg*", "*.gif*", "*.webp*", "*.avif*", "*.svg*", "*.ico*"),
+    "media": ("*.mp4*", "*.webm*", "*.m3u8*", "*.mp3*"),
+    "fonts": ("*.woff*", "*.ttf*", "*.otf*", "*.eot*"),
+    "styles": ("*.css*",),
+    "trackers": TRACKER_PATTERNS,
+}
+
+# Размер заглушки по типу ресурса, байт
+RESOURCE_SIZES = {
+    "images": 40_000,
+    "media": 300_000,
+    "fonts": 35_000,
+    "styles": 60_000,
+    "trackers": 45_000,
+    "scripts": 80_000,
+    "other": 2_000,
+}
+CONTENT_TYPES = {
+    "styles": "text/css",
+    "scripts": "application/javascript",
+    "trackers": "application/javascript",
+}
+
+# Ресурсы, которые добавляются к синтетической странице из benchmarks/fixtures
+_FIXTURE_HEAD = (
+    '<link rel="stylesheet" href="/static/app.css"><link rel="stylesheet" href="/static/catalog.css">'
+    '<link rel="preload" as="font" href="/static/fonts/main.woff2" crossorigin>'
+    '<link rel="preload" as="font" href="/static/fonts/bold.woff2" crossorigin>'
+    '<script src="/static/vendor.js"></script><script src="/static/app.js"></script>'
+    '<script async src="https://www.googletagmanager.com/gtm.js?id=GTM-BENCH"></script>'
+    '<script async src="https://mc.yandex.ru/metrika/tag.js"></script>'
+    '<script async src="https://connect.facebook.net/en_US/fbevents.js"></script>'
+    '<script async src="https://top-fwz1.mail.ru/js/code.js"></script>'
+)
+
+_ABSOLUTE_URL_RE = re.compile(r'(?:https?:)?//([a-z0-9-]+(?:\.[a-z0-9-]+)+)(?=[/"\'?)\s])', re.IGNORECASE)
+
+
+def resource_kind(url):
+    """Тип заглушки по URL – в терминах групп блокировки профиля."""
+    # Трекеры – раньше остальных групп: это скрипты и картинки чужих хостов
+    for kind in sorted(STUB_PATTERNS, key=lambda kind: kind != "trackers"):
+        if any(fnmatchcase(url, pattern) for pattern in STUB_PATTERNS[kind]):
+            return kind
+    return "scripts" if ".js" in url else "other"
+
+
+class RecordedSite:
+    """Локальный сервер записанной страницы: счётчики запросов и байт по типам ресурсов."""
+
+    def __init__(self, html, latency_ms, bandwidth_kbps):
+        self.latency = latency_ms / 1000
+        self.bytes_per_second = bandwidth_kbps * 1000 / 8 if bandwidth_kbps else 0
+        self.requests = Counter()
+        self.bytes = Counter()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.base = f"http://127.0.0.1:{self._server.server_address[1]}"
+        # Абсолютные ссылки ведут на локальный сервер: //host/path -> /__host__/host/path
+        self._page = _ABSOLUTE_URL_RE.sub(lambda m: f"{self.base}/__host__/{m.group(1)}", html).encode("utf-8")
+        self.page_url = f"{self.base}/catalog"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def _handler(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/catalog":
+                    kind, body, content_type = "document", site._page, "text/html; charset=utf-8"
+                else:
+                    kind = resource_kind(self.path.replace("/__host__/", "//", 1))
+                    padding = b"/*" + b" " * RESOURCE_SIZES[kind] + b"*/"
+                    body = padding if kind in CONTENT_TYPES else bytes(RESOURCE_SIZES[kind])
+                    content_type = CONTENT_TYPES.get(kind, "application/octet-stream")
+                site.transfer(kind, len(body))
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Cache-Control", "no-store")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def transfer(self, kind, size):
+        """Имитация сети: задержка ответа и время передачи тела."""
+        delay = self.latency + (size / self.bytes_per_second if self.bytes_per_second else 0)
+        if delay:
+            time.sleep(delay)
+        with self._lock:
+            self.requests[kind] += 1
+            self.bytes[kind] += size
+
+    def reset(self):
+        with self._lock:
+            self.requests.clear()
+            self.bytes.clear()
+
+    def close(self):
+        self._server.shutdown()
+
+
+def load_page(store, url):
+    """Записанная страница из кэша страниц или синтетическая страница с типичными ресурсами."""
+    if url:
+        html, _ = page_cache.load_page(url)
+        return html
+    return load_fixture(store).replace("</head>", _FIXTURE_HEAD + "</head>", 1)
+
+
+def bench(site, profile, store, repeat):
+    """Медиана и минимум загрузки в мс, запросов и КБ на страницу, товаров на странице."""
+    wait_class, allow, extractor = STORES[store]
+    pool = DriverPool(size=1, max_pages=0, max_memory_mb=0, profile=profile)
+    try:
+        html = render_page(site.page_url, wait_class, pool, allow=allow)  # Разогрев: запуск Chrome
+        products = len(extractor.extract(html))
+        timings, requests, transferred = [], [], []
+        for _ in range(repeat):
+            site.reset()
+            started = time.perf_counter()
+            render_page(site.page_url, wait_class, pool, allow=allow)
+            timings.append((time.perf_counter() - started) * 1000)
+            requests.append(sum(site.requests.values()))
+            transferred.append(sum(site.bytes.values()) / 1024)
+    finally:
+        pool.shutdown()
+    timings.sort()
+    return timings[len(timings) // 2], timings[0], max(requests), max(transferred), dict(site.requests), products
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк профилей загрузки страниц в Chrome")
+    parser.add_argument("store", choices=tuple(STORES))
+    parser.add_argument("--url", help="Записанная страница из PAGE_CACHE_DIR (по умолчанию – benchmarks/fixtures)")
+    parser.add_argument("--profiles", nargs="+", default=list(RENDER_PROFILES), choices=tuple(RENDER_PROFILES))
+    parser.add_argument("--latency", type=float, default=50.0, help="Задержка ответа сервера, мс")
+    parser.add_argument("--bandwidth", type=float, default=20_000, help="Скорость сети, кбит/с (0 – без ограничения)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="Сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    site = RecordedSite(load_page(args.store, args.url), args.latency, args.bandwidth)
+    # Загрузки бенчмарка не должны попадать в кэш страниц
+    page_cache.PAGE_CACHE_DIR = ""
+
+    report = Report("render")
+    products_by_profile = {}
+    try:
+        for name in args.profiles:
+            median_ms, min_ms, requests, kilobytes, kinds, products = bench(
+                site, RENDER_PROFILES[name], args.store, args.repeat
+            )
+            products_by_profile[name] = products
+            report.add(
+                f"{args.store}: {name}", median_ms, min_ms,
+                requests=requests, kilobytes=round(kilobytes, 1), products=products,
+            )
+            print(
+                f"    товаров {products}, запросов {requests}, {kilobytes:.0f} КБ: "
+                + ", ".join(f"{k} {v}" for k, v in sorted(kinds.items()))
+            )
+    finally:
+        site.close()
+    if len(set(products_by_profile.values())) > 1:
+        print(f"⚠️ Профили извлекают разное число товаров: {products_by_profile}")
+    report.save(args.json)
+
+
+if __name__ == "__main__":
+    main()
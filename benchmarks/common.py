@@ -0,0 +1,69 @@
+# common.py – Общие помощники бенчмарков: фиксированные seed, медианы, сохранение результатов
+import json
+import os
+import platform
+import random
+import statistics
+import time
+
+# Один seed на все бенчмарки – синтетические данные одинаковы от запуска к запуску
+BENCH_SEED = int(os.getenv("BENCH_SEED", "20240501"))
+
+
+def rng(salt=""):
+    """Детерминированный генератор случайных чисел для конкретного набора данных."""
+    return random.Random(f"{BENCH_SEED}:{salt}")
+
+
+def measure(func, repeat, warmup=1):
+    """Время выполнения func() в мс: медиана и минимум по repeat запускам (после разогрева)."""
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), min(timings)
+
+
+async def measure_async(make_coro, repeat, warmup=1, setup=None):
+    """
+    То же для корутин: make_coro() создаёт новую корутину на каждый запуск.
+    setup() (корутина или None) выполняется перед каждым запуском и не входит в замер.
+    """
+    timings = []
+    for run in range(warmup + repeat):
+        if setup is not None:
+            await setup()
+        started = time.perf_counter()
+        await make_coro()
+        if run >= warmup:
+            timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), min(timings)
+
+
+class Report:
+    """Таблица результатов: печатается по мере замеров и может быть сохранена в JSON для сравнения."""
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = []
+        print(f"{'замер':<44}{'медиана, мс':>14}{'минимум, мс':>14}")
+
+    def add(self, label, median_ms, min_ms, **extra):
+        self.rows.append({"label": label, "median_ms": round(median_ms, 3), "min_ms": round(min_ms, 3), **extra})
+        print(f"{label:<44}{median_ms:>14.2f}{min_ms:>14.2f}")
+
+    def save(self, path):
+        if not path:
+            return
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({
+                "benchmark": self.name,
+                "seed": BENCH_SEED,
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "results": self.rows,
+            }, file, ensure_ascii=False, indent=2)
+        print(f"💾 Результаты сохранены в {path}")
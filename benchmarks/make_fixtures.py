@@ -0,0 +1,125 @@
+# make_fixtures.py – Офлайн-страницы каталогов Magnum и Lamoda для бенчмарков
+#
+# Запуск (из корня проекта):
+#   python -m benchmarks.make_fixtures            # перезаписать benchmarks/fixtures/*.html
+#   python -m benchmarks.make_fixtures --cards 500
+#
+# Разметка повторяет карточки, которые читают MAGNUM_CARD_SPEC и LAMODA_CARD_SPEC.
+# Настоящие страницы можно записать парсером с HTTP_RECORD_DIR=... и передать в бенчмарк напрямую.
+import argparse
+import os
+
+from benchmarks.common import rng
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+DEFAULT_CARDS = 120
+
+_WORDS = (
+    "Молоко", "Сыр", "Кефир", "Хлеб", "Кофе", "Чай", "Шоколад", "Сок", "Йогурт", "Масло",
+    "Печенье", "Рис", "Гречка", "Макароны", "Колбаса", "Вода", "Мёд", "Орехи",
+)
+_BRANDS = ("Adidas", "Nike", "Puma", "Mango", "Zarina", "Befree", "Tommy Hilfiger", "Calvin Klein", "Lacoste")
+_CLOTHES = ("Футболка", "Кроссовки", "Джинсы", "Платье", "Куртка", "Худи", "Рубашка", "Брюки", "Шорты")
+_SIZES = ("XS", "S", "M", "L", "XL", "XXL")
+
+
+def _price(value):
+    return f"{value:,}".replace(",", " ") + " ₸"
+
+
+def _prices(gen):
+    old_price = gen.randrange(500, 150000, 10)
+    percent = gen.choice((5, 10, 15, 20, 25, 30, 40, 50, 60, 70))
+    return old_price - old_price * percent // 100, old_price, percent
+
+
+def magnum_page(cards=DEFAULT_CARDS, salt="magnum"):
+    """HTML страницы скидок Magnum с cards карточками."""
+    gen = rng(salt)
+    blocks = []
+    for index in range(cards):
+        price, old_price, percent = _prices(gen)
+        name = f"{gen.choice(_WORDS)} {gen.choice(_WORDS).lower()} №{index}"
+        weight = f"{gen.choice((200, 450, 900, 1000))} г"
+        old = f'<div class="product-block__old-price">{_price(old_price)}</div>' if gen.random() < 0.9 else ""
+        blocks.append(
+            '<div class="product-block">'
+            f'<a href="/product/{index}"><img src="/img/{index}.webp" alt=""></a>'
+            f'<div class="product-block__stock">-{percent}%</div>'
+            f'<p class="product-block__descr">{name}</p><p class="product-block__descr">{weight}</p>'
+            f'<div class="product-block__prices"><div class="product-block__price">{_price(price)}</div>{old}</div>'
+            '<button class="product-block__button">В корзину</button>'
+            '</div>'
+        )
+    return (
+        '<!DOCTYPE html><html lang="ru"><head><meta charset="utf-8"><title>Скидки Magnum</title></head>'
+        '<body><header class="header">Magnum</header><main><div class="catalog">'
+        + "\n".join(blocks)
+        + '</div><nav class="pagination"><a href="?page=1">1</a><a href="?page=2">2</a></nav></main></body></html>'
+    )
+
+
+def lamoda_page(cards=DEFAULT_CARDS, salt="lamoda"):
+    """HTML страницы каталога Lamoda с cards карточками."""
+    gen = rng(salt)
+    blocks = []
+    for index in range(cards):
+        price, old_price, percent = _prices(gen)
+        sizes = "".join(
+            f'<span class="x-product-card-sizes__size">{size}</span>'
+            for size in gen.sample(_SIZES, gen.randint(0, len(_SIZES)))
+        )
+        rating = f'<span class="_rating_1xcfv_13">{gen.uniform(3, 5):.1f}</span>' if gen.random() < 0.6 else ""
+        blocks.append(
+            '<div class="x-product-card__card">'
+            f'<a class="x-product-card__link" href="/p/MP{index:06d}/"><img src="/img/{index}.jpg" alt=""></a>'
+            f'<div class="_badge_1yjde_1"><div class="_badgeContent_1yjde_7"><span>−{percent}%</span></div></div>'
+            '<div class="x-product-card-description">'
+            f'<div class="x-product-card-description__price-old">{_price(old_price)}</div>'
+            f'<div class="x-product-card-description__price-new">{_price(price)}</div>'
+            f'<div class="x-product-card-description__brand-name">{gen.choice(_BRANDS)}</div>'
+            f'<div class="x-product-card-description__product-name">{gen.choice(_CLOTHES)} MP{index:06d}</div>'
+            f'{rating}</div><div class="x-product-card-sizes">{sizes}</div>'
+            '</div>'
+        )
+    return (
+        '<!DOCTYPE html><html lang="ru"><head><meta charset="utf-8"><title>Lamoda – outlet</title></head>'
+        '<body><div class="grid__catalog">'
+        + "\n".join(blocks)
+        + '</div><div class="paginator"><a href="?page=2">2</a><a href="?page=3">3</a></div></body></html>'
+    )
+
+
+PAGES = {"magnum": magnum_page, "lamoda": lamoda_page}
+
+
+def fixture_path(store):
+    return os.path.join(FIXTURES_DIR, f"{store}.html")
+
+
+def load_fixture(store):
+    """Сохранённая страница магазина (создаётся, если её ещё нет)."""
+    path = fixture_path(store)
+    if not os.path.exists(path):
+        write_fixture(store)
+    with open(path, encoding="utf-8") as file:
+        return file.read()
+
+
+def write_fixture(store, cards=DEFAULT_CARDS):
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    with open(fixture_path(store), "w", encoding="utf-8") as file:
+        file.write(PAGES[store](cards))
+    return fixture_path(store)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Генерация офлайн-страниц для бенчмарков")
+    parser.add_argument("--cards", type=int, default=DEFAULT_CARDS)
+    args = parser.parse_args()
+    for store in PAGES:
+        print(f"📄 {write_fixture(store, args.cards)}")
+
+
+if __name__ == "__main__":
+    main()
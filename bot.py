@@ -4,17 +4,21 @@ from telegram import (
     Update, ReplyKeyboardMarkup, KeyboardButton,
     InlineKeyboardButton, InlineKeyboardMarkup
 )
+from telegram.error import BadRequest
 from telegram.ext import (
     Application, CallbackQueryHandler,
     CommandHandler, ContextTypes, MessageHandler, filters
 )
 from dotenv import load_dotenv
-from service_parsers.magnum_discount_parser import parse_magnum_discounts
-from service_parsers.lamoda_discount_parser import parse_lamoda_discounts, LAMODA_URLS
-from scripts.filter_discounts import filter_discounts_by_threshold
 
-# Загрузка переменных окружения из .env
+# Загрузка переменных окружения из .env (до импорта db, который читает настройки БД)
 load_dotenv()
+
+from db import connect_db, connect_listener
+from discount_cache import create_db_discount_cache, listen_discount_changes
+from discount_documents import DOCUMENT_FILENAME, STANDARD_THRESHOLDS, DiscountDocuments
+from metrics import BOT_METRICS_PORT, instrument_handler, start_metrics_server
+
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 
 # Логирование
@@ -24,12 +28,10 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# URL страницы со скидками для Magnum
-MAGNUM_URL = "https://magnum.kz/catalog?discountType=all&city=almaty"
-
 
 # ======= 📌 ФУНКЦИИ КНОПОК ======== #
 
+@instrument_handler
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Приветственное сообщение с кнопками."""
     keyboard = [
@@ -45,6 +47,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     )
 
 
+@instrument_handler
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Выводит справочную информацию."""
     await update.message.reply_text(
@@ -55,6 +58,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     )
 
 
+@instrument_handler
 async def info(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Информация о боте."""
     await update.message.reply_text(
@@ -64,6 +68,7 @@ async def info(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     )
 
 
+@instrument_handler
 async def show_store_selection(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Выбор магазина (Magnum или Lamoda)."""
     keyboard = [
@@ -76,6 +81,7 @@ async def show_store_selection(update: Update, context: ContextTypes.DEFAULT_TYP
     await update.message.reply_text("🛒 Выберите магазин для поиска скидок:", reply_markup=reply_markup)
 
 
+@instrument_handler
 async def handle_store_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обрабатывает выбор магазина."""
     query = update.callback_query
@@ -103,6 +109,7 @@ async def show_lamoda_category_selection(message) -> None:
     await message.reply_text("👚 Выберите категорию товаров для Lamoda:", reply_markup=reply_markup)
 
 
+@instrument_handler
 async def handle_lamoda_category(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обрабатывает выбор категории Lamoda."""
     query = update.callback_query
@@ -117,10 +124,8 @@ async def show_discount_buttons(message) -> None:
     """Показывает кнопки для выбора порога скидки."""
     keyboard = [
         [
-            InlineKeyboardButton("10%", callback_data="discount_10"),
-            InlineKeyboardButton("20%", callback_data="discount_20"),
-            InlineKeyboardButton("30%", callback_data="discount_30"),
-            InlineKeyboardButton("50%", callback_data="discount_50"),
+            InlineKeyboardButton(f"{threshold}%", callback_data=f"discount_{threshold}")
+            for threshold in STANDARD_THRESHOLDS
         ],
         [InlineKeyboardButton("✍ Ввести вручную", callback_data="custom_discount")]
     ]
@@ -132,6 +137,7 @@ async def show_discount_buttons(message) -> None:
     )
 
 
+@instrument_handler
 async def handle_discount_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обрабатывает выбор скидки через кнопки."""
     query = update.callback_query
@@ -146,6 +152,7 @@ async def handle_discount_callback(update: Update, context: ContextTypes.DEFAULT
         await query.message.reply_text("✍ Введите минимальный процент скидки (например, 25):")
 
 
+@instrument_handler
 async def handle_manual_threshold(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обрабатывает вручную введённый порог скидки."""
     try:
@@ -159,15 +166,11 @@ async def send_filtered_discounts(update: Update, context: ContextTypes.DEFAULT_
     """Отправляет пользователю отфильтрованные скидки из выбранного магазина."""
     try:
         store = context.user_data.get("store")
-        discount_data = []
-
-        if store == "magnum":
-            discount_data = parse_magnum_discounts(MAGNUM_URL)
+        category = context.user_data.get("lamoda_category") if store == "lamoda" else None
 
-        elif store == "lamoda":
-            category = context.user_data.get("lamoda_category")
-            url = LAMODA_URLS.get(category)
-            discount_data = parse_lamoda_discounts(url)
+        # Скидки берём из снимка (обновляется планировщиком), а не парсим на лету
+        discount_cache = context.application.bot_data["discount_cache"]
+        discount_data = await discount_cache.get(store, category) if store else []
 
         if not discount_data:
             await update.effective_message.reply_text(
@@ -175,39 +178,29 @@ async def send_filtered_discounts(update: Update, context: ContextTypes.DEFAULT_
             )
             return
 
-        filtered_discounts = []
-        for item in discount_data:
-            try:
-                discount_value = int(item["discount"].replace("−", "").replace("%", "").strip())
-                if discount_value >= threshold:
-                    filtered_discounts.append(item)
-            except Exception as e:
-                logger.warning(f"Некорректная запись для скидки товара: {item['name']}, ошибка: {e}")
+        # Документ собран при загрузке снимка – здесь только отправка готовых байтов
+        documents = context.application.bot_data["discount_documents"]
+        document = documents.get(store, category, threshold)
 
-        if not filtered_discounts:
+        if document is None:
             await update.effective_message.reply_text(
                 f"📭 Нет скидок от {threshold}% и выше. Попробуйте позже."
             )
             return
 
-        file_path = "filtered_discounts.txt"
-        with open(file_path, "w", encoding="utf-8") as file:
-            for item in filtered_discounts:
-                file.write(
-                    f"🛍️ Бренд: {item['brand']}\n"
-                    f"📌 Название: {item['name']}\n"
-                    f"💰 Цена: {item['price']}\n"
-                    f"💸 Старая цена: {item['old_price']}\n"
-                    f"📉 Скидка: {item['discount']}\n"
-                    f"⭐ Рейтинг: {item['rating']}\n"
-                    f"📏 Размеры: {item['sizes']}\n"
-                    "---------------------------\n"
-                )
-
-        with open(file_path, "rb") as file:
-            await update.effective_message.reply_document(document=file)
-
-        os.remove(file_path)
+        # Уже загруженный документ отправляем по file_id, без повторной загрузки
+        file_id = documents.file_id(document)
+        if file_id is not None:
+            try:
+                await update.effective_message.reply_document(document=file_id)
+                return
+            except BadRequest as e:
+                logger.warning(f"file_id документа недействителен, загружаем заново: {e}")
+
+        message = await update.effective_message.reply_document(
+            document=document.content, filename=DOCUMENT_FILENAME
+        )
+        documents.remember_file_id(document, message.document.file_id)
 
     except Exception as e:
         logger.error(f"Ошибка при обработке скидок: {e}")
@@ -216,9 +209,43 @@ async def send_filtered_discounts(update: Update, context: ContextTypes.DEFAULT_
 
 # ======= 🚀 ОСНОВНОЙ ФУНКЦИОНАЛ БОТА ======== #
 
+async def post_init(application: Application) -> None:
+    """Подключение к базе, создание кэша скидок и готовых документов при старте бота."""
+    start_metrics_server(BOT_METRICS_PORT)
+    pool = await connect_db()
+    application.bot_data["pool"] = pool
+
+    # Документы пересобираются при каждой загрузке снимка
+    documents = DiscountDocuments()
+    discount_cache = create_db_discount_cache(pool, on_update=documents.rebuild)
+    application.bot_data["discount_documents"] = documents
+    application.bot_data["discount_cache"] = discount_cache
+
+    # Снимок обновляется сразу после парсинга (уведомление от планировщика)
+    listener_conn = await connect_listener()
+    await listen_discount_changes(listener_conn, discount_cache)
+    application.bot_data["listener_conn"] = listener_conn
+
+
+async def post_shutdown(application: Application) -> None:
+    """Закрытие соединений с базой при остановке бота."""
+    listener_conn = application.bot_data.get("listener_conn")
+    if listener_conn is not None:
+        await listener_conn.close()
+    pool = application.bot_data.get("pool")
+    if pool is not None:
+        await pool.close()
+
+
 def main() -> None:
     """Главная функция для запуска бота."""
-    application = Application.builder().token(BOT_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
 
     # Обработчики сообщений и кнопок
     application.add_handler(CommandHandler("start", start))
@@ -0,0 +1,84 @@
+# change_detection.py – Сравнение результата парсинга с базой: что нового, что изменилось, что пропало
+import hashlib
+import os
+
+from service_parsers.records import product_key
+
+# Поля товара, входящие в отпечаток содержимого (категория не входит: один товар бывает в нескольких)
+FINGERPRINT_FIELDS = (
+    "name", "brand", "price_minor", "old_price_minor", "discount_percent", "rating", "sizes"
+)
+
+# Не отключать пропавшие товары, если в пакете меньше этой доли активных товаров.
+# Основная защита – флаг complete (все страницы загружены); порог ловит то, чего обход
+# не заметил сам: страницу, которая загрузилась, но пришла пустой или урезанной
+DEACTIVATE_MIN_RATIO = float(os.getenv("DEACTIVATE_MIN_RATIO", "0.9"))
+
+
+def product_fingerprint(record):
+    """MD5 содержимого товара (ProductRecord) – меняется только при изменении значимых полей."""
+    parts = []
+    for field in FINGERPRINT_FIELDS:
+        value = getattr(record, field)
+        parts.append("" if value is None else str(value))
+    return hashlib.md5("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class ProductDiff:
+    """Результат сравнения пакета товаров с базой."""
+
+    __slots__ = ("changed", "unchanged", "joined_ids", "left_ids", "disappeared_ids")
+
+    def __init__(self):
+        self.changed = []          # (ProductRecord, отпечаток) – новые и изменившиеся
+        self.unchanged = 0         # Сколько товаров не изменилось
+        self.joined_ids = []       # discount_id неизменившихся товаров, впервые встреченных в категории
+        self.left_ids = []         # discount_id товаров, которые ушли из категории
+        self.disappeared_ids = []  # discount_id активных товаров, которых больше нет ни в одной категории
+
+
+def diff_products(products, existing, category=None, complete=True):
+    """
+    Сравнивает товары из парсинга с текущими строками parsed_discounts.
+
+    :param products: ProductBatch из парсера
+    :param existing: строки (discount_id, brand, product_name, content_hash, is_active, categories)
+                     того же сервиса; categories – категории, в которых товар сейчас есть.
+                     Без категории (category=None) участником прохода считается любой активный товар.
+    :param complete: обход загрузил все страницы каталога; иначе пропавшие и ушедшие
+                     из категории товары не ищутся – они могли быть на незагруженной странице
+    """
+    current = {product_key(row['brand'], row['product_name']): row for row in existing}
+    diff = ProductDiff()
+    seen = set()
+
+    for index, name in enumerate(products.names):
+        key = product_key(products.brands[index], name)
+        if key in seen:
+            continue
+        seen.add(key)
+
+        product = products[index]
+        fingerprint = product_fingerprint(product)
+        row = current.get(key)
+        if row is not None and row['is_active'] and row['content_hash'] == fingerprint:
+            diff.unchanged += 1
+            if category is not None and category not in row['categories']:
+                diff.joined_ids.append(row['discount_id'])
+        else:
+            diff.changed.append((product, fingerprint))
+
+    members = [
+        row for row in existing
+        if row['is_active'] and (category is None or category in row['categories'])
+    ]
+    if complete and members and len(seen) >= len(members) * DEACTIVATE_MIN_RATIO:
+        for row in members:
+            if product_key(row['brand'], row['product_name']) in seen:
+                continue
+            if category is not None:
+                diff.left_ids.append(row['discount_id'])
+            # Товар остаётся активным, пока он есть хотя бы в одной другой категории
+            if category is None or not set(row['categories']) - {category}:
+                diff.disappeared_ids.append(row['discount_id'])
+    return diff
@@ -1,8 +1,21 @@
 # db.py – Работа с базой данных PostgreSQL
+import asyncio
 import logging
 import asyncpg
+import json
 import os
+import re
+import time
+from contextlib import asynccontextmanager
 from datetime import datetime
+from change_detection import diff_products
+from metrics import (
+    DB_POOL_ACQUIRE_TIMEOUTS,
+    DB_POOL_CONNECTIONS,
+    DB_POOL_WAIT_SECONDS,
+    DB_QUERY_SECONDS,
+    DB_ROWS
+)
 
 # Данные для подключения к PostgreSQL
 DB_USER = os.getenv("DB_USER")
@@ -11,11 +24,55 @@ DB_HOST = os.getenv("DB_HOST")
 DB_PORT = os.getenv("DB_PORT")
 DB_NAME = os.getenv("DB_NAME")
 
+# Пул соединений (можно переопределить через .env)
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))                       # Соединений держать открытыми
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))                      # Максимум соединений
+DB_POOL_ACQUIRE_TIMEOUT = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", "30"))      # Ожидание свободного соединения, сек
+DB_POOL_MAX_INACTIVE_LIFETIME = float(os.getenv("DB_POOL_MAX_INACTIVE_LIFETIME", "300"))  # Закрыть простаивающее, сек
+# Подготовленных запросов на соединение: каждый запрос разбирается сервером один раз на соединение
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "256"))
+
+# Хранение данных (можно переопределить через .env)
+SENT_RETENTION_MONTHS = int(os.getenv("SENT_RETENTION_MONTHS", "6"))      # Секции sent_discounts старше N месяцев удаляются
+SENT_PARTITIONS_AHEAD = int(os.getenv("SENT_PARTITIONS_AHEAD", "2"))      # Секции создаются на N месяцев вперёд
+DISCOUNT_RETENTION_DAYS = int(os.getenv("DISCOUNT_RETENTION_DAYS", "30")) # Пропавшие товары удаляются через N дней
+PURGE_BATCH_SIZE = 10000                                                  # Строк за один DELETE
+# Отметки об отправке пишутся под advisory-блокировкой ведра пользователей user_id % N
+SENT_LOCK_BUCKETS = 64
+SENT_LOCK_NAMESPACE = 1818                                                # Первый ключ pg_advisory_xact_lock
+
+# Очередь парсинга (можно переопределить через .env)
+SCRAPE_MAX_ATTEMPTS = int(os.getenv("SCRAPE_MAX_ATTEMPTS", "3"))                   # Попыток на страницу
+SCRAPE_CRAWL_TIMEOUT_MINUTES = int(os.getenv("SCRAPE_CRAWL_TIMEOUT_MINUTES", "360")) # Незавершённый обход считается брошенным
+SCRAPE_RETENTION_DAYS = int(os.getenv("SCRAPE_RETENTION_DAYS", "7"))               # Завершённые обходы удаляются через N дней
+DISPATCH_CLAIM_RETENTION_DAYS = 2                                                  # Записи о ведрах рассылки хранятся N дней
+
+# Канал LISTEN/NOTIFY: скидки сервиса обновлены парсингом (слушает бот)
+DISCOUNTS_CHANNEL = "discounts_changed"
+
 
 logger = logging.getLogger(__name__)
 # Функция подключения к базе данных
 async def connect_db():
-    return await asyncpg.create_pool(
+    """Пул соединений в обёртке Repository (реестр сервисов, метрики пула)."""
+    pool = await asyncpg.create_pool(
+        user=DB_USER,
+        password=DB_PASSWORD,
+        database=DB_NAME,
+        host=DB_HOST,
+        port=DB_PORT,
+        min_size=min(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE),
+        max_size=DB_POOL_MAX_SIZE,
+        max_inactive_connection_lifetime=DB_POOL_MAX_INACTIVE_LIFETIME,
+        statement_cache_size=DB_STATEMENT_CACHE_SIZE
+    )
+    repository = Repository(pool)
+    await repository.load_services()
+    return repository
+
+# Отдельное соединение для LISTEN (соединения пула сбрасываются при возврате)
+async def connect_listener():
+    return await asyncpg.connect(
         user=DB_USER,
         password=DB_PASSWORD,
         database=DB_NAME,
@@ -23,10 +80,71 @@ async def connect_db():
         port=DB_PORT
     )
 
+# Соединение из пула с замером ожидания и длительности операции
+@asynccontextmanager
+async def acquire(pool, query):
+    started = time.perf_counter()
+    async with pool.acquire() as conn:
+        DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - started)
+        with DB_QUERY_SECONDS.time(query=query):
+            yield conn
+
+# ======= 🗄️ Репозиторий: пул и реестр сервисов ======= #
+class Repository:
+    """
+    Обёртка над пулом asyncpg: функции модуля принимают её вместо пула
+    (acquire() / close() – как у пула). Держит реестр service_name -> service_id,
+    заполняемый при старте и при добавлении сервисов, поэтому имя сервиса
+    не разрешается запросом к базе при каждой записи.
+    """
+
+    def __init__(self, pool, acquire_timeout=DB_POOL_ACQUIRE_TIMEOUT):
+        self.pool = pool
+        self.acquire_timeout = acquire_timeout
+        self.services = {}  # service_name -> service_id
+        DB_POOL_CONNECTIONS.set_function(pool.get_size, state="open")
+        DB_POOL_CONNECTIONS.set_function(pool.get_idle_size, state="idle")
+
+    @asynccontextmanager
+    async def acquire(self, timeout=None):
+        try:
+            conn = await self.pool.acquire(timeout=timeout or self.acquire_timeout)
+        except asyncio.TimeoutError:
+            DB_POOL_ACQUIRE_TIMEOUTS.inc()
+            raise
+        try:
+            yield conn
+        finally:
+            await self.pool.release(conn)
+
+    async def close(self):
+        await self.pool.close()
+
+    # ======= Реестр сервисов ======= #
+    async def load_services(self):
+        async with acquire(self, "load_services") as conn:
+            rows = await conn.fetch("SELECT service_id, service_name FROM services;")
+        self.services = {row['service_name']: row['service_id'] for row in rows}
+        return self.services
+
+    def service_names(self):
+        """Словарь service_id -> service_name из реестра."""
+        return {service_id: service_name for service_name, service_id in self.services.items()}
+
+async def resolve_service_id(pool, conn, service_name):
+    """ID сервиса (с созданием): из реестра репозитория или одним запросом на conn."""
+    registry = pool.services if isinstance(pool, Repository) else None
+    if registry is not None and service_name in registry:
+        return registry[service_name]
+    service_id = await ensure_service_id(conn, service_name)
+    if registry is not None:
+        registry[service_name] = service_id
+    return service_id
+
 # ======= Функции для работы с пользователями ======= #
 async def add_user(pool, user_id):
     """Добавить пользователя в базу данных, если его нет."""
-    async with pool.acquire() as conn:
+    async with acquire(pool, "add_user") as conn:
         await conn.execute("""
             INSERT INTO users (user_id)
             VALUES ($1)
@@ -35,7 +153,7 @@ async def add_user(pool, user_id):
 
 async def get_user(pool, user_id):
     """Получить информацию о пользователе."""
-    async with pool.acquire() as conn:
+    async with acquire(pool, "get_user") as conn:
         return await conn.fetchrow("""
             SELECT * FROM users WHERE user_id = $1;
         """, user_id)
@@ -43,7 +161,9 @@ async def get_user(pool, user_id):
 # ======= Функции для работы с сервисами ======= #
 async def get_service_id(pool, service_name):
     """Получить ID сервиса по имени."""
-    async with pool.acquire() as conn:
+    if isinstance(pool, Repository) and service_name in pool.services:
+        return pool.services[service_name]
+    async with acquire(pool, "get_service_id") as conn:
         record = await conn.fetchrow("""
             SELECT service_id FROM services WHERE service_name = $1;
         """, service_name)
@@ -51,22 +171,33 @@ async def get_service_id(pool, service_name):
 
 async def add_service(pool, service_name):
     """Добавить сервис, если его нет."""
-    async with pool.acquire() as conn:
+    async with acquire(pool, "add_service") as conn:
         await conn.execute("""
             INSERT INTO services (service_name)
             VALUES ($1)
             ON CONFLICT (service_name) DO NOTHING;
         """, service_name)
 
+async def ensure_service_id(conn, service_name):
+    """Получить ID сервиса, создав сервис при необходимости (один запрос)."""
+    return await conn.fetchval("""
+        WITH inserted AS (
+            INSERT INTO services (service_name)
+            VALUES ($1)
+            ON CONFLICT (service_name) DO NOTHING
+            RETURNING service_id
+        )
+        SELECT service_id FROM inserted
+        UNION ALL
+        SELECT service_id FROM services WHERE service_name = $1
+        LIMIT 1;
+    """, service_name)
+
 # ======= Функции для работы с подписками ======= #
 async def add_subscription(pool, user_id, service_name, discount_threshold, notification_time):
-    """Добавить или обновить подписку пользователя."""
-    service_id = await get_service_id(pool, service_name)
-    if service_id is None:
-        await add_service(pool, service_name)
-        service_id = await get_service_id(pool, service_name)
-
-    async with pool.acquire() as conn:
+    """Добавить или обновить подписку пользователя (сервис берётся из реестра репозитория)."""
+    async with acquire(pool, "add_subscription") as conn:
+        service_id = await resolve_service_id(pool, conn, service_name)
         await conn.execute("""
             INSERT INTO subscriptions (user_id, service_id, discount_threshold, notification_time)
             VALUES ($1, $2, $3, $4)
@@ -75,62 +206,758 @@ async def add_subscription(pool, user_id, service_name, discount_threshold, noti
         """, user_id, service_id, discount_threshold, notification_time)
 
 async def get_subscriptions_for_notifications(pool, current_time):
-    """Получить подписки, для которых нужно отправить уведомления в заданное время."""
-    async with pool.acquire() as conn:
+    """
+    Получить подписки, для которых нужно отправить уведомления в заданное время.
+    Имя сервиса – по service_id из get_service_names (реестр репозитория), без JOIN.
+    """
+    async with acquire(pool, "get_subscriptions_for_notifications") as conn:
         return await conn.fetch("""
-            SELECT s.user_id, s.service_id, s.discount_threshold, s.notification_time, sv.service_name
-            FROM subscriptions s
-            JOIN services sv ON s.service_id = sv.service_id
-            WHERE s.notification_time = $1;
+            SELECT user_id, service_id, discount_threshold, notification_time
+            FROM subscriptions
+            WHERE notification_time = $1;
         """, current_time)
 
+async def get_all_subscriptions(pool):
+    """Получить все подписки (для построения индекса времени рассылки)."""
+    async with acquire(pool, "get_all_subscriptions") as conn:
+        return await conn.fetch("""
+            SELECT user_id, service_id, discount_threshold, notification_time
+            FROM subscriptions;
+        """)
+
 # ======= Функции для работы со скидками ======= #
-async def update_parsed_discounts(pool, service_name, discounts):
-    """Обновить базу данных новыми скидками после парсинга."""
+# Колонки промежуточной таблицы для пакетной загрузки скидок
+STAGING_COLUMNS = (
+    "product_name", "brand", "price_new", "price_old", "discount_percent", "rating", "sizes", "content_hash",
+)
+
+async def update_parsed_discounts(pool, service_name, discounts, category=None, complete=True):
+    """
+    Обновить базу данных новыми скидками после парсинга.
+    discounts – ProductBatch из парсера (цены в тиынах, скидка в процентах).
+    Пакет сравнивается с базой по отпечатку содержимого: записываются только
+    новые и изменившиеся товары (COPY во временную таблицу и одно слияние),
+    пропавшие с сайта товары помечаются неактивными. Всё – в одной транзакции.
+
+    Товар – одна строка на (бренд, название); категория прохода записывается
+    в parsed_discount_categories. Товар, который есть в нескольких категориях,
+    не переписывается каждым проходом и отключается, только когда пропал из всех.
+    complete=False – обход загрузил не все страницы (CrawlIncomplete): товары
+    записываются, но ничего не отключается и не убирается из категории.
+
+    :return: словарь со счётчиками inserted / updated / unchanged / deactivated
+             и changed_ids – discount_id новых и изменившихся товаров (дельта для рассылки)
+    """
+    delta = {"inserted": 0, "updated": 0, "unchanged": 0, "deactivated": 0, "changed_ids": []}
+    if not discounts:
+        return delta
+
+    async with acquire(pool, "update_parsed_discounts") as conn:
+        # Вне транзакции: новый сервис попадает в реестр, только если он действительно создан
+        service_id = await resolve_service_id(pool, conn, service_name)
+        async with conn.transaction():
+            existing = await conn.fetch("""
+                SELECT pd.discount_id, pd.brand, pd.product_name, pd.content_hash, pd.is_active,
+                       ARRAY(
+                           SELECT c.category FROM parsed_discount_categories c
+                           WHERE c.discount_id = pd.discount_id
+                       ) AS categories
+                FROM parsed_discounts pd
+                WHERE pd.service_id = $1;
+            """, service_id)
+            diff = diff_products(discounts, existing, category, complete)
+            delta["unchanged"] = diff.unchanged
+
+            if diff.changed:
+                await conn.execute("""
+                    CREATE TEMP TABLE parsed_discounts_staging (
+                        product_name VARCHAR(255),
+                        brand VARCHAR(255),
+                        price_new BIGINT,
+                        price_old BIGINT,
+                        discount_percent INT,
+                        rating VARCHAR(50),
+                        sizes TEXT,
+                        content_hash CHAR(32)
+                    ) ON COMMIT DROP;
+                """)
+                await conn.copy_records_to_table(
+                    "parsed_discounts_staging",
+                    records=[
+                        (
+                            record.name, record.brand,
+                            record.price_minor, record.old_price_minor, record.discount_percent,
+                            record.rating, record.sizes, fingerprint,
+                        )
+                        for record, fingerprint in diff.changed
+                    ],
+                    columns=STAGING_COLUMNS,
+                )
+
+                changed = await conn.fetch("""
+                    INSERT INTO parsed_discounts (
+                        service_id, product_name, brand, price_new, price_old,
+                        discount_percent, rating, sizes, content_hash, is_active, deactivated_at
+                    )
+                    SELECT $1, product_name, brand, price_new, price_old,
+                           discount_percent, rating, sizes, content_hash, TRUE, NULL
+                    FROM parsed_discounts_staging
+                    ON CONFLICT (service_id, (COALESCE(brand, '')), product_name)
+                    DO UPDATE SET
+                        brand = EXCLUDED.brand,
+                        price_new = EXCLUDED.price_new,
+                        price_old = EXCLUDED.price_old,
+                        discount_percent = EXCLUDED.discount_percent,
+                        rating = EXCLUDED.rating,
+                        sizes = EXCLUDED.sizes,
+                        content_hash = EXCLUDED.content_hash,
+                        is_active = TRUE,
+                        deactivated_at = NULL,
+                        parsed_at = NOW()
+                    RETURNING discount_id, (xmax = 0) AS inserted;
+                """, service_id)
+                delta["changed_ids"] = [row['discount_id'] for row in changed]
+                delta["inserted"] = sum(1 for row in changed if row['inserted'])
+                delta["updated"] = len(changed) - delta["inserted"]
+
+            if category is not None and (delta["changed_ids"] or diff.joined_ids):
+                await conn.execute("""
+                    INSERT INTO parsed_discount_categories (discount_id, category)
+                    SELECT unnest($1::INT[]), $2
+                    ON CONFLICT DO NOTHING;
+                """, delta["changed_ids"] + diff.joined_ids, category)
+
+            if diff.left_ids:
+                await conn.execute("""
+                    DELETE FROM parsed_discount_categories
+                    WHERE discount_id = ANY($1::INT[]) AND category = $2;
+                """, diff.left_ids, category)
+
+            if diff.disappeared_ids:
+                await conn.execute("""
+                    UPDATE parsed_discounts
+                    SET is_active = FALSE, deactivated_at = NOW()
+                    WHERE discount_id = ANY($1::INT[]);
+                """, diff.disappeared_ids)
+                delta["deactivated"] = len(diff.disappeared_ids)
+
+            # Бот перечитывает снимки сервиса и пересобирает документы сразу после фиксации транзакции
+            if diff.changed or diff.joined_ids or diff.left_ids or diff.disappeared_ids:
+                await conn.execute(
+                    "SELECT pg_notify($1, $2);",
+                    DISCOUNTS_CHANNEL, json.dumps({"service": service_name, "category": category})
+                )
+
+    for op in ("inserted", "updated", "unchanged", "deactivated"):
+        DB_ROWS.inc(delta[op], service=service_name, op=op)
+    return delta
+
+async def get_parsed_discounts(pool, service_name, category=None):
+    """
+    Получить последние спарсенные скидки сервиса (и категории, если указана).
+    Сервис разрешается в service_id по реестру репозитория – запрос идёт по индексу service_id.
+    """
     service_id = await get_service_id(pool, service_name)
     if service_id is None:
-        await add_service(pool, service_name)
-        service_id = await get_service_id(pool, service_name)
+        return []
+    async with acquire(pool, "get_parsed_discounts") as conn:
+        return await conn.fetch("""
+            SELECT pd.discount_id, pd.product_name, pd.brand,
+                   pd.price_new, pd.price_old, pd.discount_percent, pd.rating, pd.sizes, pd.parsed_at
+            FROM parsed_discounts pd
+            WHERE pd.service_id = $1
+            AND pd.is_active
+            AND ($2::VARCHAR IS NULL OR EXISTS (
+                SELECT 1 FROM parsed_discount_categories c
+                WHERE c.discount_id = pd.discount_id AND c.category = $2
+            ))
+            ORDER BY pd.discount_percent DESC NULLS LAST;
+        """, service_id, category)
 
-    async with pool.acquire() as conn:
-        for discount in discounts:
-            await conn.execute("""
-                INSERT INTO parsed_discounts (service_id, product_name, price_new, price_old, discount_percent)
-                VALUES ($1, $2, $3, $4, $5)
-                ON CONFLICT (service_id, product_name)
-                DO UPDATE SET 
-                    price_new = EXCLUDED.price_new,
-                    price_old = EXCLUDED.price_old,
-                    discount_percent = EXCLUDED.discount_percent,
-                    parsed_at = NOW();
-            """, service_id, discount['name'], discount['price'], discount['old_price'], discount['discount'])
-
-async def get_unseen_discounts(pool, user_id, service_id):
-    """Получить скидки, которые пользователь ещё не видел."""
-    async with pool.acquire() as conn:
+async def get_unseen_discounts(pool, user_id, service_id, discount_threshold=0):
+    """Получить скидки не ниже порога, которые пользователь ещё не видел."""
+    async with acquire(pool, "get_unseen_discounts") as conn:
         return await conn.fetch("""
             SELECT pd.discount_id, pd.product_name, pd.price_new, pd.price_old, pd.discount_percent
             FROM parsed_discounts pd
-            LEFT JOIN sent_discounts sd 
-            ON pd.discount_id = sd.discount_id AND sd.user_id = $1
             WHERE pd.service_id = $2
+            AND pd.is_active
+            AND pd.discount_percent >= $3
+            AND NOT EXISTS (
+                SELECT 1 FROM sent_discounts sd
+                WHERE sd.user_id = $1 AND sd.service_id = $2 AND sd.discount_id = pd.discount_id
+            )
             ORDER BY pd.parsed_at DESC;
-        """, user_id, service_id)
+        """, user_id, service_id, discount_threshold or 0)
+
+async def plan_notifications(pool, notification_time, user_ids=None):
+    """
+    Спланировать рассылку на минуту одним запросом.
+    Возвращает строки (подписка, скидка) только для непросмотренных скидок
+    не ниже порога пользователя; подписка без новых скидок возвращается
+    одной строкой с discount_id = NULL.
+    user_ids: если известен список пользователей минуты, выборка ограничивается им.
+    Имена сервисов – из get_service_names (реестр репозитория).
+    """
+    async with acquire(pool, "plan_notifications") as conn:
+        return await conn.fetch("""
+            SELECT s.user_id, s.service_id, s.discount_threshold,
+                   pd.discount_id, pd.product_name, pd.price_new, pd.price_old, pd.discount_percent
+            FROM subscriptions s
+            LEFT JOIN LATERAL (
+                SELECT p.discount_id, p.product_name, p.price_new, p.price_old,
+                       p.discount_percent, p.parsed_at
+                FROM parsed_discounts p
+                WHERE p.service_id = s.service_id
+                AND p.is_active
+                AND p.discount_percent >= COALESCE(s.discount_threshold, 0)
+                AND NOT EXISTS (
+                    SELECT 1 FROM sent_discounts sd
+                    WHERE sd.user_id = s.user_id
+                    AND sd.service_id = s.service_id
+                    AND sd.discount_id = p.discount_id
+                )
+            ) pd ON TRUE
+            WHERE s.notification_time = $1
+            AND ($2::BIGINT[] IS NULL OR s.user_id = ANY($2))
+            ORDER BY s.user_id, s.service_id, pd.parsed_at DESC;
+        """, notification_time, user_ids)
+
+async def get_service_names(pool, service_ids=()):
+    """
+    Словарь service_id -> service_name. У репозитория – из реестра
+    (перечитывается, если какого-то из service_ids в нём нет).
+    """
+    if isinstance(pool, Repository):
+        names = pool.service_names()
+        if all(service_id in names for service_id in service_ids):
+            return names
+        await pool.load_services()
+        return pool.service_names()
+    async with acquire(pool, "get_service_names") as conn:
+        rows = await conn.fetch("SELECT service_id, service_name FROM services;")
+    return {row['service_id']: row['service_name'] for row in rows}
+
+async def get_active_discounts(pool, service_ids):
+    """Активные скидки нескольких сервисов (для расчёта рассылки в памяти)."""
+    async with acquire(pool, "get_active_discounts") as conn:
+        return await conn.fetch("""
+            SELECT discount_id, service_id, product_name, brand, price_new, price_old,
+                   discount_percent, rating, sizes
+            FROM parsed_discounts
+            WHERE is_active AND service_id = ANY($1::INT[])
+            ORDER BY service_id, discount_percent DESC NULLS LAST;
+        """, list(service_ids))
+
+async def get_sent_discounts_since(pool, after_sent_id=0, limit=50000, buckets=None, bucket_count=1):
+    """
+    Порция отметок об отправке с sent_id больше after_sent_id (по возрастанию sent_id).
+    buckets: только пользователи вёдер user_id % bucket_count (шардированная рассылка).
+    """
+    async with acquire(pool, "get_sent_discounts_since") as conn:
+        return await conn.fetch("""
+            SELECT sent_id, user_id, discount_id
+            FROM sent_discounts
+            WHERE sent_id > $1
+            AND ($3::INT[] IS NULL OR (user_id % $4)::INT = ANY($3))
+            ORDER BY sent_id
+            LIMIT $2;
+        """, after_sent_id, limit, buckets, bucket_count)
+
+async def get_recent_sent_discounts(pool, since, up_to_sent_id):
+    """
+    Отметки с sent_at не раньше since и sent_id не больше up_to_sent_id – строки,
+    зафиксированные позже строк с большим sent_id (догрузка по sent_id их пропускает).
+    """
+    async with acquire(pool, "get_recent_sent_discounts") as conn:
+        return await conn.fetch("""
+            SELECT sent_id, user_id, discount_id
+            FROM sent_discounts
+            WHERE sent_at >= $1 AND sent_id <= $2;
+        """, since, up_to_sent_id)
+
+async def get_db_time(pool):
+    """Текущее время базы (как у sent_at)."""
+    async with acquire(pool, "get_db_time") as conn:
+        return await conn.fetchval("SELECT LOCALTIMESTAMP;")
 
 async def mark_discounts_as_sent(pool, user_id, service_id, discount_ids):
     """Отметить скидки как отправленные пользователю."""
-    async with pool.acquire() as conn:
-        for discount_id in discount_ids:
-            await conn.execute("""
+    return await mark_discounts_as_sent_bulk(
+        pool, [(user_id, service_id, discount_id) for discount_id in discount_ids]
+    )
+
+async def lock_sent_buckets(conn, user_ids=None):
+    """
+    Блокировки вёдер пользователей для записи в sent_discounts (до конца транзакции).
+    Секционированная таблица не может хранить уникальность (user_id, service_id, discount_id)
+    без sent_at, поэтому повторы отсекает NOT EXISTS, а он безопасен, только пока
+    одного пользователя не отмечают параллельно. Ведра берутся по возрастанию – без взаимных блокировок.
+    user_ids=None – все ведра.
+    """
+    buckets = range(SENT_LOCK_BUCKETS) if user_ids is None else {user_id % SENT_LOCK_BUCKETS for user_id in user_ids}
+    await conn.execute("""
+        SELECT pg_advisory_xact_lock($1, bucket)
+        FROM unnest($2::INT[]) AS bucket
+        ORDER BY bucket;
+    """, SENT_LOCK_NAMESPACE, sorted(buckets))
+
+async def mark_discounts_as_sent_bulk(pool, sent):
+    """
+    Отметить отправленные скидки одним запросом для всего цикла рассылки.
+    Запись идёт под блокировками вёдер пользователей (lock_sent_buckets): реплики
+    планировщика, отмечающие одного пользователя одновременно, не создают повторов.
+
+    :param sent: итерируемое из кортежей (user_id, service_id, discount_id)
+    :return: количество новых записей в sent_discounts
+    """
+    user_ids, service_ids, discount_ids = [], [], []
+    for user_id, service_id, discount_id in sent:
+        user_ids.append(user_id)
+        service_ids.append(service_id)
+        discount_ids.append(discount_id)
+
+    if not discount_ids:
+        return 0
+
+    async with acquire(pool, "mark_discounts_as_sent_bulk") as conn:
+        async with conn.transaction():
+            await lock_sent_buckets(conn, user_ids)
+            # Отдельный запрос после блокировки: его снимок видит отметки, зафиксированные до неё
+            result = await conn.execute("""
                 INSERT INTO sent_discounts (user_id, service_id, discount_id)
-                VALUES ($1, $2, $3)
-                ON CONFLICT DO NOTHING;
-            """, user_id, service_id, discount_id)
+                SELECT DISTINCT t.user_id, t.service_id, t.discount_id
+                FROM unnest($1::BIGINT[], $2::INT[], $3::INT[]) AS t(user_id, service_id, discount_id)
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM sent_discounts sd
+                    WHERE sd.user_id = t.user_id
+                    AND sd.service_id = t.service_id
+                    AND sd.discount_id = t.discount_id
+                );
+            """, user_ids, service_ids, discount_ids)
+    # Статус вида "INSERT 0 <n>"
+    return int(result.split()[-1])
+
+# ======= Хранение данных ======= #
+_PARTITION_RE = re.compile(r"^sent_discounts_p(\d{4})(\d{2})$")
+
+async def ensure_sent_partitions(pool, months_ahead=SENT_PARTITIONS_AHEAD):
+    """Создать секции sent_discounts на текущий месяц и months_ahead следующих."""
+    async with acquire(pool, "ensure_sent_partitions") as conn:
+        rows = await conn.fetch("""
+            SELECT create_sent_discounts_partition((date_trunc('month', NOW()) + make_interval(months => n))::DATE) AS name
+            FROM generate_series(0, $1::INT) AS n;
+        """, months_ahead)
+    return [row['name'] for row in rows]
+
+async def drop_expired_sent_partitions(pool, retention_months=SENT_RETENTION_MONTHS):
+    """
+    Удалить секции sent_discounts старше retention_months месяцев.
+    Отметки о товарах, которые всё ещё активны, переносятся в текущую секцию –
+    иначе пользователи снова получили бы давно отправленные скидки.
+
+    :return: список (секция, перенесено строк)
+    """
+    dropped = []
+    async with acquire(pool, "drop_expired_sent_partitions") as conn:
+        cutoff = await conn.fetchval(
+            "SELECT (date_trunc('month', NOW()) - make_interval(months => $1::INT))::DATE;", retention_months
+        )
+        partitions = await conn.fetch("""
+            SELECT c.relname AS name
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'sent_discounts'::regclass
+            ORDER BY c.relname;
+        """)
+        for row in partitions:
+            match = _PARTITION_RE.match(row['name'])
+            if not match:
+                continue
+            month_start = datetime(int(match.group(1)), int(match.group(2)), 1).date()
+            if month_start >= cutoff:
+                continue
+
+            async with conn.transaction():
+                await lock_sent_buckets(conn)
+                carried = await conn.execute(f"""
+                    INSERT INTO sent_discounts (user_id, service_id, discount_id)
+                    SELECT DISTINCT old.user_id, old.service_id, old.discount_id
+                    FROM "{row['name']}" old
+                    JOIN parsed_discounts pd ON pd.discount_id = old.discount_id AND pd.is_active
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM sent_discounts sd
+                        WHERE sd.user_id = old.user_id
+                        AND sd.service_id = old.service_id
+                        AND sd.discount_id = old.discount_id
+                        AND sd.sent_at >= $1::DATE + INTERVAL '1 month'
+                    );
+                """, month_start)
+                await conn.execute(f'DROP TABLE "{row["name"]}";')
+            dropped.append((row['name'], int(carried.split()[-1])))
+    return dropped
+
+async def purge_inactive_discounts(pool, retention_days=DISCOUNT_RETENTION_DAYS, batch_size=PURGE_BATCH_SIZE):
+    """
+    Удалить товары, пропавшие с сайта больше retention_days дней назад.
+    Их отметки в sent_discounts удаляются каскадом. Удаление идёт порциями,
+    чтобы не держать долгие блокировки.
+
+    :return: количество удалённых товаров
+    """
+    total = 0
+    while True:
+        async with acquire(pool, "purge_inactive_discounts") as conn:
+            result = await conn.execute("""
+                DELETE FROM parsed_discounts
+                WHERE discount_id IN (
+                    SELECT discount_id FROM parsed_discounts
+                    WHERE NOT is_active
+                    AND deactivated_at < NOW() - make_interval(days => $1::INT)
+                    LIMIT $2
+                );
+            """, retention_days, batch_size)
+        deleted = int(result.split()[-1])
+        total += deleted
+        if deleted < batch_size:
+            return total
+
+# ======= Очередь парсинга ======= #
+async def enqueue_crawls(pool, crawls, max_attempts=SCRAPE_MAX_ATTEMPTS, timeout_minutes=SCRAPE_CRAWL_TIMEOUT_MINUTES):
+    """
+    Поставить в очередь обходы каталогов; первая страница каждого – задание для воркеров.
+    crawls: кортежи (service_name, category, city, url, max_pages).
+    Каталог, предыдущий обход которого ещё не закончен, повторно не ставится;
+    обходы старше timeout_minutes считаются брошенными и помечаются failed.
+
+    :return: crawl_id поставленных обходов
+    """
+    crawl_ids = []
+    async with acquire(pool, "enqueue_crawls") as conn:
+        async with conn.transaction():
+            await conn.execute("""
+                UPDATE scrape_crawls
+                SET status = 'failed', error = 'Обход не завершён вовремя', finished_at = NOW()
+                WHERE status IN ('pending', 'ingesting')
+                AND created_at < NOW() - make_interval(mins => $1::INT);
+            """, timeout_minutes)
+            for service_name, category, city, url, max_pages in crawls:
+                crawl_id = await conn.fetchval("""
+                    WITH crawl AS (
+                        INSERT INTO scrape_crawls (service_name, category, city, url, max_pages)
+                        SELECT $1::VARCHAR, $2::VARCHAR, $3::VARCHAR, $4::TEXT, $5::INT
+                        WHERE NOT EXISTS (
+                            SELECT 1 FROM scrape_crawls
+                            WHERE service_name = $1::VARCHAR
+                            AND category IS NOT DISTINCT FROM $2::VARCHAR
+                            AND city IS NOT DISTINCT FROM $3::VARCHAR
+                            AND status IN ('pending', 'ingesting')
+                        )
+                        RETURNING crawl_id
+                    )
+                    INSERT INTO scrape_jobs (crawl_id, page, url, max_attempts)
+                    SELECT crawl_id, 1, $4::TEXT, $6::INT FROM crawl
+                    RETURNING crawl_id;
+                """, service_name, category, city, url, max_pages, max_attempts)
+                if crawl_id is not None:
+                    crawl_ids.append(crawl_id)
+    return crawl_ids
+
+async def claim_scrape_job(pool, worker_id, lease_seconds):
+    """
+    Взять одно задание: свободное или с истёкшей арендой (его воркер пропал).
+    FOR UPDATE SKIP LOCKED – воркеры не ждут друг друга и не получают одно задание дважды.
+
+    :return: задание вместе с полями обхода или None, если заданий нет
+    """
+    async with acquire(pool, "claim_scrape_job") as conn:
+        return await conn.fetchrow("""
+            WITH next_job AS (
+                SELECT job_id FROM scrape_jobs
+                WHERE (status = 'pending' AND available_at <= NOW())
+                OR (status = 'running' AND lease_expires_at < NOW())
+                ORDER BY job_id
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            )
+            UPDATE scrape_jobs j
+            SET status = 'running',
+                worker_id = $1,
+                attempts = j.attempts + 1,
+                started_at = NOW(),
+                heartbeat_at = NOW(),
+                lease_expires_at = NOW() + make_interval(secs => $2::INT)
+            FROM next_job, scrape_crawls c
+            WHERE j.job_id = next_job.job_id AND c.crawl_id = j.crawl_id
+            RETURNING j.job_id, j.crawl_id, j.page, j.url, j.probe, j.attempts, j.max_attempts,
+                      c.service_name, c.category, c.city, c.url AS crawl_url, c.max_pages;
+        """, worker_id, lease_seconds)
+
+async def heartbeat_scrape_job(pool, job_id, worker_id, lease_seconds):
+    """Продлить аренду задания. False – аренда потеряна (задание забрал другой воркер)."""
+    async with acquire(pool, "heartbeat_scrape_job") as conn:
+        renewed = await conn.fetchval("""
+            UPDATE scrape_jobs
+            SET heartbeat_at = NOW(), lease_expires_at = NOW() + make_interval(secs => $3::INT)
+            WHERE job_id = $1 AND worker_id = $2 AND status = 'running'
+            RETURNING job_id;
+        """, job_id, worker_id, lease_seconds)
+        return renewed is not None
+
+async def _settle_crawl(conn, crawl_id):
+    """Если у обхода не осталось незавершённых страниц – перевести его в запись (ingesting)."""
+    settled = await conn.fetchval("""
+        UPDATE scrape_crawls
+        SET status = 'ingesting'
+        WHERE crawl_id = $1 AND status = 'pending'
+        AND NOT EXISTS (
+            SELECT 1 FROM scrape_jobs
+            WHERE crawl_id = $1 AND status IN ('pending', 'running')
+        )
+        RETURNING crawl_id;
+    """, crawl_id)
+    return "ready" if settled is not None else "ok"
+
+async def complete_scrape_job(pool, job, worker_id, result, products, next_pages=()):
+    """
+    Сохранить результат страницы и поставить в очередь следующие страницы обхода.
+    result: ProductBatch.to_bytes(); next_pages: кортежи (page, url, probe).
+    Завершения страниц одного обхода идут по очереди (блокировка строки обхода),
+    поэтому последнюю страницу видит ровно один воркер.
+
+    :return: "ready" – обход собран и его пора записать, "ok" – ещё нет,
+             "lost" – аренда потеряна, результат не сохранён
+    """
+    async with acquire(pool, "complete_scrape_job") as conn:
+        async with conn.transaction():
+            await conn.execute("SELECT 1 FROM scrape_crawls WHERE crawl_id = $1 FOR UPDATE;", job['crawl_id'])
+            done = await conn.fetchval("""
+                UPDATE scrape_jobs
+                SET status = 'done', finished_at = NOW(), lease_expires_at = NULL,
+                    products = $3, result = $4, error = NULL
+                WHERE job_id = $1 AND worker_id = $2 AND status = 'running'
+                RETURNING job_id;
+            """, job['job_id'], worker_id, products, result)
+            if done is None:
+                return "lost"
+            if next_pages:
+                pages, urls, probes = zip(*next_pages)
+                await conn.execute("""
+                    INSERT INTO scrape_jobs (crawl_id, page, url, probe, max_attempts)
+                    SELECT $1, page, url, probe, $5
+                    FROM unnest($2::INT[], $3::TEXT[], $4::BOOLEAN[]) AS t(page, url, probe)
+                    ON CONFLICT (crawl_id, page) DO NOTHING;
+                """, job['crawl_id'], list(pages), list(urls), list(probes), job['max_attempts'])
+            return await _settle_crawl(conn, job['crawl_id'])
+
+async def fail_scrape_job(pool, job, worker_id, error, retry_seconds):
+    """
+    Ошибка страницы: повтор не раньше чем через retry_seconds × номер попытки
+    или, если попытки кончились, окончательная неудача.
+
+    :return: как у complete_scrape_job
+    """
+    async with acquire(pool, "fail_scrape_job") as conn:
+        async with conn.transaction():
+            await conn.execute("SELECT 1 FROM scrape_crawls WHERE crawl_id = $1 FOR UPDATE;", job['crawl_id'])
+            status = await conn.fetchval("""
+                UPDATE scrape_jobs
+                SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'pending' END,
+                    available_at = NOW() + make_interval(secs => $4::INT * attempts),
+                    finished_at = CASE WHEN attempts >= max_attempts THEN NOW() END,
+                    lease_expires_at = NULL,
+                    error = $3
+                WHERE job_id = $1 AND worker_id = $2 AND status = 'running'
+                RETURNING status;
+            """, job['job_id'], worker_id, error, retry_seconds)
+            if status is None:
+                return "lost"
+            if status == 'failed':
+                return await _settle_crawl(conn, job['crawl_id'])
+            return "ok"
+
+async def get_crawl_pages(pool, crawl_id, with_results=True):
+    """Страницы обхода по порядку: page, probe, status, products, error (и result)."""
+    async with acquire(pool, "get_crawl_pages") as conn:
+        return await conn.fetch(f"""
+            SELECT page, probe, status, products, error{", result" if with_results else ""}
+            FROM scrape_jobs
+            WHERE crawl_id = $1
+            ORDER BY page;
+        """, crawl_id)
+
+async def finish_crawl(pool, crawl_id, status, error=None):
+    """Закрыть обход (done / failed); результаты страниц больше не нужны."""
+    async with acquire(pool, "finish_crawl") as conn:
+        async with conn.transaction():
+            await conn.execute("""
+                UPDATE scrape_crawls
+                SET status = $2, error = $3, finished_at = NOW()
+                WHERE crawl_id = $1;
+            """, crawl_id, status, error)
+            await conn.execute("UPDATE scrape_jobs SET result = NULL WHERE crawl_id = $1;", crawl_id)
+
+async def purge_finished_crawls(pool, retention_days=SCRAPE_RETENTION_DAYS):
+    """Удалить завершённые обходы старше retention_days дней (страницы – каскадом)."""
+    async with acquire(pool, "purge_finished_crawls") as conn:
+        result = await conn.execute("""
+            DELETE FROM scrape_crawls
+            WHERE status IN ('done', 'failed')
+            AND finished_at < NOW() - make_interval(days => $1::INT);
+        """, retention_days)
+        return int(result.split()[-1])
+
+# ======= Шардирование рассылки ======= #
+async def heartbeat_replica(pool, replica_id, lease_seconds):
+    """
+    Продлить аренду реплики планировщика (и зарегистрировать её при первом вызове).
+    Реплики, аренда которых истекла давно, удаляются.
+
+    :return: replica_id живых реплик по возрастанию – одинаковый список у всех реплик
+    """
+    async with acquire(pool, "heartbeat_replica") as conn:
+        await conn.execute("""
+            INSERT INTO scheduler_replicas (replica_id, lease_expires_at)
+            VALUES ($1, NOW() + make_interval(secs => $2::INT))
+            ON CONFLICT (replica_id) DO UPDATE
+            SET heartbeat_at = NOW(), lease_expires_at = EXCLUDED.lease_expires_at;
+        """, replica_id, lease_seconds)
+        await conn.execute("""
+            DELETE FROM scheduler_replicas
+            WHERE lease_expires_at < NOW() - make_interval(secs => $1::INT * 10);
+        """, lease_seconds)
+        rows = await conn.fetch("""
+            SELECT replica_id FROM scheduler_replicas
+            WHERE lease_expires_at >= NOW()
+            ORDER BY replica_id;
+        """)
+        return [row['replica_id'] for row in rows]
+
+async def remove_replica(pool, replica_id):
+    """Выйти из группы реплик (при остановке) – ведра сразу делятся между остальными."""
+    async with acquire(pool, "remove_replica") as conn:
+        await conn.execute("DELETE FROM scheduler_replicas WHERE replica_id = $1;", replica_id)
+
+async def claim_dispatch_buckets(pool, tick, replica_id, buckets, lease_seconds):
+    """
+    Взять ведра пользователей на минуту рассылки. Ведро достаётся одной реплике:
+    свободное или незавершённое, аренда которого истекла (владелец упал или отпустил ведро).
+
+    :param lease_seconds: аренда ведра; владелец продлевает её, пока ведёт рассылку
+    :return: взятые ведра
+    """
+    async with acquire(pool, "claim_dispatch_buckets") as conn:
+        rows = await conn.fetch("""
+            INSERT INTO dispatch_claims (tick, bucket, replica_id, lease_expires_at)
+            SELECT $1, bucket, $2, NOW() + make_interval(secs => $4::INT)
+            FROM unnest($3::INT[]) AS bucket
+            ON CONFLICT (tick, bucket) DO UPDATE
+            SET replica_id = EXCLUDED.replica_id, claimed_at = NOW(),
+                lease_expires_at = EXCLUDED.lease_expires_at
+            WHERE dispatch_claims.finished_at IS NULL
+            AND dispatch_claims.lease_expires_at < NOW()
+            RETURNING bucket;
+        """, tick, replica_id, list(buckets), lease_seconds)
+        return {row['bucket'] for row in rows}
+
+async def renew_dispatch_claims(pool, replica_id, ticks, lease_seconds):
+    """Продлить аренду незавершённых вёдер реплики в минутах ticks (рассылка ещё идёт)."""
+    async with acquire(pool, "renew_dispatch_claims") as conn:
+        await conn.execute("""
+            UPDATE dispatch_claims
+            SET lease_expires_at = NOW() + make_interval(secs => $3::INT)
+            WHERE tick = ANY($2::TIMESTAMP[]) AND replica_id = $1 AND finished_at IS NULL;
+        """, replica_id, list(ticks), lease_seconds)
+
+async def finish_dispatch_buckets(pool, tick, replica_id, buckets):
+    """Отметить рассылку вёдер минуты завершённой (после записи в sent_discounts)."""
+    async with acquire(pool, "finish_dispatch_buckets") as conn:
+        await conn.execute("""
+            UPDATE dispatch_claims
+            SET finished_at = NOW()
+            WHERE tick = $1 AND replica_id = $2 AND bucket = ANY($3::INT[]) AND finished_at IS NULL;
+        """, tick, replica_id, list(buckets))
+
+async def release_dispatch_buckets(pool, tick, replica_id, buckets):
+    """Отпустить незавершённые ведра (рассылка упала) – их сразу может взять любая реплика."""
+    async with acquire(pool, "release_dispatch_buckets") as conn:
+        await conn.execute("""
+            UPDATE dispatch_claims
+            SET lease_expires_at = NOW() - INTERVAL '1 second'
+            WHERE tick = $1 AND replica_id = $2 AND bucket = ANY($3::INT[]) AND finished_at IS NULL;
+        """, tick, replica_id, list(buckets))
+
+async def get_stale_dispatch_claims(pool, since):
+    """
+    Незавершённые ведра с истёкшей арендой за минуты начиная с since:
+    реплика взяла их и упала (или отпустила после ошибки).
+
+    :return: словарь минута -> список вёдер, по возрастанию минут
+    """
+    async with acquire(pool, "get_stale_dispatch_claims") as conn:
+        rows = await conn.fetch("""
+            SELECT tick, array_agg(bucket ORDER BY bucket) AS buckets
+            FROM dispatch_claims
+            WHERE finished_at IS NULL
+            AND tick >= $1
+            AND lease_expires_at < NOW()
+            GROUP BY tick
+            ORDER BY tick;
+        """, since)
+        return {row['tick']: list(row['buckets']) for row in rows}
+
+async def get_busy_buckets(pool, replica_id, buckets):
+    """
+    Ведра, рассылку которых ещё ведут другие реплики (аренда ведра не истекла).
+
+    :return: (ведра, время проверки по часам базы)
+    """
+    async with acquire(pool, "get_busy_buckets") as conn:
+        row = await conn.fetchrow("""
+            SELECT NOW()::TIMESTAMP AS checked_at, ARRAY(
+                SELECT DISTINCT c.bucket
+                FROM dispatch_claims c
+                WHERE c.bucket = ANY($2::INT[])
+                AND c.finished_at IS NULL
+                AND c.replica_id <> $1
+                AND c.lease_expires_at >= NOW()
+            ) AS buckets;
+        """, replica_id, list(buckets))
+        return set(row['buckets']), row['checked_at']
+
+async def get_foreign_buckets(pool, replica_id, warmed):
+    """
+    Ведра, которые другие реплики брали после загрузки их отметок в память
+    (например, подобрали проходом за упавшей репликой).
+    warmed: словарь ведро -> время загрузки (часы базы).
+    """
+    if not warmed:
+        return set()
+    buckets, warmed_at = zip(*warmed.items())
+    async with acquire(pool, "get_foreign_buckets") as conn:
+        rows = await conn.fetch("""
+            SELECT DISTINCT c.bucket
+            FROM dispatch_claims c
+            JOIN unnest($2::INT[], $3::TIMESTAMP[]) AS w(bucket, warmed_at) ON w.bucket = c.bucket
+            WHERE c.replica_id <> $1
+            -- Запас на вставки, которые ещё не были видны в момент загрузки
+            AND c.claimed_at > w.warmed_at - INTERVAL '10 seconds';
+        """, replica_id, list(buckets), list(warmed_at))
+        return {row['bucket'] for row in rows}
+
+async def purge_dispatch_claims(pool, retention_days=DISPATCH_CLAIM_RETENTION_DAYS):
+    """Удалить записи о ведрах рассылки старше retention_days дней."""
+    async with acquire(pool, "purge_dispatch_claims") as conn:
+        result = await conn.execute("""
+            DELETE FROM dispatch_claims
+            WHERE tick < NOW() - make_interval(days => $1::INT);
+        """, retention_days)
+        return int(result.split()[-1])
 
 # ======= Функции для статистики ======= #
 async def count_users(pool):
     """Подсчитать количество пользователей."""
-    async with pool.acquire() as conn:
+    async with acquire(pool, "count_users") as conn:
         record = await conn.fetchval("""
             SELECT COUNT(*) FROM users;
         """)
@@ -138,7 +965,7 @@ async def count_users(pool):
 
 async def count_subscriptions(pool):
     """Подсчитать количество подписок."""
-    async with pool.acquire() as conn:
+    async with acquire(pool, "count_subscriptions") as conn:
         record = await conn.fetchval("""
             SELECT COUNT(*) FROM subscriptions;
         """)
@@ -146,7 +973,7 @@ async def count_subscriptions(pool):
 
 async def count_sent_discounts(pool):
     """Подсчитать количество отправленных скидок."""
-    async with pool.acquire() as conn:
+    async with acquire(pool, "count_sent_discounts") as conn:
         record = await conn.fetchval("""
             SELECT COUNT(*) FROM sent_discounts;
         """)
@@ -154,7 +981,7 @@ async def count_sent_discounts(pool):
 
 async def get_user_subscriptions(pool, user_id):
     """Получить активные подписки пользователя."""
-    async with pool.acquire() as conn:
+    async with acquire(pool, "get_user_subscriptions") as conn:
         try:
             query = """
                 SELECT s.service_id, srv.service_name, s.discount_threshold, s.notification_time
@@ -170,7 +997,7 @@ async def get_user_subscriptions(pool, user_id):
         
 async def remove_subscription(pool, user_id, service_name):
     """Удалить подписку пользователя на указанный сервис."""
-    async with pool.acquire() as conn:
+    async with acquire(pool, "remove_subscription") as conn:
         try:
             query = """
                 DELETE FROM subscriptions
@@ -0,0 +1,161 @@
+# discount_cache.py – Кэш снимков скидок для бота (без парсинга в обработчиках)
+import asyncio
+import json
+import logging
+import os
+import time
+
+from db import DISCOUNTS_CHANNEL, get_parsed_discounts
+from service_parsers.records import ProductBatch
+
+logger = logging.getLogger(__name__)
+
+# Время жизни снимка в секундах
+DISCOUNT_CACHE_TTL = int(os.getenv("DISCOUNT_CACHE_TTL", "300"))
+
+# Соответствие магазина в боте и названия сервиса в базе
+STORE_SERVICES = {
+    "magnum": "Magnum",
+    "lamoda": "Lamoda",
+}
+
+
+class _Snapshot:
+    """Снимок скидок по одному ключу (магазин, категория)."""
+
+    __slots__ = ("discounts", "loaded_at")
+
+    def __init__(self, discounts, loaded_at):
+        self.discounts = discounts
+        self.loaded_at = loaded_at
+
+
+class DiscountSnapshotCache:
+    """
+    Кэш снимков скидок по ключу (магазин, категория) с TTL.
+    Обновление выполняется по принципу single-flight: сколько бы запросов
+    ни пришло одновременно, загрузка из базы выполняется один раз – в отдельной
+    задаче, которую отмена любого из ожидающих не прерывает.
+    """
+
+    def __init__(self, loader, ttl=DISCOUNT_CACHE_TTL, on_update=None):
+        """
+        :param loader: корутина loader(store, category) -> ProductBatch
+        :param ttl: время жизни снимка в секундах
+        :param on_update: функция on_update(store, category, discounts), вызывается
+                          после каждой загрузки снимка (например, сборка документов)
+        """
+        self._loader = loader
+        self.ttl = ttl
+        self._on_update = on_update
+        self._snapshots = {}
+        self._inflight = {}
+
+    async def get(self, store, category=None, force=False):
+        """Вернуть скидки из снимка, при необходимости (или force) обновив его."""
+        key = (store, category)
+        while True:
+            snapshot = self._snapshots.get(key)
+            if not force and snapshot is not None and time.monotonic() - snapshot.loaded_at < self.ttl:
+                return snapshot.discounts
+
+            # Загрузка идёт в отдельной задаче: отмена одного ожидающего (ушёл пользователь,
+            # истёк таймаут обработчика) не прерывает её для остальных
+            task = self._inflight.get(key)
+            if task is None:
+                task = asyncio.create_task(self._load(key))
+                self._inflight[key] = task
+                task.add_done_callback(lambda done, key=key: self._load_done(key, done))
+
+            try:
+                return await asyncio.shield(task)
+            except asyncio.CancelledError:
+                # Отменили саму загрузку, а не этот вызов – повторяем её для оставшихся
+                if task.cancelled() and not asyncio.current_task().cancelling():
+                    continue
+                raise
+            except Exception:
+                if snapshot is None:
+                    raise
+                # База недоступна – отдаём устаревший снимок
+                return snapshot.discounts
+
+    async def _load(self, key):
+        try:
+            discounts = await self._loader(*key)
+        except Exception as e:
+            if key in self._snapshots:
+                logger.warning(f"Не удалось обновить снимок скидок {key}, используется устаревший: {e}")
+            raise
+        self.put(*key, discounts)
+        return discounts
+
+    def _load_done(self, key, task):
+        # Запись снимается при любом исходе, но только своя – следующая загрузка могла уже начаться
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # Помечаем исключение как полученное, даже если все ожидающие ушли
+
+    def put(self, store, category, discounts):
+        """Положить свежие данные в кэш (например, сразу после парсинга)."""
+        self._snapshots[(store, category)] = _Snapshot(discounts, time.monotonic())
+        if self._on_update is not None:
+            try:
+                self._on_update(store, category, discounts)
+            except Exception as e:
+                logger.error(f"Ошибка обработки обновлённого снимка {(store, category)}: {e}")
+
+    def invalidate(self, store=None, category=None):
+        """Сбросить снимок по ключу или весь кэш."""
+        if store is None:
+            self._snapshots.clear()
+        else:
+            self._snapshots.pop((store, category), None)
+
+    def categories(self, store):
+        """Категории магазина, снимки которых сейчас в кэше."""
+        return {category for cached_store, category in self._snapshots if cached_store == store}
+
+    async def refresh(self, store, category=None):
+        """Перечитать снимок сейчас, не дожидаясь TTL (при ошибке остаётся прежний)."""
+        try:
+            await self.get(store, category, force=True)
+        except Exception as e:
+            logger.warning(f"Не удалось обновить снимок скидок {(store, category)}: {e}")
+
+
+def create_db_discount_cache(pool, ttl=DISCOUNT_CACHE_TTL, on_update=None):
+    """Кэш, который заполняется из таблицы parsed_discounts."""
+
+    async def load_from_db(store, category):
+        rows = await get_parsed_discounts(pool, STORE_SERVICES[store], category)
+        return ProductBatch.from_rows(rows)
+
+    return DiscountSnapshotCache(load_from_db, ttl=ttl, on_update=on_update)
+
+
+async def listen_discount_changes(conn, cache):
+    """
+    Обновлять снимки сразу после записи парсинга в базу (уведомления DISCOUNTS_CHANNEL
+    от планировщика), а не по истечении TTL. conn – отдельное соединение, не из пула.
+    """
+    stores = {service_name: store for store, service_name in STORE_SERVICES.items()}
+    refreshing = set()  # Ссылки на задачи, чтобы их не собрал сборщик мусора
+
+    def on_notify(connection, pid, channel, payload):
+        try:
+            change = json.loads(payload)
+            store = stores.get(change["service"])
+        except Exception as e:
+            logger.error(f"Некорректное уведомление об обновлении скидок {payload!r}: {e}")
+            return
+        if store is None:
+            return
+        # Товар бывает в нескольких категориях – перечитываются все снимки магазина
+        for category in {change.get("category"), *cache.categories(store)}:
+            task = asyncio.create_task(cache.refresh(store, category))
+            refreshing.add(task)
+            task.add_done_callback(refreshing.discard)
+
+    await conn.add_listener(DISCOUNTS_CHANNEL, on_notify)
@@ -0,0 +1,117 @@
+# discount_documents.py – Готовые .txt-документы со скидками по стандартным порогам для бота
+import hashlib
+import logging
+
+from service_parsers.normalize import format_percent, format_price
+
+logger = logging.getLogger(__name__)
+
+# Пороги кнопок бота: документы для них собираются заранее
+STANDARD_THRESHOLDS = (10, 20, 30, 50)
+
+DOCUMENT_FILENAME = "filtered_discounts.txt"
+
+
+def render_item(item):
+    """Текстовый блок одного товара (в байтах UTF-8)."""
+    return (
+        f"🛍️ Бренд: {item.brand or 'Нет'}\n"
+        f"📌 Название: {item.name}\n"
+        f"💰 Цена: {format_price(item.price_minor)}\n"
+        f"💸 Старая цена: {format_price(item.old_price_minor)}\n"
+        f"📉 Скидка: {format_percent(item.discount_percent)}\n"
+        f"⭐ Рейтинг: {item.rating or 'Нет'}\n"
+        f"📏 Размеры: {item.sizes or 'Нет'}\n"
+        "---------------------------\n"
+    ).encode("utf-8")
+
+
+class Document:
+    """Готовый документ: содержимое, число товаров и хэш (ключ file_id в Telegram)."""
+
+    __slots__ = ("content", "count", "digest")
+
+    def __init__(self, content, count):
+        self.content = content
+        self.count = count
+        self.digest = hashlib.sha1(content).hexdigest()
+
+
+class _StoreDocuments:
+    """Документы одного снимка (магазин, категория)."""
+
+    __slots__ = ("batch", "digest", "blocks", "documents")
+
+    def __init__(self, batch, digest, blocks, documents):
+        self.batch = batch
+        self.digest = digest          # ProductBatch.digest() снимка
+        self.blocks = blocks          # Текст каждого товара снимка
+        self.documents = documents    # порог -> Document
+
+
+class DiscountDocuments:
+    """
+    Документы с результатами для кнопок 10/20/30/50%, собранные один раз
+    при обновлении снимка скидок. Обработчик бота только отправляет готовые байты,
+    а после первой загрузки – file_id Telegram (повторной загрузки нет).
+
+    file_id хранится по хэшу содержимого, поэтому переживает перезагрузку
+    снимка, если скидки не изменились.
+    """
+
+    def __init__(self, thresholds=STANDARD_THRESHOLDS):
+        self.thresholds = tuple(thresholds)
+        self._stores = {}     # (магазин, категория) -> _StoreDocuments
+        self._file_ids = {}   # хэш документа -> file_id
+
+    def rebuild(self, store, category, batch):
+        """
+        Пересобрать документы снимка (вызывается кэшем снимков после загрузки).
+        Каждая перезагрузка по TTL приносит новый объект пакета, поэтому сравнивается
+        хэш содержимого: если скидки не изменились, готовые документы остаются.
+        """
+        digest = batch.digest()
+        current = self._stores.get((store, category))
+        if current is not None and current.digest == digest:
+            current.batch = batch
+            return
+
+        blocks = [render_item(item) for item in batch]
+        documents = {}
+        for threshold in self.thresholds:
+            indices = batch.indices_at_least(threshold)
+            if indices:
+                documents[threshold] = Document(b"".join(blocks[i] for i in indices), len(indices))
+        self._stores[(store, category)] = _StoreDocuments(batch, digest, blocks, documents)
+
+        # file_id документов, которых больше нет ни в одном снимке, не нужны
+        digests = {d.digest for entry in self._stores.values() for d in entry.documents.values()}
+        self._file_ids = {digest: file_id for digest, file_id in self._file_ids.items() if digest in digests}
+        logger.info(
+            f"📄 Документы скидок {store} ({category or 'все'}) собраны: "
+            + ", ".join(f"{t}% – {d.count}" for t, d in documents.items())
+        )
+
+    def get(self, store, category, threshold):
+        """
+        Документ для порога: готовый для стандартных порогов, для остальных –
+        склейка уже отрендеренных блоков. None – снимка нет или товаров нет.
+        """
+        entry = self._stores.get((store, category))
+        if entry is None:
+            return None
+        if threshold in entry.documents or threshold in self.thresholds:
+            return entry.documents.get(threshold)
+        indices = entry.batch.indices_at_least(threshold)
+        if not indices:
+            return None
+        return Document(b"".join(entry.blocks[i] for i in indices), len(indices))
+
+    # ======= file_id Telegram ======= #
+    def file_id(self, document):
+        return self._file_ids.get(document.digest)
+
+    def remember_file_id(self, document, file_id):
+        """Запомнить file_id после первой загрузки (только для стандартных документов)."""
+        if any(d is document for entry in self._stores.values() for d in entry.documents.values()):
+            self._file_ids[document.digest] = file_id
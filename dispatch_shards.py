@@ -0,0 +1,219 @@
+# dispatch_shards.py – Шардирование рассылки между репликами планировщика (аренда реплик и ведра пользователей)
+import hashlib
+import logging
+import os
+import socket
+import time
+from datetime import timedelta
+
+from db import (
+    claim_dispatch_buckets,
+    finish_dispatch_buckets,
+    get_busy_buckets,
+    get_foreign_buckets,
+    get_stale_dispatch_claims,
+    heartbeat_replica,
+    release_dispatch_buckets,
+    remove_replica,
+    renew_dispatch_claims
+)
+from metrics import DISPATCH_BUCKETS, DISPATCH_REPLICAS
+
+logger = logging.getLogger(__name__)
+
+# single – рассылает одна реплика; sharded – пользователи делятся между репликами
+DISPATCH_MODE = os.getenv("DISPATCH_MODE", "single")
+# Число вёдер пользователей (user_id % DISPATCH_BUCKET_COUNT); одинаковое у всех реплик
+DISPATCH_BUCKET_COUNT = int(os.getenv("DISPATCH_BUCKET_COUNT", "256"))
+# Имя реплики в scheduler_replicas (по умолчанию – хост и PID)
+REPLICA_ID = os.getenv("REPLICA_ID") or f"{socket.gethostname()}:{os.getpid()}"
+REPLICA_LEASE_SECONDS = int(os.getenv("REPLICA_LEASE_SECONDS", "30"))           # Аренда реплики без продления
+REPLICA_HEARTBEAT_SECONDS = int(os.getenv("REPLICA_HEARTBEAT_SECONDS", "10"))   # Как часто продлевать аренду
+# На какой секунде минуты подбирать ведра, которые никто не взял (перестроение, упавшая реплика)
+DISPATCH_ORPHAN_SECOND = int(os.getenv("DISPATCH_ORPHAN_SECOND", "30"))
+# Аренда взятого ведра: владелец продлевает её с heartbeat, пока рассылает; истекла – ведро забирают
+DISPATCH_CLAIM_LEASE_SECONDS = int(os.getenv("DISPATCH_CLAIM_LEASE_SECONDS", "30"))
+# За сколько прошедших минут подбирать незавершённые ведра упавших реплик
+DISPATCH_ORPHAN_WINDOW_MINUTES = int(os.getenv("DISPATCH_ORPHAN_WINDOW_MINUTES", "60"))
+
+
+def bucket_of(user_id, bucket_count=DISPATCH_BUCKET_COUNT):
+    """Ведро пользователя."""
+    return user_id % bucket_count
+
+
+def _weight(replica_id, bucket):
+    return hashlib.blake2b(f"{replica_id}:{bucket}".encode(), digest_size=8).digest()
+
+
+def assign_buckets(replicas, replica_id, bucket_count=DISPATCH_BUCKET_COUNT):
+    """
+    Ведра реплики по rendezvous-хэшированию: ведро достаётся реплике с наибольшим
+    весом hash(реплика, ведро). Все реплики по одному списку считают одно и то же,
+    а при появлении или уходе реплики переезжают только её ведра.
+    """
+    if replica_id not in replicas:
+        return frozenset()
+    return frozenset(
+        bucket for bucket in range(bucket_count)
+        if max(replicas, key=lambda replica: _weight(replica, bucket)) == replica_id
+    )
+
+
+class ShardCoordinator:
+    """
+    Участие реплики в шардированной рассылке.
+
+    Реплика продлевает аренду в scheduler_replicas и по списку живых реплик
+    вычисляет свои ведра. Каждую минуту ведро рассылает ровно одна реплика:
+    право на (минута, ведро) берётся вставкой в dispatch_claims с арендой, которую
+    владелец продлевает, пока рассылает. Ведра, которые никто не взял (реплики
+    разошлись во мнении при перестроении), и незавершённые ведра с истёкшей арендой
+    (реплика упала или отпустила ведро после ошибки) – в том числе за прошедшие
+    минуты – подбирает проход на DISPATCH_ORPHAN_SECOND секунде.
+
+    Индекс просмотренных держит только отметки своих вёдер. Новое ведро
+    считается «холодным» (рассылка через запрос к базе), пока прежний владелец
+    не закончит его рассылку и отметки не будут загружены в память.
+    """
+
+    def __init__(self, replica_id=REPLICA_ID, bucket_count=DISPATCH_BUCKET_COUNT, on_rebalance=None,
+                 claim_lease_seconds=DISPATCH_CLAIM_LEASE_SECONDS):
+        """
+        :param on_rebalance: функция on_rebalance(coordinator), вызывается при изменении
+                             состава реплик (например, деление лимита Telegram)
+        """
+        self.replica_id = replica_id
+        self.bucket_count = bucket_count
+        self.claim_lease_seconds = claim_lease_seconds
+        self.replicas = []
+        self.buckets = frozenset()   # Ведра этой реплики
+        self._warm = {}              # Ведро -> время загрузки его отметок в индекс просмотренных
+        self._on_rebalance = on_rebalance
+        self._heartbeat_at = None
+        self._dispatching = {}       # Минута -> ведра, рассылка которых идёт (аренда продлевается)
+
+    @property
+    def warm_buckets(self):
+        """Ведра, отметки которых загружены в индекс просмотренных."""
+        return self._warm.keys()
+
+    @property
+    def is_leader(self):
+        """Первая по replica_id живая реплика – выполняет общие задания (парсинг, хранение)."""
+        return bool(self.replicas) and self.replicas[0] == self.replica_id
+
+    def _cool(self, buckets):
+        for bucket in buckets:
+            self._warm.pop(bucket, None)
+
+    # ======= Аренда и перестроение ======= #
+    async def heartbeat(self, pool, seen_index=None):
+        """Продлить аренду, пересчитать ведра и прогреть новые (вызывается по интервалу)."""
+        now = time.monotonic()
+        if self._heartbeat_at is not None and now - self._heartbeat_at > REPLICA_LEASE_SECONDS:
+            # Аренда могла истечь, и наши ведра рассылал кто-то другой – отметки в памяти неполные
+            logger.warning("⚠️ Аренда реплики не продлевалась дольше срока, ведра будут прогреты заново")
+            self._warm.clear()
+
+        replicas = await heartbeat_replica(pool, self.replica_id, REPLICA_LEASE_SECONDS)
+        self._heartbeat_at = now
+        if self._dispatching:
+            await renew_dispatch_claims(pool, self.replica_id, list(self._dispatching), self.claim_lease_seconds)
+        buckets = assign_buckets(replicas, self.replica_id, self.bucket_count)
+        if replicas != self.replicas or buckets != self.buckets:
+            lost = self.buckets - buckets
+            gained = buckets - self.buckets
+            self.replicas = replicas
+            self.buckets = buckets
+            self._cool(lost)
+            if lost and seen_index is not None:
+                seen_index.forget_buckets(lost, self.bucket_count)
+            logger.info(
+                f"🔀 Реплик рассылки: {len(replicas)}, вёдер у {self.replica_id}: {len(buckets)} "
+                f"(+{len(gained)}, −{len(lost)})"
+            )
+            if self._on_rebalance is not None:
+                self._on_rebalance(self)
+
+        if seen_index is not None:
+            # Ведра, которые за нас рассылала другая реплика, прогреваются заново
+            self._cool(await get_foreign_buckets(pool, self.replica_id, self._warm))
+            await self.warm_up(pool, seen_index)
+        DISPATCH_REPLICAS.set(len(self.replicas))
+        DISPATCH_BUCKETS.set(len(self._warm), state="warm")
+        DISPATCH_BUCKETS.set(len(self.buckets - self._warm.keys()), state="cold")
+
+    async def warm_up(self, pool, seen_index):
+        """Загрузить в память отметки новых вёдер, рассылку которых прежний владелец закончил."""
+        cold = self.buckets - self._warm.keys()
+        if not cold:
+            return
+        busy, checked_at = await get_busy_buckets(pool, self.replica_id, cold)
+        ready = cold - busy
+        if not ready:
+            return
+        loaded = await seen_index.load_buckets(pool, ready, self.bucket_count)
+        # Пока отметки грузились, ведра могли уйти другой реплике
+        ready &= self.buckets
+        self._warm.update(dict.fromkeys(ready, checked_at))
+        logger.info(f"👁️ Прогрето вёдер: {len(ready)} (отметок {loaded})")
+
+    async def leave(self, pool):
+        """Выйти из группы при остановке, чтобы ведра сразу перешли к остальным."""
+        await remove_replica(pool, self.replica_id)
+        self.replicas = []
+        self.buckets = frozenset()
+        self._warm.clear()
+        self._dispatching.clear()
+
+    # ======= Ведра минуты ======= #
+    async def claim(self, pool, tick, user_ids, orphans=False, buckets=None):
+        """
+        Взять ведра минуты tick, в которых есть пользователи user_ids:
+        свои или (orphans) все, что остались без рассылки.
+        buckets: взять именно эти ведра (брошенные ведра прошедшей минуты).
+        """
+        if buckets is not None:
+            buckets = set(buckets)
+        else:
+            buckets = {bucket_of(user_id, self.bucket_count) for user_id in user_ids}
+            if not orphans:
+                buckets &= self.buckets
+        if not buckets:
+            return set()
+        claimed = await claim_dispatch_buckets(
+            pool, tick, self.replica_id, sorted(buckets), self.claim_lease_seconds
+        )
+        if not orphans:
+            # Свои ведра, которые уже взяла другая реплика: отметки в памяти станут неполными
+            self._cool(buckets - claimed)
+        if claimed:
+            self._dispatching.setdefault(tick, set()).update(claimed)
+        return claimed
+
+    def _done(self, tick, buckets):
+        left = self._dispatching.get(tick, set()) - set(buckets)
+        if left:
+            self._dispatching[tick] = left
+        else:
+            self._dispatching.pop(tick, None)
+
+    async def finish(self, pool, tick, buckets):
+        """Рассылка вёдер минуты завершена и отмечена в sent_discounts."""
+        self._done(tick, buckets)
+        await finish_dispatch_buckets(pool, tick, self.replica_id, sorted(buckets))
+
+    async def release(self, pool, tick, buckets):
+        """Рассылка вёдер упала – отпустить их, чтобы проход по брошенным ведрам разослал минуту заново."""
+        self._done(tick, buckets)
+        await release_dispatch_buckets(pool, tick, self.replica_id, sorted(buckets))
+
+    async def stale_claims(self, pool, tick):
+        """Незавершённые ведра с истёкшей арендой за DISPATCH_ORPHAN_WINDOW_MINUTES минут до tick."""
+        since = tick - timedelta(minutes=DISPATCH_ORPHAN_WINDOW_MINUTES)
+        return await get_stale_dispatch_claims(pool, since)
+
+    def is_warm(self, user_id):
+        """Отметки пользователя загружены в индекс просмотренных."""
+        return bucket_of(user_id, self.bucket_count) in self._warm
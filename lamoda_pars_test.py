@@ -1,5 +1,6 @@
 import os
 from service_parsers.lamoda_discount_parser import parse_lamoda_discounts
+from service_parsers.normalize import format_percent, format_price
 
 # URL для теста (например, мужская одежда)
 LAMODA_URL = "https://www.lamoda.kz/c/4152/default-men/?is_sale=1&display_locations=outlet"
@@ -16,13 +17,13 @@ def test_lamoda_parser(url):
         print(f"\n✅ Найдено товаров: {len(discounts)}")
         
         for item in discounts[:10]:  # Выводим первые 10 товаров для проверки
-            print(f"\n🔹 Бренд: {item['brand']}")
-            print(f"   📌 Название: {item['name']}")
-            print(f"   💰 Цена: {item['price']}")
-            print(f"   💸 Старая цена: {item['old_price']}")
-            print(f"   📉 Скидка: {item['discount']}")
-            print(f"   ⭐ Рейтинг: {item['rating']}")
-            print(f"   📏 Размеры: {item['sizes']}")
+            print(f"\n🔹 Бренд: {item.brand}")
+            print(f"   📌 Название: {item.name}")
+            print(f"   💰 Цена: {format_price(item.price_minor)}")
+            print(f"   💸 Старая цена: {format_price(item.old_price_minor)}")
+            print(f"   📉 Скидка: {format_percent(item.discount_percent)}")
+            print(f"   ⭐ Рейтинг: {item.rating}")
+            print(f"   📏 Размеры: {item.sizes}")
             print("---------------------------")
     except Exception as e:
         print(f"Ошибка при выполнении парсинга: {e}")
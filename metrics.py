@@ -0,0 +1,269 @@
+# metrics.py – Счётчики и гистограммы задержек с HTTP-выдачей в формате Prometheus
+import functools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Порты HTTP-выдачи метрик (0 – не запускать)
+SCHEDULER_METRICS_PORT = int(os.getenv("SCHEDULER_METRICS_PORT", "9108"))
+BOT_METRICS_PORT = int(os.getenv("BOT_METRICS_PORT", "9109"))
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "9110"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+# Границы корзин по умолчанию (секунды): от быстрых запросов к базе до загрузки страниц в Chrome
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Метрика {self.name} ожидает метки {self.labelnames}, получено {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+            lines.extend(self._render_samples(items))
+        return lines
+
+
+class Counter(_Metric):
+    """Монотонно растущий счётчик."""
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _render_samples(self, items):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """Текущее значение; может вычисляться функцией в момент выдачи метрик."""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._functions = {}
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function, **labels):
+        """Значение берётся из function() при каждой выдаче метрик."""
+        key = self._key(labels)
+        with self._lock:
+            self._functions[key] = function
+
+    def _render_samples(self, items):
+        values = dict(items)
+        for key, function in self._functions.items():
+            try:
+                values[key] = function()
+            except Exception:
+                continue
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    """Распределение значений (обычно длительностей в секундах) по корзинам."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0, 0.0]  # корзины, count, sum
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][index] += 1
+                    break
+            state[1] += 1
+            state[2] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Замер длительности блока (в том числе с await внутри)."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels):
+        state = self._values.get(self._key(labels))
+        return state[1] if state else 0
+
+    def _render_samples(self, items):
+        lines = []
+        for key, (bucket_counts, count, total) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(float(bound)))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key, [("le", "+Inf")])
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_count{labels} {count}")
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        return lines
+
+
+def render():
+    """Все метрики процесса в текстовом формате Prometheus."""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ======= 📈 Метрики проекта ======= #
+# Парсинг
+PAGE_LOAD_SECONDS = Histogram("page_load_seconds", "Загрузка одной страницы каталога", ("host", "mode"))
+PAGE_LOAD_ERRORS = Counter("page_load_errors_total", "Неудачные загрузки страниц", ("host", "mode"))
+PRODUCTS_EXTRACTED = Counter("products_extracted_total", "Товаров извлечено со страниц", ("store", "source"))
+DRIVER_WAIT_SECONDS = Histogram("driver_pool_wait_seconds", "Ожидание свободного браузера в пуле")
+DRIVER_RECYCLED = Counter("driver_recycled_total", "Пересозданные браузеры", ("reason",))
+
+# База данных
+DB_QUERY_SECONDS = Histogram("db_query_seconds", "Длительность операций с базой", ("query",))
+DB_POOL_WAIT_SECONDS = Histogram("db_pool_wait_seconds", "Ожидание соединения из пула asyncpg")
+DB_POOL_CONNECTIONS = Gauge("db_pool_connections", "Соединения пула asyncpg", ("state",))
+DB_POOL_ACQUIRE_TIMEOUTS = Counter("db_pool_acquire_timeouts_total", "Соединение из пула не получено за отведённое время")
+DB_ROWS = Counter("db_rows_total", "Строки parsed_discounts по результату записи", ("service", "op"))
+
+# Рассылка
+TELEGRAM_SEND_SECONDS = Histogram("telegram_send_seconds", "Вызов sendMessage (без ожидания лимитов)")
+TELEGRAM_MESSAGES = Counter("telegram_messages_total", "Сообщения Telegram", ("status",))
+TELEGRAM_RETRIES = Counter("telegram_retries_total", "Повторы отправки", ("reason",))
+DISPATCH_REPLICAS = Gauge("dispatch_replicas", "Живые реплики планировщика (шардированная рассылка)")
+DISPATCH_BUCKETS = Gauge("dispatch_buckets", "Ведра пользователей этой реплики", ("state",))
+
+# Бот
+BOT_HANDLER_SECONDS = Histogram("bot_handler_seconds", "Длительность обработчиков бота", ("handler",))
+BOT_HANDLER_ERRORS = Counter("bot_handler_errors_total", "Необработанные ошибки в обработчиках", ("handler",))
+
+# Задания планировщика
+JOB_SECONDS = Histogram("job_seconds", "Длительность заданий планировщика и их этапов", ("job",))
+JOB_RUNS = Counter("job_runs_total", "Запуски заданий планировщика", ("job", "status"))
+
+
+@contextmanager
+def span(job):
+    """Лёгкий span вокруг задания или этапа: длительность, статус и строка в debug-логе."""
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        JOB_SECONDS.observe(elapsed, job=job)
+        JOB_RUNS.inc(job=job, status=status)
+        logger.debug(f"⏱️ {job}: {elapsed * 1000:.1f} мс ({status})")
+
+
+def instrument_handler(handler):
+    """Декоратор обработчика бота: длительность и необработанные ошибки."""
+    name = handler.__name__
+
+    @functools.wraps(handler)
+    async def wrapper(*args, **kwargs):
+        with BOT_HANDLER_SECONDS.time(handler=name):
+            try:
+                return await handler(*args, **kwargs)
+            except Exception:
+                BOT_HANDLER_ERRORS.inc(handler=name)
+                raise
+
+    return wrapper
+
+
+# ======= 🌐 HTTP-выдача ======= #
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Не засоряем логи запросами Prometheus
+
+
+def start_metrics_server(port, host=METRICS_HOST):
+    """Запускает /metrics в фоновом потоке; port=0 – метрики только в памяти."""
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        logger.warning(f"Не удалось запустить сервер метрик на {host}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info(f"📈 Метрики доступны на http://{host}:{port}/metrics")
+    return server
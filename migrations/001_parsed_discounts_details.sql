@@ -0,0 +1,6 @@
+-- 001: категория и детали товара в parsed_discounts (для выдачи бота из базы)
+ALTER TABLE parsed_discounts
+    ADD COLUMN IF NOT EXISTS category VARCHAR(50),   -- Категория (women/men/kids для Lamoda)
+    ADD COLUMN IF NOT EXISTS brand VARCHAR(255),     -- Бренд
+    ADD COLUMN IF NOT EXISTS rating VARCHAR(50),     -- Рейтинг
+    ADD COLUMN IF NOT EXISTS sizes TEXT;             -- Размеры через запятую
@@ -0,0 +1,13 @@
+-- 002: индексы для планирования рассылки одним запросом
+-- Подписки на конкретную минуту
+CREATE INDEX IF NOT EXISTS idx_subscriptions_notification_time
+    ON subscriptions (notification_time);
+
+-- Скидки сервиса выше порога пользователя (диапазонный поиск по проценту)
+CREATE INDEX IF NOT EXISTS idx_parsed_discounts_service_percent
+    ON parsed_discounts (service_id, discount_percent);
+
+-- Проверка «уже отправлено» использует UNIQUE(user_id, service_id, discount_id);
+-- отдельный индекс по discount_id нужен для каскадного удаления скидок
+CREATE INDEX IF NOT EXISTS idx_sent_discounts_discount_id
+    ON sent_discounts (discount_id);
@@ -0,0 +1,32 @@
+-- 003: уведомления об изменении подписок (LISTEN/NOTIFY для индекса времени рассылки)
+CREATE OR REPLACE FUNCTION notify_subscription_changed() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND (
+        TG_OP = 'DELETE' OR OLD.user_id <> NEW.user_id OR OLD.service_id <> NEW.service_id
+    ) THEN
+        PERFORM pg_notify('subscriptions_changed', json_build_object(
+            'op', 'delete',
+            'user_id', OLD.user_id,
+            'service_id', OLD.service_id
+        )::text);
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM pg_notify('subscriptions_changed', json_build_object(
+            'op', 'upsert',
+            'user_id', NEW.user_id,
+            'service_id', NEW.service_id,
+            'notification_time', to_char(NEW.notification_time, 'HH24:MI'),
+            'discount_threshold', NEW.discount_threshold
+        )::text);
+        RETURN NEW;
+    END IF;
+
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS subscriptions_changed ON subscriptions;
+CREATE TRIGGER subscriptions_changed
+    AFTER INSERT OR UPDATE OR DELETE ON subscriptions
+    FOR EACH ROW EXECUTE FUNCTION notify_subscription_changed();
@@ -0,0 +1,10 @@
+-- 004: отпечаток содержимого товара и признак активности для инкрементальной записи
+ALTER TABLE parsed_discounts
+    ADD COLUMN IF NOT EXISTS content_hash CHAR(32),                -- MD5 полей товара
+    ADD COLUMN IF NOT EXISTS is_active BOOLEAN NOT NULL DEFAULT TRUE, -- Товар есть на сайте
+    ADD COLUMN IF NOT EXISTS deactivated_at TIMESTAMP;             -- Когда товар пропал с сайта
+
+-- Рассылка и бот смотрят только на активные товары
+DROP INDEX IF EXISTS idx_parsed_discounts_service_percent;
+CREATE INDEX IF NOT EXISTS idx_parsed_discounts_service_percent
+    ON parsed_discounts (service_id, discount_percent) WHERE is_active;
@@ -0,0 +1,18 @@
+-- 005: цены в тиынах (BIGINT) вместо строк "12 990 ₸"
+ALTER TABLE parsed_discounts
+    ALTER COLUMN price_new TYPE BIGINT USING ROUND(
+        NULLIF(regexp_replace(replace(price_new, ',', '.'), '[^0-9.]', '', 'g'), '')::NUMERIC * 100
+    )::BIGINT,
+    ALTER COLUMN price_old TYPE BIGINT USING ROUND(
+        NULLIF(regexp_replace(replace(price_old, ',', '.'), '[^0-9.]', '', 'g'), '')::NUMERIC * 100
+    )::BIGINT;
+
+COMMENT ON COLUMN parsed_discounts.price_new IS 'Новая цена в тиынах';
+COMMENT ON COLUMN parsed_discounts.price_old IS 'Старая цена в тиынах';
+
+-- Отпечаток теперь считается по числовым полям – пересчитается при следующем парсинге
+UPDATE parsed_discounts SET content_hash = NULL;
+
+-- Фильтр по порогу скидки – диапазонный поиск по индексу (создан в 002/004)
+CREATE INDEX IF NOT EXISTS idx_parsed_discounts_service_percent
+    ON parsed_discounts (service_id, discount_percent) WHERE is_active;
@@ -0,0 +1,59 @@
+-- 006: sent_discounts секционируется по месяцам (sent_at); старые секции удаляет планировщик
+BEGIN;
+
+-- Создание секции месяца (используется миграцией, base_stracture.sql и заданием хранения в планировщике)
+CREATE OR REPLACE FUNCTION create_sent_discounts_partition(month DATE) RETURNS TEXT AS $$
+DECLARE
+    start_at DATE := date_trunc('month', month)::DATE;
+    partition_name TEXT := format('sent_discounts_p%s', to_char(start_at, 'YYYYMM'));
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF sent_discounts FOR VALUES FROM (%L) TO (%L)',
+        partition_name, start_at, (start_at + INTERVAL '1 month')::DATE
+    );
+    RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Старая таблица переименовывается вместе с именами, которые займёт новая
+ALTER TABLE sent_discounts RENAME TO sent_discounts_legacy;
+ALTER TABLE sent_discounts_legacy RENAME CONSTRAINT sent_discounts_pkey TO sent_discounts_legacy_pkey;
+ALTER SEQUENCE sent_discounts_sent_id_seq RENAME TO sent_discounts_legacy_sent_id_seq;
+ALTER INDEX IF EXISTS idx_sent_discounts_discount_id RENAME TO idx_sent_discounts_legacy_discount_id;
+
+-- Уникальность (user_id, service_id, discount_id) без sent_at на секционированной таблице невозможна –
+-- повторы отсекает запрос вставки (NOT EXISTS под advisory-блокировкой ведра пользователей, db.lock_sent_buckets),
+-- проверка «видел ли» идёт по индексу idx_sent_discounts_seen
+CREATE TABLE sent_discounts (
+    sent_id BIGSERIAL,
+    user_id BIGINT NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    service_id INT NOT NULL REFERENCES services(service_id) ON DELETE CASCADE,
+    discount_id INT NOT NULL REFERENCES parsed_discounts(discount_id) ON DELETE CASCADE,
+    sent_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (sent_id, sent_at)
+) PARTITION BY RANGE (sent_at);
+
+CREATE INDEX idx_sent_discounts_seen ON sent_discounts (user_id, service_id, discount_id);
+-- Каскадное удаление при очистке parsed_discounts
+CREATE INDEX idx_sent_discounts_discount_id ON sent_discounts (discount_id);
+
+-- Секции для всех месяцев со старыми данными и на два месяца вперёд
+SELECT create_sent_discounts_partition(month::DATE)
+FROM generate_series(
+    date_trunc('month', COALESCE((SELECT MIN(sent_at) FROM sent_discounts_legacy), NOW())),
+    date_trunc('month', NOW()) + INTERVAL '2 months',
+    INTERVAL '1 month'
+) AS month;
+
+INSERT INTO sent_discounts (user_id, service_id, discount_id, sent_at)
+SELECT user_id, service_id, discount_id, COALESCE(sent_at, NOW())
+FROM sent_discounts_legacy
+WHERE user_id IS NOT NULL AND service_id IS NOT NULL AND discount_id IS NOT NULL;
+
+DROP TABLE sent_discounts_legacy;
+
+-- Очистка давно пропавших товаров (каскадом удаляет их отправки)
+CREATE INDEX IF NOT EXISTS idx_parsed_discounts_deactivated_at
+    ON parsed_discounts (deactivated_at) WHERE NOT is_active;
+
+COMMIT;
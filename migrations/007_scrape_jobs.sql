@@ -0,0 +1,41 @@
+-- 007: очередь парсинга для нескольких воркеров (worker.py)
+-- scrape_crawls – обход одного каталога (магазин, категория, город), scrape_jobs – его страницы
+CREATE TABLE IF NOT EXISTS scrape_crawls (
+    crawl_id BIGSERIAL PRIMARY KEY,
+    service_name VARCHAR(50) NOT NULL,
+    category VARCHAR(50),
+    city VARCHAR(50),
+    url TEXT NOT NULL,                          -- Первая страница каталога
+    max_pages INT NOT NULL DEFAULT 1,
+    status VARCHAR(16) NOT NULL DEFAULT 'pending',  -- pending | ingesting | done | failed
+    error TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    finished_at TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS scrape_jobs (
+    job_id BIGSERIAL PRIMARY KEY,
+    crawl_id BIGINT NOT NULL REFERENCES scrape_crawls(crawl_id) ON DELETE CASCADE,
+    page INT NOT NULL,
+    url TEXT NOT NULL,
+    probe BOOLEAN NOT NULL DEFAULT FALSE,       -- Страница без пагинации: продолжать, пока приходят новые товары
+    status VARCHAR(16) NOT NULL DEFAULT 'pending',  -- pending | running | done | failed
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 3,
+    worker_id TEXT,
+    available_at TIMESTAMP NOT NULL DEFAULT NOW(),  -- Повтор после ошибки – не раньше этого времени
+    heartbeat_at TIMESTAMP,
+    lease_expires_at TIMESTAMP,                 -- Воркер не продлил аренду – задание заберёт другой
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    products INT,
+    result BYTEA,                               -- ProductBatch.to_bytes()
+    error TEXT,
+    UNIQUE (crawl_id, page)
+);
+
+-- Выборка заданий: свободные и с истёкшей арендой
+CREATE INDEX IF NOT EXISTS idx_scrape_jobs_pending ON scrape_jobs (available_at) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_scrape_jobs_running ON scrape_jobs (lease_expires_at) WHERE status = 'running';
+CREATE INDEX IF NOT EXISTS idx_scrape_crawls_open ON scrape_crawls (service_name, category, city)
+    WHERE status IN ('pending', 'ingesting');
@@ -0,0 +1,22 @@
+-- 008: шардирование рассылки между репликами планировщика (DISPATCH_MODE=sharded)
+-- scheduler_replicas – живые реплики (аренда с heartbeat), dispatch_claims – кто обработал ведро пользователей в минуту
+CREATE TABLE IF NOT EXISTS scheduler_replicas (
+    replica_id TEXT PRIMARY KEY,
+    started_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    heartbeat_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    lease_expires_at TIMESTAMP NOT NULL         -- Реплика не продлила аренду – её ведра делятся между остальными
+);
+
+CREATE TABLE IF NOT EXISTS dispatch_claims (
+    tick TIMESTAMP NOT NULL,                    -- Минута рассылки (время Алматы)
+    bucket INT NOT NULL,                        -- Ведро пользователей: user_id % DISPATCH_BUCKET_COUNT
+    replica_id TEXT NOT NULL,
+    claimed_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    finished_at TIMESTAMP,                      -- Рассылка ведра завершена и отмечена в sent_discounts
+    PRIMARY KEY (tick, bucket)
+);
+
+-- Незавершённые ведра: новый владелец ждёт их перед загрузкой отметок в память
+CREATE INDEX IF NOT EXISTS idx_dispatch_claims_unfinished ON dispatch_claims (bucket) WHERE finished_at IS NULL;
+-- Ведра, которые брали другие реплики (проверка прогретых вёдер)
+CREATE INDEX IF NOT EXISTS idx_dispatch_claims_bucket ON dispatch_claims (bucket, claimed_at);
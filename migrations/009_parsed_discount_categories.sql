@@ -0,0 +1,30 @@
+-- 009: товар – одна строка на (сервис, бренд, название); категории товара – в отдельной таблице
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS parsed_discount_categories (
+    discount_id INT NOT NULL REFERENCES parsed_discounts(discount_id) ON DELETE CASCADE,
+    category VARCHAR(50) NOT NULL,         -- Категория (women/men/kids для Lamoda)
+    PRIMARY KEY (discount_id, category)
+);
+
+INSERT INTO parsed_discount_categories (discount_id, category)
+SELECT discount_id, category
+FROM parsed_discounts
+WHERE category IS NOT NULL AND is_active
+ON CONFLICT DO NOTHING;
+
+-- Снимок бота по категории
+CREATE INDEX IF NOT EXISTS idx_parsed_discount_categories_category
+    ON parsed_discount_categories (category, discount_id);
+
+-- Уникальность по названию склеивала товары разных брендов с одинаковым названием
+ALTER TABLE parsed_discounts DROP CONSTRAINT IF EXISTS parsed_discounts_service_id_product_name_key;
+CREATE UNIQUE INDEX IF NOT EXISTS uq_parsed_discounts_product
+    ON parsed_discounts (service_id, (COALESCE(brand, '')), product_name);
+
+ALTER TABLE parsed_discounts DROP COLUMN IF EXISTS category;
+
+-- Отпечаток больше не включает категорию – пересчитается при следующем парсинге
+UPDATE parsed_discounts SET content_hash = NULL;
+
+COMMIT;
@@ -0,0 +1,2 @@
+-- 010: догрузка индекса просмотренных перечитывает отметки последних минут по sent_at
+CREATE INDEX IF NOT EXISTS idx_sent_discounts_sent_at ON sent_discounts (sent_at);
@@ -0,0 +1,6 @@
+-- 011: аренда ведра рассылки – владелец продлевает её, пока рассылает; незавершённое ведро
+-- с истёкшей арендой забирает другая реплика (в том числе за прошедшие минуты)
+ALTER TABLE dispatch_claims ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMP NOT NULL DEFAULT NOW();
+
+-- Поиск брошенных вёдер за последние минуты
+CREATE INDEX IF NOT EXISTS idx_dispatch_claims_stale ON dispatch_claims (tick) WHERE finished_at IS NULL;
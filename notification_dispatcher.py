@@ -0,0 +1,205 @@
+# notification_dispatcher.py – Параллельная рассылка сообщений с учётом лимитов Telegram
+import asyncio
+import logging
+import os
+import random
+import time
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+from metrics import TELEGRAM_MESSAGES, TELEGRAM_RETRIES, TELEGRAM_SEND_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Максимальная длина одного сообщения Telegram
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+# Лимиты Telegram Bot API (можно переопределить через .env)
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))      # Сообщений в секунду на бота
+TELEGRAM_PER_CHAT_RATE = float(os.getenv("TELEGRAM_PER_CHAT_RATE", "1"))   # Сообщений в секунду в один чат
+DISPATCH_CONCURRENCY = int(os.getenv("DISPATCH_CONCURRENCY", "30"))       # Одновременных отправок
+DISPATCH_MAX_RETRIES = int(os.getenv("DISPATCH_MAX_RETRIES", "5"))        # Повторов на одно сообщение
+DISPATCH_MAX_BACKOFF = 30                                                  # Максимальная пауза между повторами, сек
+
+
+def split_message(text, limit=TELEGRAM_MESSAGE_LIMIT):
+    """
+    Делит текст на части не длиннее limit символов.
+    Старается резать по переводам строк, слишком длинные строки режет жёстко.
+    """
+    if len(text) <= limit:
+        return [text]
+
+    chunks = []
+    current = ""
+    for line in text.splitlines(keepends=True):
+        while len(line) > limit:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:limit])
+            line = line[limit:]
+        if len(current) + len(line) > limit:
+            chunks.append(current)
+            current = ""
+        current += line
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class TokenBucket:
+    """Асинхронное «ведро с токенами»: не больше rate операций в секунду."""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+
+    def pause(self, seconds):
+        """Не выдавать токены seconds секунд (Telegram ответил RetryAfter)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        """Дождаться свободного токена и забрать его."""
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class Delivery:
+    """
+    Одно уведомление: получатель, текст и отправленные в нём скидки.
+    ends: для каждой скидки из sent – позиция в text, где заканчивается её блок;
+          по ней видно, какие скидки успели уйти, если отправка оборвалась на середине.
+    """
+
+    __slots__ = ("chat_id", "text", "sent", "ends")
+
+    def __init__(self, chat_id, text, sent=(), ends=None):
+        self.chat_id = chat_id
+        self.text = text
+        self.sent = sent  # Кортежи (user_id, service_id, discount_id)
+        self.ends = ends
+
+
+class DeliveryResult:
+    """
+    Результат доставки уведомления.
+    delivered_chars: сколько символов текста доставлено (части уходят по порядку).
+    """
+
+    __slots__ = ("delivery", "ok", "error", "delivered_chars")
+
+    def __init__(self, delivery, ok, error=None, delivered_chars=None):
+        self.delivery = delivery
+        self.ok = ok
+        self.error = error
+        self.delivered_chars = len(delivery.text) if delivered_chars is None else delivered_chars
+
+    @property
+    def partial(self):
+        """Часть сообщения доставлена, остальное – нет."""
+        return not self.ok and self.delivered_chars > 0
+
+    @property
+    def sent(self):
+        """Скидки, которые пользователь действительно получил (целиком попали в доставленные части)."""
+        if self.ok:
+            return self.delivery.sent
+        if not self.delivered_chars or self.delivery.ends is None:
+            return ()
+        return [item for item, end in zip(self.delivery.sent, self.delivery.ends) if end <= self.delivered_chars]
+
+
+class NotificationDispatcher:
+    """
+    Рассылка уведомлений с ограниченной параллельностью.
+    Соблюдает общий лимит бота и лимит на чат, повторяет отправку
+    после RetryAfter и сетевых ошибок, делит длинные сообщения на части.
+    """
+
+    def __init__(self, bot, concurrency=DISPATCH_CONCURRENCY, global_rate=TELEGRAM_GLOBAL_RATE,
+                 per_chat_rate=TELEGRAM_PER_CHAT_RATE, max_retries=DISPATCH_MAX_RETRIES):
+        self._bot = bot
+        self.concurrency = concurrency
+        self.per_chat_rate = per_chat_rate
+        self.max_retries = max_retries
+        self._global_bucket = TokenBucket(global_rate)
+        self._chat_buckets = {}
+
+    def set_global_rate(self, rate):
+        """Изменить общий лимит (например, доля лимита бота при нескольких репликах)."""
+        self._global_bucket.rate = rate
+
+    async def dispatch(self, deliveries):
+        """Отправить все уведомления тика; возвращает список DeliveryResult."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run(delivery):
+            async with semaphore:
+                return await self._deliver(delivery)
+
+        try:
+            return await asyncio.gather(*(run(delivery) for delivery in deliveries))
+        finally:
+            self._chat_buckets.clear()
+
+    async def _deliver(self, delivery):
+        delivered_chars = 0
+        try:
+            for chunk in split_message(delivery.text):
+                await self._send_chunk(delivery.chat_id, chunk)
+                delivered_chars += len(chunk)
+        except Exception as e:
+            logger.warning(
+                f"Не удалось доставить уведомление пользователю {delivery.chat_id} "
+                f"(доставлено {delivered_chars} из {len(delivery.text)} символов): {e}"
+            )
+            return DeliveryResult(delivery, ok=False, error=e, delivered_chars=delivered_chars)
+        return DeliveryResult(delivery, ok=True)
+
+    async def _send_chunk(self, chat_id, text):
+        chat_bucket = self._chat_buckets.get(chat_id)
+        if chat_bucket is None:
+            chat_bucket = self._chat_buckets[chat_id] = TokenBucket(self.per_chat_rate)
+
+        attempt = 0
+        while True:
+            await chat_bucket.acquire()
+            await self._global_bucket.acquire()
+            try:
+                with TELEGRAM_SEND_SECONDS.time():
+                    await self._bot.send_message(chat_id=chat_id, text=text)
+                TELEGRAM_MESSAGES.inc(status="sent")
+                return
+            except RetryAfter as e:
+                # Telegram сам говорит, сколько ждать; лимит общий на бота – ждут все чаты
+                delay = e.retry_after
+                self._global_bucket.pause(delay)
+                reason = "retry_after"
+            except (Forbidden, BadRequest):
+                # Пользователь заблокировал бота или чат недоступен – повтор не поможет
+                TELEGRAM_MESSAGES.inc(status="rejected")
+                raise
+            except NetworkError:
+                delay = min(2 ** attempt, DISPATCH_MAX_BACKOFF) + random.uniform(0, 1)
+                reason = "network"
+
+            attempt += 1
+            if attempt > self.max_retries:
+                TELEGRAM_MESSAGES.inc(status="failed")
+                raise RuntimeError(f"Превышено число повторов ({self.max_retries}) для чата {chat_id}")
+            TELEGRAM_RETRIES.inc(reason=reason)
+            logger.info(f"⏳ Повтор отправки в чат {chat_id} через {delay:.1f} сек. (попытка {attempt})")
+            await asyncio.sleep(delay)
@@ -1,24 +1,67 @@
 # scheduler.py – Планировщик рассылок скидок пользователям
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import groupby
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from datetime import datetime
 import pytz
 import logging
+import numpy as np
 from db import (
     connect_db,
-    get_subscriptions_for_notifications,
-    get_unseen_discounts,
-    mark_discounts_as_sent,
+    connect_listener,
+    drop_expired_sent_partitions,
+    enqueue_crawls,
+    ensure_sent_partitions,
+    get_active_discounts,
+    get_service_names,
+    mark_discounts_as_sent_bulk,
+    plan_notifications,
+    purge_dispatch_claims,
+    purge_finished_crawls,
+    purge_inactive_discounts,
     update_parsed_discounts
 )
-from service_parsers.lamoda_discount_parser import parse_lamoda_discounts
-from service_parsers.magnum_discount_parser import parse_magnum_discounts
+from service_parsers.records import ProductBatch
+from service_parsers.driver_pool import DRIVER_POOL_SIZE, shutdown_driver_pool
+from service_parsers.crawler import CRAWL_MAX_PAGES, CrawlIncomplete
+from service_parsers.http_fetch import FETCH_MODE
+from service_parsers.normalize import format_price
+from service_parsers.sources import SOURCES
+from notification_dispatcher import TELEGRAM_GLOBAL_RATE, Delivery, NotificationDispatcher
+from dispatch_shards import (
+    DISPATCH_MODE,
+    DISPATCH_ORPHAN_SECOND,
+    REPLICA_HEARTBEAT_SECONDS,
+    ShardCoordinator,
+    bucket_of
+)
+from metrics import SCHEDULER_METRICS_PORT, span, start_metrics_server
+from scripts.filter_discounts import ThresholdMatcher, match_subscriptions
+from seen_index import SEEN_INDEX_SNAPSHOT, SEEN_INDEX_SNAPSHOT_MINUTES, SeenIndex
+from subscription_index import SubscriptionTimeWheel
 from telegram import Bot
 import os
+import sys
 
 # Загрузка токена для отправки уведомлений
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 bot = Bot(token=BOT_TOKEN)
+dispatcher = NotificationDispatcher(bot)
+
+# Индекс подписок по минутам суток – пустые минуты не ходят в базу
+subscription_index = SubscriptionTimeWheel()
+
+# Кому какие скидки уже отправлены – непросмотренное считается в памяти
+seen_index = SeenIndex()
+
+def share_telegram_rate(coordinator):
+    """Лимит Telegram общий на бота – делим его между живыми репликами."""
+    dispatcher.set_global_rate(TELEGRAM_GLOBAL_RATE / max(len(coordinator.replicas), 1))
+
+# Несколько реплик планировщика делят пользователей по ведрам (DISPATCH_MODE=sharded)
+shards = ShardCoordinator(on_rebalance=share_telegram_rate) if DISPATCH_MODE == "sharded" else None
 
 # Часовой пояс Алматы (UTC+6)
 almaty_timezone = pytz.timezone('Asia/Almaty')
@@ -30,93 +73,362 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# URL для парсинга
-MAGNUM_URL = "https://magnum.kz/catalog?discountType=all&city=almaty"
-LAMODA_URLS = {
-    "women": "https://www.lamoda.kz/c/4153/default-women/?is_sale=1",
-    "men": "https://www.lamoda.kz/c/4152/default-men/?is_sale=1",
-    "kids": "https://www.lamoda.kz/c/4154/default-kids/?is_sale=1"
-}
+# Где парсить: local – в этом процессе, queue – поставить страницы в очередь для воркеров (worker.py)
+SCRAPE_MODE = os.getenv("SCRAPE_MODE", "local")
+
+# Как часто полностью перечитывать подписки в индекс (минуты)
+SUBSCRIPTION_INDEX_RELOAD_MINUTES = int(os.getenv("SUBSCRIPTION_INDEX_RELOAD_MINUTES", "15"))
+
+# Сколько источников парсится одновременно (по умолчанию – по числу браузеров в пуле)
+PARSER_CONCURRENCY = int(os.getenv("PARSER_CONCURRENCY", str(DRIVER_POOL_SIZE)))
+
+# Парсеры Selenium блокирующие – выполняем их в отдельных потоках, а не в цикле asyncio
+parser_executor = ThreadPoolExecutor(max_workers=PARSER_CONCURRENCY, thread_name_prefix="parser")
 
 # ======= 🚀 Функции парсинга ======= #
-async def parse_and_update_discounts(pool):
-    """Парсинг скидок и обновление базы."""
+def build_parse_jobs():
+    """Список источников для парсинга: (сервис, категория, парсер, URL)."""
+    return [(source.service_name, source.category, source.parse, source.url) for source in SOURCES]
+
+async def run_parse_job(service_name, category, parser, url, mode=FETCH_MODE):
+    """
+    Запускает блокирующий парсер в пуле потоков и возвращает его результат.
+    complete – обход загрузил все страницы (только тогда по нему отключаются пропавшие товары).
+    """
+    loop = asyncio.get_running_loop()
+    complete = True
+    try:
+        # Обходим все страницы каталога, а не только первую
+        with span(f"parse:{service_name}:{category or 'all'}"):
+            discounts = await loop.run_in_executor(parser_executor, partial(parser, url, mode=mode, max_pages=CRAWL_MAX_PAGES))
+    except CrawlIncomplete as e:
+        logger.warning(f"⚠️ Неполный обход {service_name} ({category or 'все'}): {e}; пропавшие товары не отключаются")
+        discounts, complete = e.products, False
+    except Exception as e:
+        logger.error(f"Ошибка при парсинге {service_name} ({category or 'все'}): {e}")
+        discounts = ProductBatch()
+    return service_name, category, discounts, complete
+
+async def parse_and_update_discounts(pool, mode=FETCH_MODE):
+    """
+    Параллельный парсинг всех источников и обновление базы по мере готовности.
+    mode: режим загрузки страниц (replay – повторный разбор страниц из кэша).
+    """
     try:
-        logger.info("Начинается плановый парсинг скидок...")
-        
-        # 1️⃣ Парсинг Lamoda
-        for category_name, url in LAMODA_URLS.items():
-            lamoda_discounts = parse_lamoda_discounts(url)
-            if lamoda_discounts:
-                await update_parsed_discounts(pool, "Lamoda", lamoda_discounts)
-                logger.info(f"✅ Обновлены скидки для Lamoda ({category_name})")
-
-        # 2️⃣ Парсинг Magnum
-        magnum_discounts = parse_magnum_discounts(MAGNUM_URL)
-        if magnum_discounts:
-            await update_parsed_discounts(pool, "Magnum", magnum_discounts)
-            logger.info("✅ Обновлены скидки для Magnum")
-
-        logger.info("✅ Парсинг скидок завершен.")
+        with span("daily_parsing"):
+            logger.info("Начинается плановый парсинг скидок...")
+
+            tasks = [
+                asyncio.create_task(run_parse_job(service_name, category, parser, url, mode))
+                for service_name, category, parser, url in build_parse_jobs()
+            ]
+
+            # Каждый источник записываем в базу сразу, как только он готов
+            for next_done in asyncio.as_completed(tasks):
+                service_name, category, discounts, complete = await next_done
+                if not discounts:
+                    continue
+                try:
+                    with span(f"ingest:{service_name}:{category or 'all'}"):
+                        counts = await update_parsed_discounts(
+                            pool, service_name, discounts, category=category, complete=complete
+                        )
+                    logger.info(
+                        f"✅ Обновлены скидки для {service_name} ({category or 'все'}): "
+                        f"новых {counts['inserted']}, изменённых {counts['updated']}, "
+                        f"без изменений {counts['unchanged']}, пропало {counts['deactivated']}"
+                    )
+                except Exception as e:
+                    logger.error(f"Ошибка при сохранении скидок {service_name} ({category or 'все'}): {e}")
+
+            logger.info("✅ Парсинг скидок завершен.")
     except Exception as e:
         logger.error(f"Ошибка при плановом парсинге: {e}")
 
+async def enqueue_parsing(pool):
+    """Плановый парсинг через очередь: обходы всех источников ставятся для воркеров."""
+    try:
+        with span("daily_parsing:enqueue"):
+            crawl_ids = await enqueue_crawls(pool, [
+                (source.service_name, source.category, source.city, source.url, CRAWL_MAX_PAGES)
+                for source in SOURCES
+            ])
+        logger.info(f"📥 В очередь парсинга поставлено обходов: {len(crawl_ids)} из {len(SOURCES)}")
+    except Exception as e:
+        logger.error(f"Ошибка при постановке парсинга в очередь: {e}")
+
 # ======= 📩 Функции рассылки ======= #
-async def send_discount_notifications(pool):
-    """Отправка уведомлений пользователям согласно их подпискам."""
+def build_delivery(user_id, service_id, service_name, discounts):
+    """
+    Уведомление одному пользователю по одной подписке.
+    discounts: кортежи (discount_id, название, цена, старая цена, процент); цены в тиынах.
+    """
+    if not discounts:
+        return Delivery(user_id, f"📭 Сегодня нет новых скидок по сервису {service_name}.")
+
+    # Формируем текст скидок (длинный текст диспетчер разобьёт на части)
+    message = f"🔥 Новые скидки на {service_name}:\n\n"
+    ends = []  # Где заканчивается блок каждой скидки – для частично доставленных сообщений
+    for _, product_name, price_new, price_old, discount_percent in discounts:
+        message += (
+            f"🛍️ {product_name}\n"
+            f"💰 Цена: {format_price(price_new)} (Старая: {format_price(price_old)})\n"
+            f"📉 Скидка: {discount_percent}%\n"
+            f"------------------------\n"
+        )
+        ends.append(len(message))
+    return Delivery(user_id, message, [(user_id, service_id, d[0]) for d in discounts], ends)
+
+async def plan_deliveries_in_memory(pool, subscriptions, refresh=True):
+    """
+    Уведомления минуты без запросов к sent_discounts: каталог активных скидок
+    сопоставляется со всеми порогами сразу (ThresholdMatcher), а просмотренное
+    вычитается по индексу seen_index.
+    refresh: догрузить отметки, сделанные не этим процессом (если они есть), по sent_id.
+    """
+    if refresh:
+        await seen_index.refresh(pool)
+
+    service_ids = {entry.service_id for entry in subscriptions}
+    service_names = await get_service_names(pool, service_ids)
+    rows = await get_active_discounts(pool, service_ids)
+    catalogs = {}
+    for service_id, service_rows in groupby(rows, key=lambda r: r['service_id']):
+        catalogs[service_id] = ProductBatch.from_rows(list(service_rows))
+    matchers = {service_id: ThresholdMatcher.from_batch(batch) for service_id, batch in catalogs.items()}
+
+    matches = match_subscriptions(matchers, (
+        {"user_id": entry.user_id, "service_id": entry.service_id,
+         "discount_threshold": entry.discount_threshold or 0}
+        for entry in subscriptions
+    ))
+
+    deliveries = []
+    for entry in sorted(subscriptions, key=lambda e: (e.user_id, e.service_id)):
+        discounts = []
+        matched = matches.get((entry.user_id, entry.service_id))
+        if matched is not None:
+            batch = catalogs[entry.service_id]
+            positions = matchers[entry.service_id].order[matched]
+            discount_ids = np.frombuffer(batch.discount_ids, dtype=np.int64)[positions]
+            for position in positions[seen_index.unseen_mask(entry.user_id, discount_ids)]:
+                record = batch[int(position)]
+                discounts.append((
+                    record.discount_id, record.name, record.price_minor,
+                    record.old_price_minor, record.discount_percent,
+                ))
+        deliveries.append(build_delivery(
+            entry.user_id, entry.service_id,
+            service_names.get(entry.service_id, str(entry.service_id)), discounts
+        ))
+    return deliveries
+
+async def plan_deliveries_from_db(pool, notification_time, user_ids):
+    """Уведомления минуты по одному запросу к базе (пока индекс просмотренных не загружен)."""
+    plan = await plan_notifications(pool, notification_time, user_ids)
+    service_names = await get_service_names(pool, {row['service_id'] for row in plan})
+    deliveries = []
+    for (user_id, service_id), rows in groupby(plan, key=lambda r: (r['user_id'], r['service_id'])):
+        discounts = [
+            (row['discount_id'], row['product_name'], row['price_new'], row['price_old'], row['discount_percent'])
+            for row in rows if row['discount_id'] is not None
+        ]
+        deliveries.append(build_delivery(
+            user_id, service_id, service_names.get(service_id, str(service_id)), discounts
+        ))
+    return deliveries
+
+async def plan_deliveries(pool, notification_time, user_ids):
+    """Уведомления минуты для user_ids: в памяти, если отметки пользователей загружены, иначе запросом к базе."""
+    if shards is None:
+        if seen_index.ready:
+            return await plan_deliveries_in_memory(pool, subscription_index.due(notification_time))
+        return await plan_deliveries_from_db(pool, notification_time, user_ids)
+
+    # Шардированная рассылка: прогретые ведра – в памяти, только что полученные – запросом к базе
+    warm = {user_id for user_id in user_ids if shards.is_warm(user_id)}
+    cold = [user_id for user_id in user_ids if user_id not in warm]
+    deliveries = []
+    if warm:
+        subscriptions = [entry for entry in subscription_index.due(notification_time) if entry.user_id in warm]
+        deliveries += await plan_deliveries_in_memory(pool, subscriptions, refresh=False)
+    if cold:
+        deliveries += await plan_deliveries_from_db(pool, notification_time, cold)
+    return deliveries
+
+async def send_discount_notifications(pool, orphans=False):
+    """
+    Отправка уведомлений пользователям согласно их подпискам.
+    orphans: проход шардированной рассылки по ведрам, которые никто не взял или бросил.
+    """
+    tick = datetime.now(almaty_timezone).replace(second=0, microsecond=0, tzinfo=None)
+    await dispatch_tick(pool, tick, orphans)
+    if not orphans:
+        return
+
+    # Ведра прошедших минут, которые взяла и не закончила упавшая реплика, рассылаются заново:
+    # уже отмеченные в sent_discounts скидки повторно не уйдут
     try:
-        now = datetime.now(almaty_timezone).strftime("%H:%M")
-        logger.info(f"🔔 Начинается рассылка уведомлений для времени {now}")
+        stale = await shards.stale_claims(pool, tick)
+    except Exception as e:
+        logger.error(f"Ошибка при поиске брошенных вёдер рассылки: {e}")
+        return
+    for stale_tick, buckets in stale.items():
+        if stale_tick < tick:
+            logger.warning(f"⚠️ Брошенные ведра рассылки за {stale_tick:%H:%M}: {len(buckets)}, рассылаем заново")
+            await dispatch_tick(pool, stale_tick, orphans, buckets)
+
+async def dispatch_tick(pool, tick, orphans=False, stale_buckets=None):
+    """
+    Рассылка уведомлений минуты tick.
+    stale_buckets: ведра прошедшей минуты, брошенные другой репликой.
+    """
+    # Все отправленные за тик скидки (user_id, service_id, discount_id) отмечаем одним запросом
+    sent = []
+    claimed = set()
+    failed = False
+    with span("notifications:orphans" if orphans else "notifications"):
+        try:
+            notification_time = tick.time()
+
+            user_ids = subscription_index.due_user_ids(notification_time)
+            if shards is not None:
+                # Каждое ведро минуты рассылает ровно одна реплика
+                claimed = await shards.claim(pool, tick, user_ids, orphans, stale_buckets)
+                user_ids = [user_id for user_id in user_ids if bucket_of(user_id) in claimed]
+            if not user_ids:
+                logger.debug(f"❎ Подписок для времени {tick:%H:%M} нет.")
+                return
+            logger.info(
+                f"🔔 Начинается рассылка уведомлений для времени {tick:%H:%M} ({len(user_ids)} польз."
+                + (f", вёдер {len(claimed)}" if claimed else "") + ")"
+            )
+
+            with span("notifications:plan"):
+                deliveries = await plan_deliveries(pool, notification_time, user_ids)
+            if not deliveries:
+                logger.info("❎ Подписок для текущего времени нет.")
+                return
 
-        subscriptions = await get_subscriptions_for_notifications(pool, now)
-        if not subscriptions:
-            logger.info("❎ Подписок для текущего времени нет.")
+            # Параллельная отправка с учётом лимитов Telegram
+            with span("notifications:dispatch"):
+                results = await dispatcher.dispatch(deliveries)
+            delivered = partial = 0
+            for result in results:
+                # Из оборванного на середине сообщения отмечаются только дошедшие скидки
+                sent.extend(result.sent)
+                delivered += result.ok
+                partial += result.partial
+            logger.info(
+                f"✅ Доставлено уведомлений: {delivered} из {len(results)}"
+                + (f", частично: {partial}" if partial else "")
+            )
+
+        except Exception as e:
+            failed = True
+            logger.error(f"Ошибка при рассылке уведомлений: {e}")
+        finally:
+            # Отмечаем отправленные скидки (в том числе если рассылка прервалась на середине)
+            if sent:
+                try:
+                    with span("notifications:mark"):
+                        marked = await mark_discounts_as_sent_bulk(pool, sent)
+                    seen_index.add_sent(sent)
+                    logger.info(f"📝 Отмечено отправленных скидок: {marked}")
+                except Exception as e:
+                    failed = True
+                    logger.error(f"Ошибка при отметке отправленных скидок: {e}")
+            # Ведра закрываются после отметки – новый владелец загрузит уже полные отметки.
+            # Упавшая рассылка отпускает ведра: проход по брошенным ведрам разошлёт минуту заново
+            if claimed:
+                try:
+                    if failed:
+                        await shards.release(pool, tick, claimed)
+                    else:
+                        await shards.finish(pool, tick, claimed)
+                except Exception as e:
+                    logger.error(f"Ошибка при закрытии вёдер рассылки: {e}")
+
+# ======= 🔀 Шардированная рассылка ======= #
+async def shard_heartbeat(pool):
+    """Продление аренды реплики, перестроение и прогрев вёдер."""
+    try:
+        await shards.heartbeat(pool, seen_index)
+    except Exception as e:
+        logger.error(f"Ошибка при продлении аренды реплики: {e}")
+
+def on_leader(job):
+    """
+    Общие задания (парсинг, хранение) при нескольких репликах выполняет одна –
+    первая по replica_id; в обычном режиме задание выполняется как есть.
+    """
+    async def run(pool):
+        if shards is not None and not shards.is_leader:
+            logger.debug(f"Задание {job.__name__} выполняет другая реплика")
             return
+        await job(pool)
+    return run
 
-        for sub in subscriptions:
-            user_id = sub['user_id']
-            service_name = sub['service_name']
-            service_id = sub['service_id']
-
-            discounts = await get_unseen_discounts(pool, user_id, service_id)
-            if not discounts:
-                await bot.send_message(
-                    chat_id=user_id,
-                    text=f"📭 Сегодня нет новых скидок по сервису {service_name}."
-                )
-                continue
-
-            # Формируем текст скидок
-            message = f"🔥 Новые скидки на {service_name}:\n\n"
-            discount_ids = []
-            for d in discounts:
-                message += (
-                    f"🛍️ {d['product_name']}\n"
-                    f"💰 Цена: {d['price_new']} (Старая: {d['price_old']})\n"
-                    f"📉 Скидка: {d['discount_percent']}%\n"
-                    f"------------------------\n"
-                )
-                discount_ids.append(d['discount_id'])
-
-            await bot.send_message(chat_id=user_id, text=message)
-
-            # Отмечаем отправленные скидки
-            await mark_discounts_as_sent(pool, user_id, service_id, discount_ids)
-            logger.info(f"✅ Отправлены скидки пользователю {user_id} для сервиса {service_name}")
+# ======= 🧹 Хранение данных ======= #
+async def run_retention(pool):
+    """Секции sent_discounts наперёд, удаление старых секций, давно пропавших товаров и обходов очереди."""
+    with span("retention"):
+        try:
+            await ensure_sent_partitions(pool)
+            for partition, carried in await drop_expired_sent_partitions(pool):
+                logger.info(f"🧹 Удалена секция {partition} (перенесено отметок активных товаров: {carried})")
+            purged = await purge_inactive_discounts(pool)
+            if purged:
+                logger.info(f"🧹 Удалено давно пропавших товаров: {purged}")
+            crawls = await purge_finished_crawls(pool)
+            if crawls:
+                logger.info(f"🧹 Удалено завершённых обходов очереди парсинга: {crawls}")
+            await purge_dispatch_claims(pool)
+        except Exception as e:
+            logger.error(f"Ошибка при очистке устаревших данных: {e}")
 
+async def reload_seen_index(pool):
+    """
+    Перечитать индекс просмотренных после хранения данных – на каждой реплике:
+    отметки удалённых секций и товаров уходят из памяти.
+    """
+    try:
+        if shards is not None:
+            await seen_index.reload(pool, shards.warm_buckets, shards.bucket_count)
+        elif seen_index.ready:
+            await seen_index.reload(pool)
     except Exception as e:
-        logger.error(f"Ошибка при рассылке уведомлений: {e}")
+        logger.error(f"Ошибка при перезагрузке индекса просмотренных скидок: {e}")
 
 # ======= 🕒 Инициализация планировщика ======= #
 async def start_scheduler():
     """Инициализация и запуск планировщика APScheduler."""
+    start_metrics_server(SCHEDULER_METRICS_PORT)
     pool = await connect_db()
 
+    # Секции sent_discounts должны существовать до первой рассылки
+    await ensure_sent_partitions(pool)
+
+    # Сначала подписываемся на изменения, потом загружаем снимок – так ничего не теряется
+    listener_conn = await connect_listener()
+    await subscription_index.listen(listener_conn)
+    await subscription_index.warm(pool)
+
+    if shards is None:
+        # Индекс просмотренных скидок; без него рассылка считается запросом к базе
+        try:
+            await seen_index.warm(pool)
+        except Exception as e:
+            logger.error(f"Не удалось загрузить индекс просмотренных скидок, используется база: {e}")
+    else:
+        # Реплика держит в индексе только отметки своих вёдер – они загружаются при heartbeat
+        await shard_heartbeat(pool)
+
     scheduler = AsyncIOScheduler()
 
-    # 🟡 Плановый парсинг скидок – каждые сутки в 01:00
+    # 🟡 Плановый парсинг скидок – каждые сутки в 01:00 (в очереди его выполняют воркеры)
     scheduler.add_job(
-        parse_and_update_discounts,
+        on_leader(enqueue_parsing if SCRAPE_MODE == "queue" else parse_and_update_discounts),
         'cron',
         hour=1,
         minute=0,
@@ -135,6 +447,66 @@ async def start_scheduler():
         id="notifications"
     )
 
+    # 🧹 Хранение данных – каждые сутки в 03:00
+    scheduler.add_job(
+        on_leader(run_retention),
+        'cron',
+        hour=3,
+        minute=0,
+        timezone=almaty_timezone,
+        args=[pool],
+        id="retention"
+    )
+
+    # 👁️ Индекс просмотренных – после хранения данных, в 03:30
+    scheduler.add_job(
+        reload_seen_index,
+        'cron',
+        hour=3,
+        minute=30,
+        timezone=almaty_timezone,
+        args=[pool],
+        id="seen_index_reload"
+    )
+
+    # 🗂️ Полная перезагрузка индекса подписок – страховка на случай потери уведомлений
+    scheduler.add_job(
+        subscription_index.warm,
+        'interval',
+        minutes=SUBSCRIPTION_INDEX_RELOAD_MINUTES,
+        args=[pool],
+        id="subscription_index_reload"
+    )
+
+    # 🔀 Шардированная рассылка: аренда реплики и вёдер, подбор брошенных вёдер
+    if shards is not None:
+        scheduler.add_job(
+            shard_heartbeat,
+            'interval',
+            seconds=REPLICA_HEARTBEAT_SECONDS,
+            args=[pool],
+            id="replica_heartbeat"
+        )
+        scheduler.add_job(
+            send_discount_notifications,
+            'cron',
+            minute="*",
+            second=DISPATCH_ORPHAN_SECOND,
+            timezone=almaty_timezone,
+            args=[pool],
+            kwargs={"orphans": True},
+            id="notifications_orphans"
+        )
+
+    # 💾 Снимок индекса просмотренных – для быстрого перезапуска (в шардированном режиме индекс неполный)
+    if SEEN_INDEX_SNAPSHOT and shards is None:
+        scheduler.add_job(
+            seen_index.save,
+            'interval',
+            minutes=SEEN_INDEX_SNAPSHOT_MINUTES,
+            id="seen_index_snapshot"
+        )
+
     logger.info("📅 Планировщик заданий запущен.")
     scheduler.start()
 
@@ -145,7 +517,28 @@ async def start_scheduler():
     except (KeyboardInterrupt, SystemExit):
         logger.info("⛔ Планировщик остановлен.")
         scheduler.shutdown()
+        parser_executor.shutdown(wait=False, cancel_futures=True)
+        await listener_conn.close()
+        shutdown_driver_pool()
+        if shards is not None:
+            await shards.leave(pool)
+        elif seen_index.ready:
+            seen_index.save()
+
+async def replay_parsing():
+    """
+    Однократный повторный разбор сохранённых страниц (PAGE_CACHE_DIR) и запись в базу –
+    например, после исправления селекторов. Версия страниц – PAGE_CACHE_REPLAY_AT.
+    """
+    pool = await connect_db()
+    try:
+        await parse_and_update_discounts(pool, mode="replay")
+    finally:
+        await pool.close()
 
 # ======= 🚀 Запуск ======= #
 if __name__ == "__main__":
-    asyncio.run(start_scheduler())
+    if "--replay" in sys.argv:
+        asyncio.run(replay_parsing())
+    else:
+        asyncio.run(start_scheduler())
@@ -1,4 +1,7 @@
 import logging
+import numpy as np
+from service_parsers.normalize import parse_percent
+from service_parsers.records import ProductBatch
 
 # Логирование
 logging.basicConfig(
@@ -11,27 +14,108 @@ def filter_discounts_by_threshold(discounts, threshold):
     """
     Фильтрует скидки по заданному минимальному порогу.
 
-    :param discounts: список скидок (list of dicts)
+    :param discounts: ProductBatch или список скидок (list of dicts)
     :param threshold: минимальный процент скидки (int)
-    :return: список отфильтрованных скидок
+    :return: отфильтрованные скидки того же типа
     """
+    if isinstance(discounts, ProductBatch):
+        # Пакет фильтруется по колонке процентов без создания записей
+        filtered_discounts = discounts.at_least(threshold)
+        if len(filtered_discounts) < len(discounts):
+            logger.info(f"Исключено {len(discounts) - len(filtered_discounts)} записей.")
+        return filtered_discounts
+
     filtered_discounts = []
     for item in discounts:
-        try:
-            discount_text = item["discount"]
-            # Проверяем, содержит ли скидка числовые данные
-            if "Нет" in discount_text or "Цена отсутствует" in discount_text:
-                continue
-            
-            # Извлекаем числовое значение скидки
-            discount_value = int(discount_text.replace("%", "").replace("-", "").strip())
-            if discount_value >= threshold:
-                filtered_discounts.append(item)
-        except (ValueError, KeyError) as e:
-            logger.warning(f"Некорректная запись для скидки товара: {item.get('name', 'Без названия')}, причина: {e}")
-    
+        # Процент уже нормализован парсером; для старых записей – разбираем текст
+        discount_value = item.get("discount_percent")
+        if discount_value is None:
+            discount_value = parse_percent(item.get("discount"))
+        if discount_value is not None and discount_value >= threshold:
+            filtered_discounts.append(item)
+
     # Логируем общее количество исключённых записей
     if len(filtered_discounts) < len(discounts):
-        logger.info(f"Исключено {len(discounts) - len(filtered_discounts)} некорректных записей.")
+        logger.info(f"Исключено {len(discounts) - len(filtered_discounts)} записей.")
 
     return filtered_discounts
+
+
+# ======= Сопоставление товаров со всеми подписками сразу ======= #
+class ThresholdMatcher:
+    """
+    Отвечает на вопрос «какие товары проходят порог» сразу для всех подписчиков.
+
+    Проценты скидок сортируются один раз (по убыванию), поэтому товары с порогом
+    не ниже t – это префикс порядка сортировки. Длина префикса для всех порогов
+    ищется одним вызовом np.searchsorted, так что стоимость сопоставления почти
+    не зависит от числа подписчиков.
+    """
+
+    def __init__(self, percents):
+        """
+        :param percents: проценты скидок товаров (array('h') из ProductBatch, список, ndarray);
+                         -1 или None – скидки нет, такие товары не проходят ни один порог
+        """
+        # Внутри – int32: у int16 нет -(-32768), а пороги из базы (INT) в int16 не помещаются
+        if isinstance(percents, np.ndarray):
+            percents = percents.astype(np.int32)
+        else:
+            percents = np.fromiter((-1 if p is None else p for p in percents), dtype=np.int32)
+        # Устойчивая сортировка по убыванию: при равном проценте сохраняется порядок парсера
+        self.order = np.argsort(-percents, kind="stable")
+        self._negated = -percents[self.order]  # По возрастанию – для searchsorted
+
+    @classmethod
+    def from_batch(cls, batch):
+        """
+        Матчер по колонке процентов ProductBatch без копирования в список:
+        буфер array('h') читается как целые того же размера в порядке байтов платформы,
+        MISSING (-1) остаётся -1 и не проходит ни один порог.
+        """
+        percents = batch.percents
+        return cls(np.frombuffer(percents, dtype=np.dtype(f"=i{percents.itemsize}")))
+
+    def __len__(self):
+        return len(self.order)
+
+    def counts(self, thresholds):
+        """
+        Сколько товаров проходит каждый порог (векторно).
+        Порог ниже 0 – то же, что 0 (товары без скидки не проходят никогда); порог
+        больше любой скидки – ни одного товара. Пороги приводятся к диапазону int32.
+        """
+        thresholds = np.clip(np.asarray(thresholds, dtype=np.int64), 0, np.iinfo(np.int32).max)
+        return np.searchsorted(self._negated, -thresholds.astype(np.int32), side="right")
+
+    def slices(self, thresholds):
+        """Срезы self.order для каждого порога: order[срез] – номера подходящих товаров."""
+        return [slice(0, int(count)) for count in self.counts(thresholds)]
+
+    def indices(self, threshold):
+        """Номера товаров, проходящих один порог, от самой большой скидки к меньшей."""
+        return self.order[:int(self.counts([threshold])[0])]
+
+
+def match_subscriptions(matchers, subscriptions):
+    """
+    Сопоставляет подписки с товарами их сервисов.
+
+    :param matchers: {service_id: ThresholdMatcher}
+    :param subscriptions: строки с user_id, service_id и discount_threshold
+    :return: {(user_id, service_id): срез} – непустые срезы порядка matchers[service_id].order
+    """
+    by_service = {}
+    for row in subscriptions:
+        by_service.setdefault(row["service_id"], []).append(row)
+
+    matches = {}
+    for service_id, rows in by_service.items():
+        matcher = matchers.get(service_id)
+        if matcher is None or not len(matcher):
+            continue
+        thresholds = [row["discount_threshold"] for row in rows]
+        for row, matched in zip(rows, matcher.slices(thresholds)):
+            if matched.stop:
+                matches[(row["user_id"], service_id)] = matched
+    return matches
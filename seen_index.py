@@ -0,0 +1,241 @@
+# seen_index.py – Индекс просмотренных скидок в памяти планировщика (кому что уже отправлено)
+import logging
+import os
+import math
+import struct
+from array import array
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from db import get_db_time, get_recent_sent_discounts, get_sent_discounts_since
+
+logger = logging.getLogger(__name__)
+
+# Снимок индекса на диске для быстрого перезапуска ("" – не сохранять)
+SEEN_INDEX_SNAPSHOT = os.getenv("SEEN_INDEX_SNAPSHOT", "")
+SEEN_INDEX_SNAPSHOT_MINUTES = int(os.getenv("SEEN_INDEX_SNAPSHOT_MINUTES", "30"))
+
+# Догрузка перечитывает отметки за N минут до прошлой синхронизации: строка с меньшим sent_id
+# может быть зафиксирована позже строк с большим (N – больше самой долгой транзакции записи)
+SEEN_INDEX_LOOKBACK_MINUTES = int(os.getenv("SEEN_INDEX_LOOKBACK_MINUTES", "10"))
+
+# Порция строк sent_discounts при загрузке
+WARM_BATCH_SIZE = 50000
+
+_SNAPSHOT_MAGIC = b"SEEN2"
+_HEADER = struct.Struct("<5sqdQ")  # magic, последний sent_id, время синхронизации (NaN – нет), число пользователей
+_USER = struct.Struct("<qI")       # user_id, количество discount_id
+
+
+class SeenIndex:
+    """
+    Для каждого пользователя – отсортированный массив array('i') отправленных discount_id
+    (4 байта на отметку). Непросмотренные скидки – разность множеств в памяти
+    вместо запроса к sent_discounts на каждую подписку.
+
+    Загружается из sent_discounts при старте (или из снимка на диске с догрузкой
+    новых строк), пополняется после каждой рассылки. Раз в сутки, после удаления
+    старых секций и товаров, перечитывается целиком (reload).
+    """
+
+    def __init__(self):
+        self._seen = {}          # user_id -> array('i') по возрастанию
+        self.last_sent_id = 0    # Последний учтённый sent_id из базы
+        self.checked_at = None   # Время базы перед последней синхронизацией
+        self.ready = False       # Индекс загружен и им можно пользоваться
+        self._reloading = None   # Отправленное во время reload – добавится в новый индекс
+
+    def __len__(self):
+        return sum(len(ids) for ids in self._seen.values())
+
+    @property
+    def users(self):
+        return len(self._seen)
+
+    # ======= Изменение индекса ======= #
+    def add(self, user_id, discount_ids):
+        """Добавить отметки пользователю (слияние с отсортированным массивом)."""
+        if not discount_ids:
+            return
+        current = self._seen.get(user_id)
+        if current is None:
+            merged = np.unique(np.asarray(discount_ids, dtype=np.int32))
+        else:
+            merged = np.union1d(np.frombuffer(current, dtype=np.int32), np.asarray(discount_ids, dtype=np.int32))
+        self._seen[user_id] = array("i", merged.tobytes())
+
+    def add_sent(self, sent):
+        """Добавить отправленное за тик: кортежи (user_id, service_id, discount_id)."""
+        by_user = {}
+        for user_id, _, discount_id in sent:
+            by_user.setdefault(user_id, []).append(discount_id)
+        for user_id, discount_ids in by_user.items():
+            self.add(user_id, discount_ids)
+        if self._reloading is not None:
+            self._reloading.extend(sent)
+
+    # ======= Чтение ======= #
+    def contains(self, user_id, discount_id):
+        ids = self._seen.get(user_id)
+        if not ids:
+            return False
+        seen = np.frombuffer(ids, dtype=np.int32)
+        position = np.searchsorted(seen, discount_id)
+        return bool(position < len(seen) and seen[position] == discount_id)
+
+    def unseen_mask(self, user_id, discount_ids):
+        """Булева маска для discount_ids (ndarray): True – пользователь скидку ещё не видел."""
+        ids = self._seen.get(user_id)
+        if not ids:
+            return np.ones(len(discount_ids), dtype=bool)
+        return np.isin(discount_ids, np.frombuffer(ids, dtype=np.int32), assume_unique=True, invert=True)
+
+    def unseen(self, user_id, discount_ids):
+        """discount_ids (ndarray), которых пользователь ещё не видел, в исходном порядке."""
+        return discount_ids[self.unseen_mask(user_id, discount_ids)]
+
+    # ======= Синхронизация с базой ======= #
+    async def refresh(self, pool):
+        """
+        Догрузить строки sent_discounts, появившиеся после last_sent_id, и перечитать
+        отметки последних SEEN_INDEX_LOOKBACK_MINUTES минут до прошлой синхронизации:
+        строки транзакций, которые тогда ещё не были зафиксированы, могли получить меньший sent_id.
+        """
+        checked_at = await get_db_time(pool)
+        if self.checked_at is not None and self.last_sent_id:
+            since = self.checked_at - timedelta(minutes=SEEN_INDEX_LOOKBACK_MINUTES)
+            self._add_rows(await get_recent_sent_discounts(pool, since, self.last_sent_id))
+        loaded, self.last_sent_id = await self._load(pool, self.last_sent_id)
+        self.checked_at = checked_at
+        return loaded
+
+    async def reload(self, pool, buckets=None, bucket_count=1):
+        """
+        Перечитать индекс из базы целиком и заменить им текущий: отметки из удалённых
+        секций sent_discounts и удалённых товаров уходят из памяти.
+        buckets: только эти ведра (шардированная рассылка; можно передать живое
+        представление – ведра, ушедшие за время загрузки, в индекс не попадут).
+        """
+        requested = None if buckets is None else set(buckets)
+        checked_at = await get_db_time(pool)
+        fresh = SeenIndex()
+        self._reloading = []
+        try:
+            loaded, last_sent_id = await fresh._load(
+                pool, 0, None if requested is None else sorted(requested), bucket_count
+            )
+        finally:
+            sent, self._reloading = self._reloading, None
+        # Отправленное во время загрузки могло не попасть в прочитанные строки
+        fresh.add_sent(sent)
+        before = len(self)
+
+        if requested is None:
+            self._seen = fresh._seen
+        else:
+            seen = {
+                user_id: ids for user_id, ids in self._seen.items()
+                if user_id % bucket_count not in requested
+            }
+            seen.update(
+                (user_id, ids) for user_id, ids in fresh._seen.items()
+                if user_id % bucket_count in buckets
+            )
+            self._seen = seen
+            last_sent_id = max(last_sent_id, self.last_sent_id)
+        self.last_sent_id = last_sent_id
+        self.checked_at = checked_at if self.checked_at is None else min(self.checked_at, checked_at)
+        logger.info(
+            f"👁️ Индекс просмотренных скидок перечитан: {len(self)} отметок у {self.users} польз. "
+            f"(было {before}, из базы {loaded})"
+        )
+        return loaded
+
+    async def load_buckets(self, pool, buckets, bucket_count):
+        """
+        Загрузить все отметки пользователей вёдер user_id % bucket_count
+        (шардированная рассылка: реплика держит в памяти только свои ведра).
+        """
+        loaded, _ = await self._load(pool, 0, sorted(buckets), bucket_count)
+        return loaded
+
+    def forget_buckets(self, buckets, bucket_count):
+        """Убрать из памяти пользователей вёдер, которые перешли к другой реплике."""
+        self._seen = {
+            user_id: ids for user_id, ids in self._seen.items()
+            if user_id % bucket_count not in buckets
+        }
+
+    def _add_rows(self, rows):
+        by_user = {}
+        for row in rows:
+            by_user.setdefault(row['user_id'], []).append(row['discount_id'])
+        for user_id, discount_ids in by_user.items():
+            self.add(user_id, discount_ids)
+
+    async def _load(self, pool, after_sent_id, buckets=None, bucket_count=1):
+        loaded = 0
+        while True:
+            rows = await get_sent_discounts_since(pool, after_sent_id, WARM_BATCH_SIZE, buckets, bucket_count)
+            if not rows:
+                break
+            self._add_rows(rows)
+            after_sent_id = rows[-1]['sent_id']
+            loaded += len(rows)
+            if len(rows) < WARM_BATCH_SIZE:
+                break
+        return loaded, after_sent_id
+
+    async def warm(self, pool, snapshot_path=SEEN_INDEX_SNAPSHOT):
+        """Загрузить индекс: снимок с диска (если есть) плюс новые строки из базы."""
+        if snapshot_path and os.path.exists(snapshot_path):
+            try:
+                self.load(snapshot_path)
+            except (OSError, ValueError, struct.error) as e:
+                logger.warning(f"Снимок индекса просмотренных {snapshot_path} не прочитан, загружаем из базы: {e}")
+                self._seen = {}
+                self.last_sent_id = 0
+                self.checked_at = None
+        loaded = await self.refresh(pool)
+        self.ready = True
+        logger.info(
+            f"👁️ Индекс просмотренных скидок загружен: {len(self)} отметок у {self.users} польз. "
+            f"(из базы {loaded})"
+        )
+
+    # ======= Снимок на диске ======= #
+    def save(self, path=SEEN_INDEX_SNAPSHOT):
+        """Записать снимок атомарно (через временный файл)."""
+        if not path:
+            return
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as file:
+            checked_at = math.nan if self.checked_at is None else self.checked_at.timestamp()
+            file.write(_HEADER.pack(_SNAPSHOT_MAGIC, self.last_sent_id, checked_at, len(self._seen)))
+            for user_id, ids in self._seen.items():
+                file.write(_USER.pack(user_id, len(ids)))
+                file.write(ids.tobytes())
+        os.replace(tmp_path, path)
+        logger.info(f"💾 Снимок индекса просмотренных сохранён: {path}")
+
+    def load(self, path):
+        with open(path, "rb") as file:
+            data = file.read()
+        magic, last_sent_id, checked_at, users = _HEADER.unpack_from(data, 0)
+        if magic != _SNAPSHOT_MAGIC:
+            raise ValueError("неизвестный формат снимка")
+        offset = _HEADER.size
+        seen = {}
+        for _ in range(users):
+            user_id, count = _USER.unpack_from(data, offset)
+            offset += _USER.size
+            ids = array("i")
+            ids.frombytes(data[offset:offset + count * ids.itemsize])
+            if len(ids) != count:
+                raise ValueError("снимок обрезан")
+            offset += count * ids.itemsize
+            seen[user_id] = ids
+        self._seen = seen
+        self.last_sent_id = last_sent_id
+        self.checked_at = None if math.isnan(checked_at) else datetime.fromtimestamp(checked_at)
@@ -0,0 +1,136 @@
+# crawler.py – Параллельный обход всех страниц каталога с лимитом запросов на хост
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from service_parsers.records import ProductBatch
+
+logger = logging.getLogger(__name__)
+
+CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", "20"))                 # Не больше N страниц на категорию
+CRAWL_HOST_CONCURRENCY = int(os.getenv("CRAWL_HOST_CONCURRENCY", "4"))    # Одновременных запросов к одному хосту
+
+# Количество страниц во встроенном состоянии страницы
+_PAGE_COUNT_RE = re.compile(r'"(?:totalPages|pagesCount|pages_count|lastPage|last_page|pageCount)"\s*:\s*(\d+)')
+
+# Общие на процесс семафоры: несколько обходов одного сайта делят один лимит
+_host_semaphores = {}
+_host_semaphores_lock = threading.Lock()
+
+
+class CrawlIncomplete(Exception):
+    """
+    Часть страниц каталога не загрузилась. products – товары загруженных страниц:
+    их можно записать, но решать по ним, какие товары пропали с сайта, нельзя.
+    """
+
+    def __init__(self, products, failed_pages):
+        super().__init__(f"Не загружены страницы {', '.join(map(str, failed_pages))}")
+        self.products = products
+        self.failed_pages = failed_pages
+
+
+def _host_semaphore(url):
+    host = urlsplit(url).netloc
+    with _host_semaphores_lock:
+        semaphore = _host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = _host_semaphores[host] = threading.BoundedSemaphore(CRAWL_HOST_CONCURRENCY)
+        return semaphore
+
+
+def page_url(url, page, param="page"):
+    """URL страницы каталога с номером page (первая страница – исходный URL)."""
+    if page <= 1:
+        return url
+    parts = urlsplit(url)
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True) if key != param]
+    query.append((param, str(page)))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def discover_page_count(html, param="page"):
+    """Число страниц каталога по ссылкам пагинации или встроенному состоянию (1, если не найдено)."""
+    numbers = [int(n) for n in re.findall(rf'[?&;]{re.escape(param)}=(\d+)', html)]
+    numbers += [int(n) for n in _PAGE_COUNT_RE.findall(html)]
+    return max(numbers, default=1)
+
+
+def batch_keys(batch):
+    """Идентичности товаров пакета (бренд, название) для удаления дублей между страницами."""
+    return {batch.key(index) for index in range(len(batch))}
+
+
+def merge_products(pages):
+    """Склеивает пакеты страниц по порядку, убирая дубли."""
+    merged = ProductBatch()
+    for batch in pages:
+        merged.extend(batch)
+    return merged.unique()
+
+
+def crawl(url, fetch_page, max_pages=CRAWL_MAX_PAGES, param="page"):
+    """
+    Обходит страницы каталога.
+    fetch_page(url) -> (ProductBatch, html) – загрузка одной страницы (HTTP или браузер).
+
+    Количество страниц определяется по первой странице; остальные загружаются
+    параллельно, но не больше CRAWL_HOST_CONCURRENCY запросов к хосту одновременно.
+    Если пагинации на странице нет (бесконечная прокрутка), страницы запрашиваются
+    волнами, пока очередная волна не перестанет приносить новые товары.
+
+    Ошибка первой страницы пробрасывается как есть. Если не загрузилась какая-то
+    из следующих страниц каталога, бросается CrawlIncomplete с собранными товарами.
+    """
+    semaphore = _host_semaphore(url)
+    failed = []
+
+    def fetch(page):
+        try:
+            with semaphore:
+                products, _ = fetch_page(page_url(url, page, param))
+            return products
+        except Exception as e:
+            logger.warning(f"Ошибка при загрузке страницы {page} ({url}): {e}")
+            failed.append(page)
+            return ProductBatch()
+
+    with semaphore:
+        first_products, first_html = fetch_page(url)
+    pages = [first_products]
+    if max_pages <= 1 or not first_products:
+        return merge_products(pages)
+
+    page_count = min(discover_page_count(first_html, param), max_pages)
+    with ThreadPoolExecutor(max_workers=CRAWL_HOST_CONCURRENCY, thread_name_prefix="crawl") as executor:
+        if page_count > 1:
+            pages.extend(executor.map(fetch, range(2, page_count + 1)))
+        else:
+            # Пагинация не найдена – пробуем следующие страницы волнами
+            next_page = 2
+            last_page = 1  # Последняя страница, на которой были товары
+            seen = batch_keys(first_products)
+            while next_page <= max_pages:
+                wave = range(next_page, min(next_page + CRAWL_HOST_CONCURRENCY, max_pages + 1))
+                wave_products = list(executor.map(fetch, wave))
+                last_page = max((page for page, batch in zip(wave, wave_products) if batch), default=last_page)
+                new_keys = set().union(*map(batch_keys, wave_products)) - seen
+                if not new_keys:
+                    break
+                seen |= new_keys
+                pages.extend(wave_products)
+                next_page = wave.stop
+            # Ошибка за концом ленты – не пропуск: магазин просто не отдаёт пустые страницы
+            failed = [page for page in failed if page < last_page]
+
+    products = merge_products(pages)
+    logger.info(
+        f"📚 {url}: страниц {len(pages)}, уникальных товаров {len(products)}"
+        + (f", не загружено {len(failed)}" if failed else "")
+    )
+    if failed:
+        raise CrawlIncomplete(products, sorted(failed))
+    return products
@@ -0,0 +1,490 @@
+# driver_pool.py – Пул «тёплых» headless-браузеров для Selenium-парсеров
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from fnmatch import fnmatchcase
+from urllib.parse import urlsplit
+
+from metrics import DRIVER_RECYCLED, DRIVER_WAIT_SECONDS, PAGE_LOAD_ERRORS, PAGE_LOAD_SECONDS
+from service_parsers.page_cache import store_page
+from selenium import webdriver
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+import websocket
+
+logger = logging.getLogger(__name__)
+
+# Путь к ChromeDriver
+CHROMEDRIVER_PATH = os.path.join(os.path.dirname(__file__), "../chromedriver-win64/chromedriver.exe")
+
+# Настройки пула (можно переопределить через .env)
+DRIVER_POOL_SIZE = int(os.getenv("DRIVER_POOL_SIZE", "2"))              # Сколько браузеров держать
+DRIVER_MAX_PAGES = int(os.getenv("DRIVER_MAX_PAGES", "50"))             # Перезапуск после N страниц
+DRIVER_MAX_MEMORY_MB = int(os.getenv("DRIVER_MAX_MEMORY_MB", "512"))    # Перезапуск при JS-куче больше N МБ
+DRIVER_ACQUIRE_TIMEOUT = float(os.getenv("DRIVER_ACQUIRE_TIMEOUT", "120"))  # Ожидание свободного браузера, сек
+DRIVER_MAX_SCROLLS = int(os.getenv("DRIVER_MAX_SCROLLS", "10"))         # Прокруток для бесконечной ленты
+
+# Профиль загрузки страниц: full – всё, как в обычном Chrome; light – без картинок, шрифтов, медиа, стилей и трекеров.
+# По умолчанию full: light включается после сверки товаров с full на записанных страницах (benchmarks/bench_render.py --url)
+RENDER_PROFILE = os.getenv("RENDER_PROFILE", "full")
+# Дополнительные шаблоны URL для блокировки в профиле light (через запятую, * – любые символы)
+RENDER_BLOCK_URLS = os.getenv("RENDER_BLOCK_URLS", "")
+# Сколько ждать ответа DevTools на смену шаблонов блокировки, сек
+RENDER_BLOCK_TIMEOUT = float(os.getenv("RENDER_BLOCK_TIMEOUT", "5"))
+
+# Группы ресурсов, которые не нужны для чтения карточек товаров: тип ресурса CDP (Network.ResourceType).
+# Тип задаёт сам браузер по тому, как ресурс подключён (<img>, @font-face, <link rel=stylesheet>),
+# поэтому блокируются и картинки без расширения в URL, и шрифты с CDN
+RESOURCE_TYPES = {
+    "images": "Image",
+    "media": "Media",
+    "fonts": "Font",
+    "styles": "Stylesheet",
+}
+# Трекеры – скрипты и пиксели чужих хостов, их узнаём по шаблонам URL
+TRACKER_PATTERNS = (
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*", "*googlesyndication.com*",
+    "*mc.yandex.ru*", "*mc.yandex.kz*", "*top-fwz1.mail.ru*", "*connect.facebook.net*",
+    "*vk.com/rtrg*", "*analytics.tiktok.com*", "*criteo.com*", "*criteo.net*", "*hotjar.com*",
+    "*mindbox.ru*", "*retailrocket.ru*", "*adriver.ru*", "*admitad.com*",
+)
+
+
+class RenderProfile:
+    """
+    Что браузер загружает при открытии страницы каталога.
+    page_load_strategy: eager – driver.get возвращается после DOMContentLoaded,
+                        не дожидаясь картинок и iframe (карточки всё равно ждёт WebDriverWait).
+    images: загружать ли картинки вообще (настройка Chrome на весь браузер).
+    blocked: группы RESOURCE_TYPES, "trackers" и шаблоны URL, запросы к которым отклоняются через Fetch.
+    """
+
+    __slots__ = ("name", "page_load_strategy", "images", "blocked")
+
+    def __init__(self, name, page_load_strategy="normal", images=True, blocked=()):
+        self.name = name
+        self.page_load_strategy = page_load_strategy
+        self.images = images
+        self.blocked = tuple(blocked)
+
+    def fetch_patterns(self, allow=()):
+        """
+        Шаблоны запросов для Fetch.enable без того, что магазину нужно для отрисовки карточек.
+        allow: группы RESOURCE_TYPES, "trackers" и шаблоны URL (список разрешённого магазина).
+        """
+        patterns = []
+        for item in self.blocked:
+            if item in allow:
+                continue
+            if item in RESOURCE_TYPES:
+                patterns.append({"urlPattern": "*", "resourceType": RESOURCE_TYPES[item], "requestStage": "Request"})
+                continue
+            for url in TRACKER_PATTERNS if item == "trackers" else (item,):
+                if not any(fnmatchcase(url, allowed) for allowed in allow):
+                    patterns.append({"urlPattern": url, "requestStage": "Request"})
+        return patterns
+
+
+RENDER_PROFILES = {
+    "full": RenderProfile("full"),
+    "light": RenderProfile(
+        "light", page_load_strategy="eager", images=False,
+        blocked=(*RESOURCE_TYPES, "trackers", *filter(None, (p.strip() for p in RENDER_BLOCK_URLS.split(","))))
+    ),
+}
+
+
+def get_render_profile(name=None):
+    """Профиль по имени (по умолчанию – RENDER_PROFILE)."""
+    name = name or RENDER_PROFILE
+    try:
+        return RENDER_PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Неизвестный профиль загрузки страниц {name!r}: {', '.join(RENDER_PROFILES)}") from None
+
+
+def build_chrome_options(profile=None):
+    """Общий набор опций Chrome для всех парсеров."""
+    profile = profile or get_render_profile()
+    options = webdriver.ChromeOptions()
+    options.add_argument("--headless")  # Безголовый режим
+    options.add_argument("--disable-gpu")  # Отключение GPU-ускорения
+    options.add_argument("--no-sandbox")  # Без песочницы
+    options.add_argument("--disable-dev-shm-usage")  # Ограничение использования общей памяти
+    options.add_argument("--disable-webgl")  # Отключение WebGL
+    options.add_argument("--use-gl=swiftshader")  # Использование программного рендеринга
+    options.add_argument("--disable-software-rasterizer")  # Отключение программного растеризатора
+    options.add_argument("--log-level=3")  # Сокращение логов
+    options.page_load_strategy = profile.page_load_strategy
+    if not profile.images:
+        options.add_argument("--blink-settings=imagesEnabled=false")  # Не загружать картинки
+        options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+    return options
+
+
+def create_driver(profile=None):
+    """Запускает новый экземпляр Chrome."""
+    profile = profile or get_render_profile()
+    service = Service(CHROMEDRIVER_PATH)
+    driver = webdriver.Chrome(service=service, options=build_chrome_options(profile))
+    try:
+        # Включаем сбор метрик, чтобы отслеживать размер JS-кучи
+        driver.execute_cdp_cmd("Performance.enable", {})
+    except WebDriverException:
+        pass
+    return driver
+
+
+class RequestBlocker:
+    """
+    Отклонение запросов вкладки браузера по шаблонам Fetch.enable.
+
+    Chrome приостанавливает подходящие запросы и ждёт решения по событию
+    Fetch.requestPaused. Selenium событий CDP не получает, поэтому блокировщик
+    держит своё подключение DevTools к вкладке, а фоновый поток отвечает на
+    каждый приостановленный запрос Fetch.failRequest.
+    """
+
+    def __init__(self, driver):
+        address = driver.capabilities["goog:chromeOptions"]["debuggerAddress"]
+        # Дескриптор окна в chromedriver – это id вкладки в DevTools
+        url = f"ws://{address}/devtools/page/{driver.current_window_handle}"
+        # Без заголовка Origin: Chrome отклоняет подключения с чужим Origin (--remote-allow-origins)
+        self._ws = websocket.create_connection(url, timeout=RENDER_BLOCK_TIMEOUT, suppress_origin=True)
+        self._ws.settimeout(None)
+        self._send_lock = threading.Lock()
+        self._next_id = 0
+        self._replies = {}   # id команды -> threading.Event, ответа на которую ждём
+        self._closed = False
+        self.patterns = None
+        threading.Thread(target=self._read, name="request-blocker", daemon=True).start()
+
+    def set_patterns(self, patterns):
+        """Сменить шаблоны блокировки (до загрузки страницы – ждём ответа браузера)."""
+        if patterns == self.patterns:
+            return
+        if patterns:
+            self._call("Fetch.enable", {"patterns": patterns})
+        else:
+            self._call("Fetch.disable", {})
+        self.patterns = patterns
+
+    def _send(self, method, params, reply=None):
+        with self._send_lock:
+            self._next_id += 1
+            if reply is not None:
+                self._replies[self._next_id] = reply
+            self._ws.send(json.dumps({"id": self._next_id, "method": method, "params": params}))
+
+    def _call(self, method, params):
+        reply = threading.Event()
+        try:
+            self._send(method, params, reply)
+        except (websocket.WebSocketException, OSError) as e:
+            raise WebDriverException(f"DevTools недоступен: {e}") from e
+        if not reply.wait(RENDER_BLOCK_TIMEOUT):
+            raise WebDriverException(f"DevTools не ответил на {method} за {RENDER_BLOCK_TIMEOUT} сек.")
+
+    def _read(self):
+        while True:
+            try:
+                message = json.loads(self._ws.recv())
+            except (websocket.WebSocketException, OSError, ValueError) as e:
+                if not self._closed:
+                    logger.warning(f"Подключение DevTools блокировщика запросов закрыто: {e}")
+                return
+            if "id" in message:
+                reply = self._replies.pop(message["id"], None)
+                if reply is not None:
+                    reply.set()
+            elif message.get("method") == "Fetch.requestPaused":
+                try:
+                    self._send("Fetch.failRequest", {
+                        "requestId": message["params"]["requestId"], "errorReason": "BlockedByClient",
+                    })
+                except (websocket.WebSocketException, OSError):
+                    return
+
+    def close(self):
+        self._closed = True
+        try:
+            self._ws.close()
+        except Exception:
+            pass
+
+
+class _PooledDriver:
+    """Браузер из пула, счётчик открытых в нём страниц и блокировщик запросов (для профиля с блокировкой)."""
+
+    def __init__(self, driver, blocker=None):
+        self.driver = driver
+        self.blocker = blocker
+        self.pages = 0
+
+
+class DriverPool:
+    """
+    Пул headless-браузеров: выдаёт браузер на время одного парсинга,
+    очищает его состояние после использования и перезапускает
+    после заданного числа страниц или при превышении лимита памяти.
+    """
+
+    def __init__(self, size=DRIVER_POOL_SIZE, max_pages=DRIVER_MAX_PAGES,
+                 max_memory_mb=DRIVER_MAX_MEMORY_MB, acquire_timeout=DRIVER_ACQUIRE_TIMEOUT,
+                 driver_factory=create_driver, profile=None):
+        self.size = max(1, size)
+        self.profile = profile or get_render_profile()
+        self.max_pages = max_pages
+        self.max_memory_mb = max_memory_mb
+        self.acquire_timeout = acquire_timeout
+        self._driver_factory = driver_factory
+        self._idle = queue.LifoQueue()  # LIFO – чаще выдаём самый «тёплый» браузер
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+
+    # ======= Выдача и возврат браузеров ======= #
+    @contextmanager
+    def driver(self, allow=()):
+        """
+        Контекстный менеджер: выдаёт браузер и возвращает его в пул.
+        allow: что магазину нужно для отрисовки карточек, несмотря на профиль
+               (группы RESOURCE_TYPES, "trackers" или шаблоны URL, см. RenderProfile.fetch_patterns).
+        """
+        with DRIVER_WAIT_SECONDS.time():
+            entry = self._acquire()
+        broken = False
+        try:
+            if entry.blocker is not None:
+                # Браузеры пула общие для магазинов – шаблоны блокировки задаются на каждую страницу
+                entry.blocker.set_patterns(self.profile.fetch_patterns(allow))
+            yield entry.driver
+        except TimeoutException:
+            # Страница не дождалась элементов – сам браузер исправен
+            raise
+        except WebDriverException:
+            # Браузер мог упасть – в пул его не возвращаем
+            broken = True
+            raise
+        finally:
+            entry.pages += 1
+            self._release(entry, broken)
+
+    def _acquire(self):
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            if self._closed:
+                raise RuntimeError("Пул браузеров уже остановлен")
+
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+
+            if can_create:
+                try:
+                    return self._create()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+
+            # Ждём возврата браузера; периодически проверяем, не освободилось ли место
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"Нет свободного браузера за {self.acquire_timeout} сек.")
+            try:
+                return self._idle.get(timeout=min(remaining, 1.0))
+            except queue.Empty:
+                continue
+
+    def _create(self):
+        driver = self._driver_factory(self.profile)
+        if not self.profile.blocked:
+            return _PooledDriver(driver)
+        try:
+            return _PooledDriver(driver, RequestBlocker(driver))
+        except Exception:
+            driver.quit()
+            raise
+
+    def _release(self, entry, broken=False):
+        if broken:
+            DRIVER_RECYCLED.inc(reason="broken")
+        if self._closed or broken or self._needs_recycle(entry):
+            self._destroy(entry)
+            return
+
+        try:
+            self._reset(entry.driver)
+        except WebDriverException as e:
+            logger.warning(f"Не удалось очистить браузер, он будет перезапущен: {e}")
+            DRIVER_RECYCLED.inc(reason="reset")
+            self._destroy(entry)
+            return
+
+        self._idle.put(entry)
+
+    def _needs_recycle(self, entry):
+        if self.max_pages and entry.pages >= self.max_pages:
+            logger.info(f"♻️ Перезапуск браузера после {entry.pages} страниц")
+            DRIVER_RECYCLED.inc(reason="pages")
+            return True
+        if self.max_memory_mb:
+            memory_mb = self._memory_mb(entry.driver)
+            if memory_mb is not None and memory_mb >= self.max_memory_mb:
+                logger.info(f"♻️ Перезапуск браузера: JS-куча {memory_mb:.0f} МБ")
+                DRIVER_RECYCLED.inc(reason="memory")
+                return True
+        return False
+
+    @staticmethod
+    def _memory_mb(driver):
+        """Размер JS-кучи вкладки в МБ (None, если метрики недоступны)."""
+        try:
+            metrics = driver.execute_cdp_cmd("Performance.getMetrics", {})
+        except WebDriverException:
+            return None
+        for metric in metrics.get("metrics", []):
+            if metric.get("name") == "JSHeapTotalSize":
+                return metric["value"] / (1024 * 1024)
+        return None
+
+    @staticmethod
+    def _reset(driver):
+        """
+        Очищает состояние браузера между парсингами.
+        delete_all_cookies() и localStorage.clear() видят только текущий домен, а магазины
+        ставят cookies и на сторонние домены (CDN, антибот, трекеры) – поэтому cookies
+        стираются целиком через CDP, а хранилища – для каждого открытого во вкладках origin.
+        Если CDP недоступен, WebDriverException уходит в _release и браузер перезапускается.
+        """
+        # Запоминаем origin каждой вкладки и закрываем лишние, если сайт их открыл
+        handles = driver.window_handles
+        origins = set()
+        for handle in reversed(handles):
+            driver.switch_to.window(handle)
+            origins.add(_page_origin(driver))
+            if handle != handles[0]:
+                driver.close()
+        driver.switch_to.window(handles[0])
+        driver.get("about:blank")
+
+        driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+        for origin in filter(None, origins):
+            # all – localStorage, IndexedDB, Cache Storage, service workers и cookies этого origin
+            driver.execute_cdp_cmd("Storage.clearDataForOrigin", {"origin": origin, "storageTypes": "all"})
+
+    def _destroy(self, entry):
+        with self._lock:
+            self._created -= 1
+        if entry.blocker is not None:
+            entry.blocker.close()
+        try:
+            entry.driver.quit()
+        except Exception as e:
+            logger.warning(f"Ошибка при закрытии браузера: {e}")
+
+    # ======= Остановка пула ======= #
+    def shutdown(self):
+        """Закрывает все свободные браузеры; занятые закроются при возврате."""
+        self._closed = True
+        while True:
+            try:
+                entry = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._destroy(entry)
+        logger.info("⛔ Пул браузеров остановлен.")
+
+
+def _page_origin(driver):
+    """Origin открытой во вкладке страницы (None для about:blank и служебных страниц)."""
+    try:
+        origin = driver.execute_script("return window.location.origin;")
+    except WebDriverException:
+        return None
+    return origin if origin and origin.startswith(("http://", "https://")) else None
+
+
+# ======= Загрузка страницы в браузере ======= #
+def render_page(url, wait_class, pool=None, max_scrolls=0, wait_timeout=10, allow=()):
+    """
+    Открывает страницу в браузере из пула и возвращает её HTML.
+    wait_class: CSS-класс карточки товара, появления которой нужно дождаться.
+    max_scrolls: сколько раз прокручивать вниз, пока подгружаются новые карточки
+                 (для каталогов с бесконечной прокруткой).
+    allow: что магазину нужно для отрисовки карточек, несмотря на профиль
+           (группы RESOURCE_TYPES, "trackers" или шаблоны URL, см. RenderProfile.fetch_patterns).
+    """
+    pool = pool or get_driver_pool()
+    host = urlsplit(url).netloc
+
+    # Браузер нужен только для загрузки страницы – сразу возвращаем его в пул
+    with pool.driver(allow) as driver:
+        try:
+            with PAGE_LOAD_SECONDS.time(host=host, mode="browser"):
+                html = _load_in_browser(driver, url, wait_class, max_scrolls, wait_timeout)
+        except Exception:
+            PAGE_LOAD_ERRORS.inc(host=host, mode="browser")
+            raise
+    store_page(url, html, "browser")
+    return html
+
+
+def _load_in_browser(driver, url, wait_class, max_scrolls, wait_timeout):
+    driver.get(url)
+    WebDriverWait(driver, wait_timeout).until(
+        EC.presence_of_element_located((By.CLASS_NAME, wait_class))
+    )
+
+    cards = len(driver.find_elements(By.CLASS_NAME, wait_class))
+    for _ in range(max_scrolls):
+        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+        try:
+            WebDriverWait(driver, 3).until(
+                lambda d: len(d.find_elements(By.CLASS_NAME, wait_class)) > cards
+            )
+        except TimeoutException:
+            break
+        cards = len(driver.find_elements(By.CLASS_NAME, wait_class))
+
+    return driver.page_source
+
+
+# ======= Общий пул процесса ======= #
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_driver_pool():
+    """Возвращает общий для процесса пул браузеров (создаётся при первом обращении)."""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = DriverPool()
+            atexit.register(_default_pool.shutdown)
+        return _default_pool
+
+
+def shutdown_driver_pool():
+    """Останавливает общий пул браузеров."""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is not None:
+            _default_pool.shutdown()
+            atexit.unregister(_default_pool.shutdown)
+            _default_pool = None
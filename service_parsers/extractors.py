@@ -0,0 +1,177 @@
+# extractors.py – Извлечение карточек товаров из HTML с заранее скомпилированными селекторами
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Бэкенд извлечения: auto | selectolax | lxml | bs4
+EXTRACTOR_BACKEND = os.getenv("EXTRACTOR_BACKEND", "auto")
+
+
+class Field:
+    """
+    Поле карточки товара.
+    selector: CSS-селектор внутри карточки
+    many: собрать все совпадения и склеить через join (иначе – первое совпадение)
+    default: значение, если элемент не найден (None – поле обязательное)
+    """
+
+    __slots__ = ("selector", "many", "join", "default")
+
+    def __init__(self, selector, many=False, join=", ", default=None):
+        self.selector = selector
+        self.many = many
+        self.join = join
+        self.default = default
+
+
+class CardSpec:
+    """Описание карточек товара магазина: селектор карточки и её поля."""
+
+    def __init__(self, name, card, fields):
+        self.name = name
+        self.card = card
+        self.fields = fields  # dict: имя поля -> Field
+
+
+class MissingFieldError(ValueError):
+    """В карточке нет обязательного поля."""
+
+
+# ======= Бэкенды ======= #
+class SelectolaxBackend:
+    """Самый быстрый бэкенд – selectolax (lexbor)."""
+
+    name = "selectolax"
+
+    def __init__(self):
+        from selectolax.lexbor import LexborHTMLParser
+        self._parser = LexborHTMLParser
+
+    def compile(self, selector):
+        # lexbor кэширует разобранные селекторы сам – храним строку
+        return selector
+
+    def cards(self, html, card_selector):
+        return self._parser(html).css(card_selector)
+
+    def first_text(self, node, selector):
+        found = node.css_first(selector)
+        return found.text(strip=True) if found is not None else None
+
+    def all_texts(self, node, selector):
+        return [found.text(strip=True) for found in node.css(selector)]
+
+
+class LxmlBackend:
+    """Бэкенд на lxml: CSS-селекторы компилируются в XPath один раз."""
+
+    name = "lxml"
+
+    def __init__(self):
+        import lxml.html
+        from lxml.cssselect import CSSSelector
+        self._fromstring = lxml.html.fromstring
+        self._css = CSSSelector
+
+    def compile(self, selector):
+        return self._css(selector)
+
+    def cards(self, html, card_selector):
+        return card_selector(self._fromstring(html))
+
+    @staticmethod
+    def _text(element):
+        # Аналог BeautifulSoup.get_text(strip=True)
+        return "".join(part.strip() for part in element.itertext())
+
+    def first_text(self, node, selector):
+        found = selector(node)
+        return self._text(found[0]) if found else None
+
+    def all_texts(self, node, selector):
+        return [self._text(found) for found in selector(node)]
+
+
+class SoupBackend:
+    """Запасной бэкенд на BeautifulSoup."""
+
+    name = "bs4"
+
+    def __init__(self):
+        from bs4 import BeautifulSoup
+        self._soup = BeautifulSoup
+
+    def compile(self, selector):
+        return selector
+
+    def cards(self, html, card_selector):
+        return self._soup(html, "html.parser").select(card_selector)
+
+    def first_text(self, node, selector):
+        found = node.select_one(selector)
+        return found.get_text(strip=True) if found is not None else None
+
+    def all_texts(self, node, selector):
+        return [found.get_text(strip=True) for found in node.select(selector)]
+
+
+BACKENDS = {
+    "selectolax": SelectolaxBackend,
+    "lxml": LxmlBackend,
+    "bs4": SoupBackend,
+}
+
+
+def create_backend(name=EXTRACTOR_BACKEND):
+    """Создаёт бэкенд по имени; auto – первый установленный по скорости."""
+    if name != "auto":
+        return BACKENDS[name]()
+
+    for backend_class in BACKENDS.values():
+        try:
+            return backend_class()
+        except ImportError:
+            continue
+    raise ImportError("Не установлен ни один HTML-парсер (selectolax, lxml или beautifulsoup4)")
+
+
+# ======= Извлечение ======= #
+class CardExtractor:
+    """Извлекает товары по CardSpec; селекторы компилируются один раз при создании."""
+
+    def __init__(self, spec, backend=None):
+        self.spec = spec
+        self.backend = backend or create_backend()
+        self._card = self.backend.compile(spec.card)
+        self._fields = [
+            (field_name, field, self.backend.compile(field.selector))
+            for field_name, field in spec.fields.items()
+        ]
+
+    def extract(self, html):
+        """Список словарей товаров со страницы."""
+        products = []
+        for card in self.backend.cards(html, self._card):
+            try:
+                products.append(self._extract_card(card))
+            except MissingFieldError as e:
+                logger.warning(f"Ошибка при обработке товара {self.spec.name}: {e}")
+        return products
+
+    def _extract_card(self, card):
+        product = {}
+        backend = self.backend
+        for field_name, field, selector in self._fields:
+            if field.many:
+                texts = backend.all_texts(card, selector)
+                value = field.join.join(texts) if texts else None
+            else:
+                value = backend.first_text(card, selector)
+
+            if value is None:
+                if field.default is None:
+                    raise MissingFieldError(f"нет поля {field_name} ({field.selector})")
+                value = field.default
+            product[field_name] = value
+        return product
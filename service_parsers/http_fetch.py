@@ -0,0 +1,271 @@
+# http_fetch.py – Загрузка страниц по HTTP без браузера и разбор встроенного JSON-состояния
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import PAGE_LOAD_ERRORS, PAGE_LOAD_SECONDS
+from service_parsers.normalize import format_price, parse_price_minor
+from service_parsers.page_cache import load_page, store_page
+
+logger = logging.getLogger(__name__)
+
+# Режим загрузки страниц: auto (HTTP, при неудаче – браузер) | http | browser
+#                         | replay (страницы из кэша PAGE_CACHE_DIR, без сети и браузера)
+FETCH_MODE = os.getenv("FETCH_MODE", "auto")
+
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "15"))         # Таймаут запроса, сек
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "10"))       # Соединений на хост
+HTTP_RECORD_DIR = os.getenv("HTTP_RECORD_DIR")                # Сохранять ответы в эту папку
+HTTP_REPLAY_DIR = os.getenv("HTTP_REPLAY_DIR")                # Отдавать ответы из этой папки (офлайн)
+
+DEFAULT_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36"
+    ),
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "ru-RU,ru;q=0.9,kk;q=0.8",
+}
+
+# ======= HTTP-сессия с пулом соединений ======= #
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Общая для процесса сессия requests с пулом keep-alive соединений."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=2)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update(DEFAULT_HEADERS)
+            _session = session
+        return _session
+
+
+def _recording_path(directory, url):
+    return os.path.join(directory, hashlib.sha1(url.encode("utf-8")).hexdigest() + ".html")
+
+
+def fetch_html(url):
+    """
+    Загружает страницу по HTTP.
+    Если задан HTTP_REPLAY_DIR – отдаёт ранее записанный ответ без сети,
+    если задан HTTP_RECORD_DIR – записывает ответ для последующего воспроизведения.
+    """
+    if HTTP_REPLAY_DIR:
+        with open(_recording_path(HTTP_REPLAY_DIR, url), encoding="utf-8") as file:
+            return file.read()
+
+    host = urlsplit(url).netloc
+    try:
+        with PAGE_LOAD_SECONDS.time(host=host, mode="http"):
+            response = get_session().get(url, timeout=HTTP_TIMEOUT)
+            response.raise_for_status()
+            html = response.text
+    except Exception:
+        PAGE_LOAD_ERRORS.inc(host=host, mode="http")
+        raise
+
+    if HTTP_RECORD_DIR:
+        os.makedirs(HTTP_RECORD_DIR, exist_ok=True)
+        with open(_recording_path(HTTP_RECORD_DIR, url), "w", encoding="utf-8") as file:
+            file.write(html)
+    store_page(url, html, "http")
+    return html
+
+
+# ======= Встроенное состояние страницы ======= #
+# <script type="application/json">, <script type="application/ld+json"> (в т.ч. __NEXT_DATA__)
+_JSON_SCRIPT_RE = re.compile(
+    r'<script[^>]*type="application/(?:ld\+)?json"[^>]*>(.*?)</script>', re.S | re.I
+)
+# window.__INITIAL_STATE__ = {...}; и аналогичные присваивания
+_STATE_ASSIGNMENT_RE = re.compile(r'window\.(__[A-Z_]+__)\s*=\s*(?=[{\[])')
+
+
+def extract_embedded_state(html):
+    """Список JSON-объектов, встроенных в страницу сервером."""
+    states = []
+    for match in _JSON_SCRIPT_RE.finditer(html):
+        try:
+            states.append(json.loads(match.group(1)))
+        except ValueError:
+            continue
+
+    decoder = json.JSONDecoder()
+    for match in _STATE_ASSIGNMENT_RE.finditer(html):
+        try:
+            state, _ = decoder.raw_decode(html, match.end())
+            states.append(state)
+        except ValueError:
+            continue
+    return states
+
+
+def _walk(node):
+    """Обход всех словарей во вложенной JSON-структуре."""
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if isinstance(current, dict):
+            yield current
+            stack.extend(current.values())
+        elif isinstance(current, list):
+            stack.extend(current)
+
+
+def _first(data, keys):
+    for key in keys:
+        value = data.get(key)
+        if value not in (None, "", [], {}):
+            return value
+    return None
+
+
+def _as_text(value, name_keys=("name", "title")):
+    if isinstance(value, dict):
+        value = _first(value, name_keys)
+    return str(value).strip() if value is not None else None
+
+
+def _as_number(value):
+    if isinstance(value, list):
+        value = value[0] if value else None
+    if isinstance(value, dict):
+        value = _first(value, ("price", "value", "amount", "current"))
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        digits = re.sub(r"[^\d.,]", "", value).replace(",", ".")
+        try:
+            return float(digits) if digits else None
+        except ValueError:
+            return None
+    return None
+
+
+class StateMapping:
+    """Какие ключи встроенного JSON соответствуют полям товара магазина."""
+
+    def __init__(self, name_keys, price_keys, old_price_keys, brand_keys=(), discount_keys=(),
+                 rating_keys=(), sizes_keys=(), fields=None):
+        self.name_keys = name_keys
+        self.price_keys = price_keys
+        self.old_price_keys = old_price_keys
+        self.brand_keys = brand_keys
+        self.discount_keys = discount_keys
+        self.rating_keys = rating_keys
+        self.sizes_keys = sizes_keys
+        self.fields = fields  # Поля результата (None – все поля, как у Lamoda)
+
+
+# Разметка schema.org (Product / Offer) – общая для большинства магазинов
+SCHEMA_ORG_MAPPING = StateMapping(
+    name_keys=("name",),
+    price_keys=("offers",),
+    old_price_keys=("highPrice",),
+    brand_keys=("brand",),
+    rating_keys=("aggregateRating",),
+)
+
+
+def products_from_state(states, mapping):
+    """Находит во встроенном состоянии товары и приводит их к формату парсеров."""
+    products = []
+    seen = set()
+    for state in states:
+        for node in _walk(state):
+            name = _as_text(_first(node, mapping.name_keys))
+            price = _as_number(_first(node, mapping.price_keys))
+            if not name or not price:
+                continue
+
+            old_price = _as_number(_first(node, mapping.old_price_keys))
+            brand = _as_text(_first(node, mapping.brand_keys)) if mapping.brand_keys else None
+            key = (brand, name, price)
+            if key in seen:
+                continue
+            seen.add(key)
+
+            discount = _first(node, mapping.discount_keys) if mapping.discount_keys else None
+            if discount is None and old_price and old_price > price:
+                discount = round((1 - price / old_price) * 100)
+            if isinstance(discount, (int, float)):
+                discount = f"−{abs(int(discount))}%"
+
+            rating = _first(node, mapping.rating_keys) if mapping.rating_keys else None
+            if isinstance(rating, dict):
+                rating = _first(rating, ("ratingValue", "value"))
+            sizes = _first(node, mapping.sizes_keys) if mapping.sizes_keys else None
+            if isinstance(sizes, list):
+                sizes = ", ".join(_as_text(size, ("title", "name", "value")) or "" for size in sizes)
+
+            product = {
+                "brand": brand or "Нет",
+                "name": name,
+                "price": format_price(parse_price_minor(price)),
+                "old_price": format_price(parse_price_minor(old_price)) if old_price else "Нет",
+                "discount": discount or "Нет",
+                "rating": str(rating) if rating is not None else "Нет",
+                "sizes": sizes or "",
+            }
+            if mapping.fields:
+                product = {field: product[field] for field in mapping.fields}
+            products.append(product)
+    return products
+
+
+# ======= Загрузка товаров без браузера ======= #
+def products_from_html(html, url, mapping, extractor):
+    """
+    Товары из HTML, полученного по HTTP:
+    1) из встроенного JSON-состояния (магазинная разметка, затем schema.org);
+    2) из серверной HTML-разметки карточек.
+    """
+    states = extract_embedded_state(html)
+    for state_mapping in (mapping, SCHEMA_ORG_MAPPING):
+        products = products_from_state(states, state_mapping)
+        if products:
+            if state_mapping is SCHEMA_ORG_MAPPING and mapping.fields:
+                products = [{field: p[field] for field in mapping.fields} for p in products]
+            logger.info(f"🌐 {len(products)} товаров из встроенного состояния страницы {url}")
+            return products
+
+    products = extractor.extract(html)
+    if products:
+        logger.info(f"🌐 {len(products)} товаров из серверной разметки {url}")
+    return products
+
+
+def fetch_products_http(url, mapping, extractor):
+    """
+    Загружает страницу по HTTP и достаёт товары (см. products_from_html).
+    Возвращает (товары, html); товаров нет – значит, нужен браузер.
+    """
+    html = fetch_html(url)
+    return products_from_html(html, url, mapping, extractor), html
+
+
+def replay_products(url, mapping, extractor):
+    """
+    Повторный разбор страницы из кэша (FETCH_MODE=replay): тем же способом,
+    каким она была разобрана при загрузке – по HTTP или после браузера.
+    Возвращает (товары, html).
+    """
+    html, source = load_page(url)
+    if source == "http":
+        return products_from_html(html, url, mapping, extractor), html
+    return extractor.extract(html), html
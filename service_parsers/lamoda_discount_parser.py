@@ -1,84 +1,80 @@
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from bs4 import BeautifulSoup
-import os
+from metrics import PRODUCTS_EXTRACTED
+from service_parsers.crawler import crawl
+from service_parsers.driver_pool import render_page
+from service_parsers.extractors import CardExtractor, CardSpec, Field
+from service_parsers.http_fetch import FETCH_MODE, StateMapping, fetch_products_http, replay_products
+from service_parsers.records import ProductBatch
+import logging
 
-# URL для категорий Lamoda
-LAMODA_URLS = {
-    "women": "https://www.lamoda.kz/c/4153/default-women/?is_sale=1&display_locations=outlet",
-    "men": "https://www.lamoda.kz/c/4152/default-men/?is_sale=1&display_locations=outlet",
-    "kids": "https://www.lamoda.kz/c/4154/default-kids/?display_locations=outlet&is_sale=1"
-}
+logger = logging.getLogger(__name__)
 
-def parse_lamoda_discounts(category_url):
-    """
-    Парсер скидок с сайта Lamoda с использованием Selenium.
-    category_url: URL страницы выбранной категории (мужская, женская или детская).
-    """
-    # Настройка пути к ChromeDriver
-    chromedriver_path = os.path.join(os.path.dirname(__file__), "../chromedriver-win64/chromedriver.exe")
-    service = Service(chromedriver_path)
+# Карточка товара Lamoda
+LAMODA_CARD_SPEC = CardSpec("Lamoda", ".x-product-card__card", {
+    "brand": Field(".x-product-card-description__brand-name"),
+    "name": Field(".x-product-card-description__product-name"),
+    "price": Field(".x-product-card-description__price-new"),
+    "old_price": Field(".x-product-card-description__price-old", default="Нет"),
+    "discount": Field("._badgeContent_1yjde_7 span", default="Нет"),
+    "rating": Field("._rating_1xcfv_13", default="Нет"),
+    "sizes": Field(".x-product-card-sizes__size", many=True, join=", ", default=""),
+})
 
-    # Настройка Selenium
-    options = webdriver.ChromeOptions()
-    options.add_argument("--headless")
-    options.add_argument("--disable-gpu")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-    options.add_argument("--disable-webgl")
-    options.add_argument("--use-gl=swiftshader")
-    options.add_argument("--disable-software-rasterizer")
-    options.add_argument("--log-level=3")
+# Селекторы компилируются один раз при импорте модуля
+lamoda_extractor = CardExtractor(LAMODA_CARD_SPEC)
 
-    driver = webdriver.Chrome(service=service, options=options)
+# Ключи товара во встроенном JSON-состоянии страницы Lamoda
+LAMODA_STATE_MAPPING = StateMapping(
+    name_keys=("name", "title", "model_title"),
+    price_keys=("price", "price_amount", "final_price"),
+    old_price_keys=("old_price", "price_old", "original_price"),
+    brand_keys=("brand", "brand_title"),
+    discount_keys=("discount", "discount_percent"),
+    rating_keys=("rating", "average_rating"),
+    sizes_keys=("sizes",),
+)
 
-    try:
-        driver.get(category_url)
-        WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.CLASS_NAME, "x-product-card__card"))
-        )
+# Что Lamoda нужно в браузере при облегчённом профиле: карточки приходят в HTML и
+# дорисовываются скриптами самого сайта, которые профиль не блокирует
+LAMODA_RENDER_ALLOW = ()
 
-        soup = BeautifulSoup(driver.page_source, "html.parser")
-        discounts = []
+def fetch_lamoda_page(url, pool=None, mode=FETCH_MODE):
+    """
+    Загружает одну страницу каталога Lamoda и возвращает (ProductBatch, html).
+    Цены в пакете – в тиынах, скидка – в процентах (см. normalize.py, records.py).
+    mode: auto – сначала HTTP без браузера, Selenium только если товаров нет;
+          http – только HTTP; browser – только Selenium;
+          replay – повторный разбор страницы из кэша (PAGE_CACHE_DIR) без сети.
+    """
+    if mode == "replay":
+        products, html = replay_products(url, LAMODA_STATE_MAPPING, lamoda_extractor)
+        PRODUCTS_EXTRACTED.inc(len(products), store="lamoda", source="replay")
+        return ProductBatch.from_products(products), html
 
-        products = soup.select(".x-product-card__card")
-        for product in products:
-            try:
-                name = product.select_one(".x-product-card-description__product-name").get_text(strip=True)
-                brand = product.select_one(".x-product-card-description__brand-name").get_text(strip=True)
-                price_new = product.select_one(".x-product-card-description__price-new").get_text(strip=True)
-                price_old = (
-                    product.select_one(".x-product-card-description__price-old").get_text(strip=True)
-                    if product.select_one(".x-product-card-description__price-old") else "Нет"
-                )
-                discount = (
-                    product.select_one("._badgeContent_1yjde_7 span").get_text(strip=True)
-                    if product.select_one("._badgeContent_1yjde_7 span") else "Нет"
-                )
-                rating = (
-                    product.select_one("._rating_1xcfv_13").get_text(strip=True)
-                    if product.select_one("._rating_1xcfv_13") else "Нет"
-                )
-                sizes = [
-                    size.get_text(strip=True)
-                    for size in product.select(".x-product-card-sizes__size")
-                ]
+    if mode in ("auto", "http"):
+        try:
+            products, html = fetch_products_http(url, LAMODA_STATE_MAPPING, lamoda_extractor)
+        except Exception as e:
+            if mode == "http":
+                raise
+            logger.warning(f"HTTP-загрузка Lamoda не удалась, используем браузер: {e}")
+            products, html = [], ""
+        if products or mode == "http":
+            PRODUCTS_EXTRACTED.inc(len(products), store="lamoda", source="http")
+            return ProductBatch.from_products(products), html
 
-                discounts.append({
-                    "brand": brand,
-                    "name": name,
-                    "price": price_new,
-                    "old_price": price_old,
-                    "discount": discount,
-                    "rating": rating,
-                    "sizes": ", ".join(sizes)
-                })
-            except Exception as e:
-                print(f"Ошибка при обработке товара: {e}")
+    html = render_page(url, "x-product-card__card", pool, allow=LAMODA_RENDER_ALLOW)
+    products = lamoda_extractor.extract(html)
+    PRODUCTS_EXTRACTED.inc(len(products), store="lamoda", source="browser")
+    return ProductBatch.from_products(products), html
 
-        return discounts
-    finally:
-        driver.quit()
+def parse_lamoda_discounts(category_url, pool=None, mode=FETCH_MODE, max_pages=1):
+    """
+    Парсер скидок с сайта Lamoda.
+    category_url: URL страницы выбранной категории (мужская, женская или детская).
+    pool: пул браузеров (по умолчанию – общий пул процесса).
+    mode: режим загрузки страниц (см. fetch_lamoda_page).
+    max_pages: больше 1 – обойти до max_pages страниц каталога параллельно.
+    """
+    if max_pages > 1:
+        return crawl(category_url, lambda url: fetch_lamoda_page(url, pool, mode), max_pages)
+    return fetch_lamoda_page(category_url, pool, mode)[0]
@@ -1,73 +1,76 @@
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from bs4 import BeautifulSoup
-import os
+from metrics import PRODUCTS_EXTRACTED
+from service_parsers.crawler import crawl
+from service_parsers.driver_pool import DRIVER_MAX_SCROLLS, render_page
+from service_parsers.extractors import CardExtractor, CardSpec, Field
+from service_parsers.http_fetch import FETCH_MODE, StateMapping, fetch_products_http, replay_products
+from service_parsers.records import ProductBatch
+import logging
 
-def parse_magnum_discounts(url):
-    """
-    Парсер скидок с сайта Magnum с использованием Selenium.
-    url: URL страницы со скидками.
-    """
-    # Настройка пути к ChromeDriver
-    chromedriver_path = os.path.join(os.path.dirname(__file__), "../chromedriver-win64/chromedriver.exe")
-    service = Service(chromedriver_path)
-
-    # Настройка Selenium
-    options = webdriver.ChromeOptions()
-    options.add_argument("--headless")  # Безголовый режим
-    options.add_argument("--disable-gpu")  # Отключение GPU-ускорения
-    options.add_argument("--no-sandbox")  # Без песочницы
-    options.add_argument("--disable-dev-shm-usage")  # Ограничение использования общей памяти
-    options.add_argument("--disable-webgl")  # Отключение WebGL
-    options.add_argument("--use-gl=swiftshader")  # Использование программного рендеринга
-    options.add_argument("--disable-software-rasterizer")  # Отключение программного растеризатора
-    options.add_argument("--log-level=3")  # Сокращение логов
-
-    driver = webdriver.Chrome(service=service, options=options)
+logger = logging.getLogger(__name__)
 
-    try:
-        # Открываем страницу
-        driver.get(url)
-        WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.CLASS_NAME, "product-block")))
+# Карточка товара Magnum (название собирается из всех .product-block__descr)
+MAGNUM_CARD_SPEC = CardSpec("Magnum", ".product-block", {
+    "name": Field(".product-block__descr", many=True, join=" ", default="Название отсутствует"),
+    "price": Field(".product-block__price", default="Цена отсутствует"),
+    "old_price": Field(".product-block__old-price", default="Нет"),
+    "discount": Field(".product-block__stock", default="Нет"),
+})
 
-        # Получаем HTML-код
-        soup = BeautifulSoup(driver.page_source, "html.parser")
-        discounts = []
+# Селекторы компилируются один раз при импорте модуля
+magnum_extractor = CardExtractor(MAGNUM_CARD_SPEC)
 
-        # Ищем блоки товаров
-        products = soup.select(".product-block")
-        for product in products:
-            try:
-                # Извлекаем полное название товара (включаем все элементы с .product-block__descr)
-                name_elements = product.select(".product-block__descr")
-                name = " ".join([el.get_text(strip=True) for el in name_elements]) if name_elements else "Название отсутствует"
+# Ключи товара во встроенном JSON-состоянии страницы Magnum
+MAGNUM_STATE_MAPPING = StateMapping(
+    name_keys=("name", "title"),
+    price_keys=("price", "finalPrice", "final_price"),
+    old_price_keys=("oldPrice", "old_price", "basePrice"),
+    discount_keys=("discount", "discountPercent"),
+    fields=("name", "price", "old_price", "discount"),
+)
 
-                # Извлекаем текущую цену
-                price_elem = product.select_one(".product-block__price")
-                price = price_elem.get_text(strip=True) if price_elem else "Цена отсутствует"
+# Что Magnum нужно в браузере при облегчённом профиле: без стилей лента не подгружает карточки при прокрутке
+MAGNUM_RENDER_ALLOW = ("styles",)
 
-                # Извлекаем старую цену (если она существует)
-                old_price_elem = product.select_one(".product-block__old-price")
-                old_price = old_price_elem.get_text(strip=True) if old_price_elem else "Нет"
+def fetch_magnum_page(url, pool=None, mode=FETCH_MODE, max_scrolls=0):
+    """
+    Загружает одну страницу каталога Magnum и возвращает (ProductBatch, html).
+    Цены в пакете – в тиынах, скидка – в процентах (см. normalize.py, records.py).
+    mode: auto – сначала HTTP без браузера, Selenium только если товаров нет;
+          http – только HTTP; browser – только Selenium;
+          replay – повторный разбор страницы из кэша (PAGE_CACHE_DIR) без сети.
+    max_scrolls: прокрутки в браузере для подгрузки карточек (бесконечная лента).
+    """
+    if mode == "replay":
+        products, html = replay_products(url, MAGNUM_STATE_MAPPING, magnum_extractor)
+        PRODUCTS_EXTRACTED.inc(len(products), store="magnum", source="replay")
+        return ProductBatch.from_products(products), html
 
-                # Извлекаем скидку, если она есть
-                discount_elem = product.select_one(".product-block__stock")
-                discount = discount_elem.get_text(strip=True) if discount_elem else "Нет"
+    if mode in ("auto", "http"):
+        try:
+            products, html = fetch_products_http(url, MAGNUM_STATE_MAPPING, magnum_extractor)
+        except Exception as e:
+            if mode == "http":
+                raise
+            logger.warning(f"HTTP-загрузка Magnum не удалась, используем браузер: {e}")
+            products, html = [], ""
+        if products or mode == "http":
+            PRODUCTS_EXTRACTED.inc(len(products), store="magnum", source="http")
+            return ProductBatch.from_products(products), html
 
-                # Формируем запись о товаре
-                discounts.append({
-                    "name": name,
-                    "price": price,
-                    "old_price": old_price,
-                    "discount": discount
-                })
-            except Exception as e:
-                print(f"Ошибка при обработке товара: {e}")
+    html = render_page(url, "product-block", pool, max_scrolls=max_scrolls, allow=MAGNUM_RENDER_ALLOW)
+    products = magnum_extractor.extract(html)
+    PRODUCTS_EXTRACTED.inc(len(products), store="magnum", source="browser")
+    return ProductBatch.from_products(products), html
 
-        return discounts
-    finally:
-        # Завершаем работу WebDriver
-        driver.quit()
+def parse_magnum_discounts(url, pool=None, mode=FETCH_MODE, max_pages=1):
+    """
+    Парсер скидок с сайта Magnum.
+    url: URL страницы со скидками.
+    pool: пул браузеров (по умолчанию – общий пул процесса).
+    mode: режим загрузки страниц (см. fetch_magnum_page).
+    max_pages: больше 1 – обойти до max_pages страниц каталога параллельно
+               (в браузере лента дополнительно прокручивается до конца).
+    """
+    if max_pages > 1:
+        return crawl(url, lambda page: fetch_magnum_page(page, pool, mode, DRIVER_MAX_SCROLLS), max_pages)
+    return fetch_magnum_page(url, pool, mode)[0]
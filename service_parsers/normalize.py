@@ -0,0 +1,80 @@
+# normalize.py – Приведение цен и скидок из текста сайтов к целым числам
+import re
+from decimal import ROUND_HALF_UP, Decimal
+
+# Цены храним в минимальных единицах (тиынах): 12 990 ₸ -> 1299000
+MINOR_UNITS = 100
+CURRENCY = "₸"
+
+# Число с разделителями разрядов: "12 990", "1.299", "1,299.50", "12 990,50"
+_NUMBER_RE = re.compile(r"\d(?:[\d\s.,]*\d)?")
+_PERCENT_RE = re.compile(r"(\d{1,3})\s*%")
+
+
+def parse_price_minor(text):
+    """
+    "12 990 ₸" -> 1299000; None, если цены нет ("Нет", "Цена отсутствует").
+    Точка и запятая бывают и разделителем разрядов ("1.299 ₸"), и десятичным ("12,50"):
+    последний из них – десятичный, если после него не ровно три цифры, остальные – разряды.
+    """
+    if text is None:
+        return None
+    if isinstance(text, (int, float)):
+        return int(round(text * MINOR_UNITS))
+    match = _NUMBER_RE.search(text)
+    if not match:
+        return None
+    number = re.sub(r"\s", "", match.group())
+    point = max(number.rfind("."), number.rfind(","))
+    if point >= 0 and len(number) - point - 1 != 3:
+        integer, fraction = number[:point], number[point + 1:]
+    else:
+        integer, fraction = number, "0"
+    integer = re.sub(r"[.,]", "", integer) or "0"
+    minor = Decimal(f"{integer}.{fraction}") * MINOR_UNITS
+    return int(minor.to_integral_value(ROUND_HALF_UP))
+
+
+def parse_percent(text):
+    """"−30%" / "-30 %" / 30 -> 30; None, если скидки нет."""
+    if text is None:
+        return None
+    if isinstance(text, (int, float)):
+        return abs(int(text))
+    match = _PERCENT_RE.search(text)
+    return int(match.group(1)) if match else None
+
+
+def format_price(minor):
+    """1299000 -> "12 990 ₸" (копейки показываются, только если они есть); -500 -> "−5 ₸"."""
+    if minor is None:
+        return "Нет"
+    # divmod с отрицательным числом округляет вниз (-5 -> -1 и 95), поэтому знак – отдельно
+    minor = int(minor)
+    units, cents = divmod(abs(minor), MINOR_UNITS)
+    text = f"{units:,}".replace(",", " ")
+    if cents:
+        text += f",{cents:02d}"
+    return f"{'−' if minor < 0 else ''}{text} {CURRENCY}"
+
+
+def format_percent(percent):
+    """30 -> "−30%"."""
+    return f"−{percent}%" if percent is not None else "Нет"
+
+
+def normalize_product(product):
+    """
+    Добавляет к товару числовые поля price_minor, old_price_minor и discount_percent.
+    Если процент скидки на карточке не указан, он считается по ценам.
+    """
+    price = parse_price_minor(product.get("price"))
+    old_price = parse_price_minor(product.get("old_price"))
+    percent = parse_percent(product.get("discount"))
+    if percent is None and price and old_price and old_price > price:
+        percent = round((1 - price / old_price) * 100)
+
+    product["price_minor"] = price
+    product["old_price_minor"] = old_price
+    product["discount_percent"] = percent
+    return product
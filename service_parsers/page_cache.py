@@ -0,0 +1,255 @@
+# page_cache.py – Сжатое хранилище загруженных страниц каталога для повторного разбора без сети
+import argparse
+import hashlib
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Папка хранилища ("" – страницы не сохраняются)
+PAGE_CACHE_DIR = os.getenv("PAGE_CACHE_DIR", "")
+PAGE_CACHE_MAX_MB = int(os.getenv("PAGE_CACHE_MAX_MB", "1024"))   # Предел размера сжатых страниц
+# Воспроизведение: последняя версия страницы не позже этого времени (ISO, "" – самая свежая)
+PAGE_CACHE_REPLAY_AT = os.getenv("PAGE_CACHE_REPLAY_AT", "")
+
+ZLIB_LEVEL = 6
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,          -- байт HTML в UTF-8
+    stored_size INTEGER NOT NULL,   -- байт на диске после сжатия
+    last_access REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    digest TEXT NOT NULL REFERENCES blobs(digest) ON DELETE CASCADE,
+    source TEXT NOT NULL,           -- http | browser: как страница была получена
+    PRIMARY KEY (url, fetched_at)
+);
+CREATE INDEX IF NOT EXISTS idx_pages_digest ON pages (digest);
+CREATE INDEX IF NOT EXISTS idx_blobs_last_access ON blobs (last_access);
+"""
+
+
+class PageNotCached(LookupError):
+    """Страницы нет в хранилище (или нет версии до заданного времени)."""
+
+
+def parse_replay_at(value):
+    """Время воспроизведения из строки ISO (локальное время) в секунды epoch; "" – None."""
+    if not value:
+        return None
+    return datetime.fromisoformat(value).timestamp()
+
+
+class PageCache:
+    """
+    Хранилище страниц с адресацией по содержимому: HTML сжимается zlib и лежит
+    в objects/<2 символа>/<sha256>.z, одинаковые страницы хранятся один раз.
+    Индекс sqlite связывает (url, время загрузки) с содержимым.
+
+    Размер ограничен max_bytes: при превышении удаляются давно не использованные
+    страницы (LRU) вместе с записями о загрузках.
+    """
+
+    def __init__(self, directory, max_bytes=PAGE_CACHE_MAX_MB * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(directory, "objects"), exist_ok=True)
+        # Одно соединение на процесс: страницы пишут потоки обхода, поэтому доступ под замком
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(directory, "index.sqlite3"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL;")
+        self._conn.execute("PRAGMA foreign_keys=ON;")
+        self._conn.executescript(_SCHEMA)
+        self._total = self._conn.execute("SELECT COALESCE(SUM(stored_size), 0) FROM blobs;").fetchone()[0]
+
+    def _blob_path(self, digest):
+        return os.path.join(self.directory, "objects", digest[:2], f"{digest}.z")
+
+    # ======= Запись ======= #
+    def put(self, url, html, source, fetched_at=None):
+        """Сохранить загруженную страницу; возвращает sha256 содержимого."""
+        data = html.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        fetched_at = fetched_at or time.time()
+
+        with self._lock:
+            known = self._conn.execute("SELECT 1 FROM blobs WHERE digest = ?;", (digest,)).fetchone()
+            if known:
+                self._conn.execute("UPDATE blobs SET last_access = ? WHERE digest = ?;", (fetched_at, digest))
+            else:
+                compressed = zlib.compress(data, ZLIB_LEVEL)
+                path = self._blob_path(digest)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "wb") as file:
+                    file.write(compressed)
+                os.replace(tmp_path, path)
+                self._conn.execute(
+                    "INSERT INTO blobs (digest, size, stored_size, last_access) VALUES (?, ?, ?, ?);",
+                    (digest, len(data), len(compressed), fetched_at)
+                )
+                self._total += len(compressed)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (url, fetched_at, digest, source) VALUES (?, ?, ?, ?);",
+                (url, fetched_at, digest, source)
+            )
+            self._conn.commit()
+            if self.max_bytes and self._total > self.max_bytes:
+                self._evict(self.max_bytes, keep=digest)
+        return digest
+
+    # ======= Чтение ======= #
+    def get(self, url, at=None):
+        """
+        Последняя сохранённая версия страницы (не позже at, секунды epoch).
+        Возвращает (html, source, fetched_at).
+        """
+        with self._lock:
+            row = self._conn.execute("""
+                SELECT digest, source, fetched_at FROM pages
+                WHERE url = ? AND fetched_at <= ?
+                ORDER BY fetched_at DESC LIMIT 1;
+            """, (url, at if at is not None else float("inf"))).fetchone()
+            if row is None:
+                raise PageNotCached(f"Страница не сохранена: {url}")
+            digest, source, fetched_at = row
+            self._conn.execute("UPDATE blobs SET last_access = ? WHERE digest = ?;", (time.time(), digest))
+            self._conn.commit()
+
+        with open(self._blob_path(digest), "rb") as file:
+            html = zlib.decompress(file.read()).decode("utf-8")
+        return html, source, fetched_at
+
+    def pages(self, since=None, until=None):
+        """Загрузки за период: список (url, fetched_at, source, размер HTML)."""
+        with self._lock:
+            return self._conn.execute("""
+                SELECT p.url, p.fetched_at, p.source, b.size
+                FROM pages p JOIN blobs b ON b.digest = p.digest
+                WHERE p.fetched_at >= ? AND p.fetched_at <= ?
+                ORDER BY p.fetched_at;
+            """, (since or 0, until if until is not None else float("inf"))).fetchall()
+
+    def stats(self):
+        with self._lock:
+            pages, = self._conn.execute("SELECT COUNT(*) FROM pages;").fetchone()
+            blobs, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs;").fetchone()
+        return {"pages": pages, "blobs": blobs, "size": size, "stored_size": self._total}
+
+    # ======= Вытеснение ======= #
+    def evict(self, max_bytes=None):
+        """Удалить давно не использованные страницы, пока размер больше max_bytes."""
+        with self._lock:
+            return self._evict(self.max_bytes if max_bytes is None else max_bytes)
+
+    def _evict(self, max_bytes, keep=None):
+        removed = 0
+        rows = self._conn.execute("SELECT digest, stored_size FROM blobs ORDER BY last_access;").fetchall()
+        for digest, stored_size in rows:
+            if self._total <= max_bytes:
+                break
+            if digest == keep:
+                continue
+            self._conn.execute("DELETE FROM blobs WHERE digest = ?;", (digest,))
+            try:
+                os.remove(self._blob_path(digest))
+            except FileNotFoundError:
+                pass
+            self._total -= stored_size
+            removed += 1
+        self._conn.commit()
+        if removed:
+            logger.info(f"🧹 Из кэша страниц вытеснено {removed} страниц, размер {self._total / 1024 / 1024:.1f} МБ")
+        return removed
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# ======= Общее хранилище процесса ======= #
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_page_cache():
+    """Хранилище из PAGE_CACHE_DIR (None, если оно не настроено)."""
+    global _default_cache
+    if not PAGE_CACHE_DIR:
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = PageCache(PAGE_CACHE_DIR)
+        return _default_cache
+
+
+def store_page(url, html, source):
+    """Сохранить загруженную страницу, если хранилище включено (ошибки не мешают парсингу)."""
+    cache = get_page_cache()
+    if cache is None or not html:
+        return
+    try:
+        cache.put(url, html, source)
+    except Exception as e:
+        logger.warning(f"Не удалось сохранить страницу {url} в кэш: {e}")
+
+
+def load_page(url, at=PAGE_CACHE_REPLAY_AT):
+    """Страница из хранилища для воспроизведения: (html, source)."""
+    cache = get_page_cache()
+    if cache is None:
+        raise PageNotCached("Воспроизведение невозможно: PAGE_CACHE_DIR не задан")
+    html, source, _ = cache.get(url, parse_replay_at(at))
+    return html, source
+
+
+# ======= 🚀 Запуск из командной строки ======= #
+def main():
+    parser = argparse.ArgumentParser(description="Хранилище страниц каталога")
+    parser.add_argument("--dir", default=PAGE_CACHE_DIR, help="папка хранилища (по умолчанию PAGE_CACHE_DIR)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="размер хранилища")
+    listing = commands.add_parser("list", help="загрузки за период")
+    listing.add_argument("--since", default="", help="начало периода (ISO)")
+    listing.add_argument("--until", default="", help="конец периода (ISO)")
+    show = commands.add_parser("show", help="вывести HTML страницы")
+    show.add_argument("url")
+    show.add_argument("--at", default="", help="версия не позже этого времени (ISO)")
+    evict = commands.add_parser("evict", help="вытеснить страницы до предела")
+    evict.add_argument("--max-mb", type=int, default=PAGE_CACHE_MAX_MB)
+    args = parser.parse_args()
+
+    if not args.dir:
+        parser.error("не задана папка хранилища (--dir или PAGE_CACHE_DIR)")
+    cache = PageCache(args.dir, max_bytes=0)
+
+    if args.command == "stats":
+        stats = cache.stats()
+        print(
+            f"Загрузок: {stats['pages']}, уникальных страниц: {stats['blobs']}, "
+            f"HTML: {stats['size'] / 1024 / 1024:.1f} МБ, на диске: {stats['stored_size'] / 1024 / 1024:.1f} МБ"
+        )
+    elif args.command == "list":
+        for url, fetched_at, source, size in cache.pages(parse_replay_at(args.since), parse_replay_at(args.until)):
+            print(f"{datetime.fromtimestamp(fetched_at):%Y-%m-%d %H:%M:%S}  {source:<7}  {size:>9}  {url}")
+    elif args.command == "show":
+        html, _, _ = cache.get(args.url, parse_replay_at(args.at))
+        sys.stdout.write(html)
+    elif args.command == "evict":
+        removed = cache.evict(args.max_mb * 1024 * 1024)
+        print(f"Вытеснено страниц: {removed}")
+    cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+# records.py – Компактные типизированные записи товаров и колоночный пакет для всего конвейера
+import hashlib
+import json
+import struct
+import sys
+import zlib
+from array import array
+
+from service_parsers.normalize import normalize_product
+
+# В числовых колонках «нет значения» хранится как -1
+MISSING = -1
+
+# Длины частей сериализованного пакета: JSON строк и четыре числовые колонки (little-endian)
+_PARTS_HEADER = struct.Struct("<5I")
+
+
+def _pack(value):
+    return MISSING if value is None else value
+
+
+def _unpack(value):
+    return None if value == MISSING else value
+
+
+def product_key(brand, name):
+    """
+    Идентичность товара внутри сервиса (бренд, название): по ней убираются дубли
+    и сравнивается пакет с базой – как в уникальном индексе parsed_discounts.
+    """
+    return brand or "", name
+
+
+def _intern(value):
+    # Бренды, рейтинги и размеры часто повторяются – храним одну копию строки
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class ProductRecord:
+    """Один товар: цены в тиынах, скидка в процентах (None – значения нет)."""
+
+    __slots__ = (
+        "name", "brand", "price_minor", "old_price_minor", "discount_percent",
+        "rating", "sizes", "discount_id",
+    )
+
+    def __init__(self, name, price_minor=None, old_price_minor=None, discount_percent=None,
+                 brand=None, rating=None, sizes=None, discount_id=None):
+        self.name = name
+        self.brand = brand
+        self.price_minor = price_minor
+        self.old_price_minor = old_price_minor
+        self.discount_percent = discount_percent
+        self.rating = rating
+        self.sizes = sizes
+        self.discount_id = discount_id
+
+    def __repr__(self):
+        return f"ProductRecord({self.name!r}, {self.price_minor}, {self.old_price_minor}, {self.discount_percent}%)"
+
+    def __eq__(self, other):
+        if not isinstance(other, ProductRecord):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in self.__slots__)
+
+
+class ProductBatch:
+    """
+    Колоночный пакет товаров: цены и проценты лежат в массивах array,
+    строки – в списках с интернированием повторяющихся значений.
+    Парсеры отдают пакет, база и фильтры работают с ним напрямую.
+    """
+
+    __slots__ = (
+        "names", "brands", "ratings", "sizes",
+        "prices", "old_prices", "percents", "discount_ids",
+    )
+
+    def __init__(self):
+        self.names = []
+        self.brands = []
+        self.ratings = []
+        self.sizes = []
+        self.prices = array("q")        # Цена в тиынах
+        self.old_prices = array("q")    # Старая цена в тиынах
+        # Процент скидки: short (2 байта, порядок байтов платформы), без скидки – MISSING;
+        # ThresholdMatcher.from_batch читает этот буфер напрямую через np.frombuffer
+        self.percents = array("h")
+        self.discount_ids = array("q")  # ID в parsed_discounts (для записей из базы)
+
+    # ======= Построение ======= #
+    def append(self, name, price_minor=None, old_price_minor=None, discount_percent=None,
+               brand=None, rating=None, sizes=None, discount_id=None):
+        self.names.append(name)
+        self.brands.append(_intern(brand))
+        self.ratings.append(_intern(rating))
+        self.sizes.append(_intern(sizes))
+        self.prices.append(_pack(price_minor))
+        self.old_prices.append(_pack(old_price_minor))
+        self.percents.append(_pack(discount_percent))
+        self.discount_ids.append(_pack(discount_id))
+
+    def append_record(self, record):
+        self.append(
+            record.name, record.price_minor, record.old_price_minor, record.discount_percent,
+            record.brand, record.rating, record.sizes, record.discount_id,
+        )
+
+    def extend(self, other):
+        """Дописать в конец другой пакет."""
+        self.names.extend(other.names)
+        self.brands.extend(other.brands)
+        self.ratings.extend(other.ratings)
+        self.sizes.extend(other.sizes)
+        self.prices.extend(other.prices)
+        self.old_prices.extend(other.old_prices)
+        self.percents.extend(other.percents)
+        self.discount_ids.extend(other.discount_ids)
+
+    @classmethod
+    def from_products(cls, products):
+        """Пакет из словарей парсера ("12 990 ₸", "−30%" и т.д.) с нормализацией."""
+        batch = cls()
+        for product in products:
+            normalize_product(product)
+            batch.append(
+                product["name"], product["price_minor"], product["old_price_minor"],
+                product["discount_percent"], product.get("brand"), product.get("rating"),
+                product.get("sizes"),
+            )
+        return batch
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Пакет из строк parsed_discounts."""
+        batch = cls()
+        for row in rows:
+            batch.append(
+                row["product_name"], row["price_new"], row["price_old"], row["discount_percent"],
+                row["brand"], row["rating"], row["sizes"], row["discount_id"],
+            )
+        return batch
+
+    # ======= Сериализация ======= #
+    def to_bytes(self):
+        """Сжатое представление пакета: строковые колонки – JSON, числовые – байты массивов."""
+        numbers = [self.prices, self.old_prices, self.percents, self.discount_ids]
+        if sys.byteorder == "big":
+            numbers = [array(column.typecode, column) for column in numbers]
+            for column in numbers:
+                column.byteswap()
+        parts = [json.dumps([self.names, self.brands, self.ratings, self.sizes], ensure_ascii=False).encode("utf-8")]
+        parts += [column.tobytes() for column in numbers]
+        return zlib.compress(_PARTS_HEADER.pack(*map(len, parts)) + b"".join(parts))
+
+    def digest(self):
+        """SHA-1 содержимого пакета: у пакетов с одинаковыми товарами он одинаковый (без сжатия to_bytes)."""
+        digest = hashlib.sha1(
+            json.dumps([self.names, self.brands, self.ratings, self.sizes], ensure_ascii=False).encode("utf-8")
+        )
+        for column in (self.prices, self.old_prices, self.percents, self.discount_ids):
+            digest.update(column.tobytes())
+        return digest.hexdigest()
+
+    @classmethod
+    def from_bytes(cls, data):
+        data = zlib.decompress(data)
+        sizes = _PARTS_HEADER.unpack_from(data)
+        offset = _PARTS_HEADER.size
+        parts = []
+        for size in sizes:
+            parts.append(data[offset:offset + size])
+            offset += size
+
+        batch = cls()
+        names, brands, ratings, sizes_column = json.loads(parts[0])
+        batch.names = names
+        batch.brands = [_intern(value) for value in brands]
+        batch.ratings = [_intern(value) for value in ratings]
+        batch.sizes = [_intern(value) for value in sizes_column]
+        for column, raw in zip((batch.prices, batch.old_prices, batch.percents, batch.discount_ids), parts[1:]):
+            column.frombytes(raw)
+            if sys.byteorder == "big":
+                column.byteswap()
+        return batch
+
+    # ======= Доступ ======= #
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.select(range(*index.indices(len(self))))
+        return ProductRecord(
+            self.names[index], _unpack(self.prices[index]), _unpack(self.old_prices[index]),
+            _unpack(self.percents[index]), self.brands[index], self.ratings[index],
+            self.sizes[index], _unpack(self.discount_ids[index]),
+        )
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def key(self, index):
+        """Идентичность товара (бренд, название) – для удаления дублей."""
+        return product_key(self.brands[index], self.names[index])
+
+    # ======= Пакетные операции ======= #
+    def select(self, indices):
+        """Новый пакет из строк с заданными номерами (в заданном порядке)."""
+        batch = ProductBatch()
+        batch.names = [self.names[i] for i in indices]
+        batch.brands = [self.brands[i] for i in indices]
+        batch.ratings = [self.ratings[i] for i in indices]
+        batch.sizes = [self.sizes[i] for i in indices]
+        batch.prices = array("q", (self.prices[i] for i in indices))
+        batch.old_prices = array("q", (self.old_prices[i] for i in indices))
+        batch.percents = array("h", (self.percents[i] for i in indices))
+        batch.discount_ids = array("q", (self.discount_ids[i] for i in indices))
+        return batch
+
+    def indices_at_least(self, threshold):
+        """Номера товаров со скидкой не ниже threshold (товары без скидки не попадают)."""
+        threshold = max(threshold, 0)
+        return [i for i, percent in enumerate(self.percents) if percent != MISSING and percent >= threshold]
+
+    def at_least(self, threshold):
+        """Пакет товаров со скидкой не ниже threshold."""
+        indices = self.indices_at_least(threshold)
+        return self if len(indices) == len(self) else self.select(indices)
+
+    def unique(self):
+        """Пакет без дублей по (бренд, название); сохраняется первое вхождение."""
+        seen = set()
+        indices = []
+        for index in range(len(self)):
+            key = self.key(index)
+            if key not in seen:
+                seen.add(key)
+                indices.append(index)
+        return self if len(indices) == len(self) else self.select(indices)
@@ -0,0 +1,59 @@
+# sources.py – Единый список источников скидок: магазин, категория, город, URL и функции загрузки
+from functools import partial
+
+from service_parsers.driver_pool import DRIVER_MAX_SCROLLS
+from service_parsers.lamoda_discount_parser import fetch_lamoda_page, parse_lamoda_discounts
+from service_parsers.magnum_discount_parser import fetch_magnum_page, parse_magnum_discounts
+
+# Каталог скидок Magnum (город – параметр city)
+MAGNUM_URL = "https://magnum.kz/catalog?discountType=all&city=almaty"
+
+# URL для категорий Lamoda
+LAMODA_URLS = {
+    "women": "https://www.lamoda.kz/c/4153/default-women/?is_sale=1",
+    "men": "https://www.lamoda.kz/c/4152/default-men/?is_sale=1",
+    "kids": "https://www.lamoda.kz/c/4154/default-kids/?is_sale=1"
+}
+
+
+class Source:
+    """
+    Один обходимый каталог.
+    service_name: название сервиса в базе; category: категория в parsed_discount_categories (или None).
+    parse(url, mode=..., max_pages=...) – обход каталога целиком (ProductBatch);
+    fetch_page(url, mode=...) – одна страница, (ProductBatch, html) – для очереди заданий.
+    """
+
+    __slots__ = ("service_name", "category", "city", "url", "parse", "fetch_page")
+
+    def __init__(self, service_name, category, city, url, parse, fetch_page):
+        self.service_name = service_name
+        self.category = category
+        self.city = city
+        self.url = url
+        self.parse = parse
+        self.fetch_page = fetch_page
+
+    @property
+    def key(self):
+        return self.service_name, self.category, self.city
+
+
+SOURCES = [
+    *(
+        Source("Lamoda", category, None, url, parse_lamoda_discounts, fetch_lamoda_page)
+        for category, url in LAMODA_URLS.items()
+    ),
+    # В браузере лента Magnum дополнительно прокручивается до конца
+    Source(
+        "Magnum", None, "almaty", MAGNUM_URL, parse_magnum_discounts,
+        partial(fetch_magnum_page, max_scrolls=DRIVER_MAX_SCROLLS)
+    ),
+]
+
+_SOURCES_BY_KEY = {source.key: source for source in SOURCES}
+
+
+def find_source(service_name, category=None, city=None):
+    """Источник по (сервис, категория, город) – например, для задания из очереди."""
+    return _SOURCES_BY_KEY.get((service_name, category, city))
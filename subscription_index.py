@@ -0,0 +1,105 @@
+# subscription_index.py – Индекс подписок по минутам суток (колесо времени) для планировщика
+import json
+import logging
+
+from db import get_all_subscriptions
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+# Канал LISTEN/NOTIFY, в который пишет триггер subscriptions_changed
+SUBSCRIPTIONS_CHANNEL = "subscriptions_changed"
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def minute_of_day(value):
+    """Номер минуты суток (0..1439) для datetime/time или строки "ЧЧ:ММ"."""
+    if isinstance(value, str):
+        hours, minutes = value.split(":")[:2]
+        return int(hours) * 60 + int(minutes)
+    return value.hour * 60 + value.minute
+
+
+class SubscriptionEntry:
+    """Подписка в индексе."""
+
+    __slots__ = ("user_id", "service_id", "discount_threshold", "minute")
+
+    def __init__(self, user_id, service_id, discount_threshold, minute):
+        self.user_id = user_id
+        self.service_id = service_id
+        self.discount_threshold = discount_threshold
+        self.minute = minute
+
+
+class SubscriptionTimeWheel:
+    """
+    Подписки, разложенные по 1440 слотам (минутам суток).
+    Загружается из базы при старте и обновляется по LISTEN/NOTIFY,
+    поэтому проверка «есть ли рассылка в эту минуту» не ходит в базу.
+    """
+
+    def __init__(self):
+        self._slots = [dict() for _ in range(MINUTES_PER_DAY)]
+        self._entries = {}  # (user_id, service_id) -> SubscriptionEntry
+
+    def __len__(self):
+        return len(self._entries)
+
+    # ======= Изменение индекса ======= #
+    def load(self, rows):
+        """Полностью перестроить индекс по строкам таблицы subscriptions."""
+        self._slots = [dict() for _ in range(MINUTES_PER_DAY)]
+        self._entries = {}
+        for row in rows:
+            self.upsert(row['user_id'], row['service_id'], row['notification_time'], row['discount_threshold'])
+
+    def upsert(self, user_id, service_id, notification_time, discount_threshold=None):
+        """Добавить подписку или перенести её в другой слот."""
+        key = (user_id, service_id)
+        self.remove(user_id, service_id)
+        entry = SubscriptionEntry(user_id, service_id, discount_threshold, minute_of_day(notification_time))
+        self._entries[key] = entry
+        self._slots[entry.minute][key] = entry
+
+    def remove(self, user_id, service_id):
+        """Удалить подписку из индекса (если она есть)."""
+        entry = self._entries.pop((user_id, service_id), None)
+        if entry is not None:
+            del self._slots[entry.minute][(user_id, service_id)]
+
+    # ======= Чтение ======= #
+    def due(self, value):
+        """Подписки, у которых рассылка в заданную минуту."""
+        minute = value if isinstance(value, int) else minute_of_day(value)
+        return list(self._slots[minute].values())
+
+    def due_user_ids(self, value):
+        """Пользователи, которым нужно отправить уведомления в заданную минуту."""
+        return sorted({entry.user_id for entry in self.due(value)})
+
+    # ======= Синхронизация с базой ======= #
+    async def warm(self, pool):
+        """Загрузить все подписки из базы."""
+        with span("subscription_index_warm"):
+            rows = await get_all_subscriptions(pool)
+            self.load(rows)
+        logger.info(f"🗂️ Индекс подписок загружен: {len(self)} подписок")
+
+    async def listen(self, conn):
+        """Подписаться на изменения подписок (conn – отдельное соединение, не из пула)."""
+        await conn.add_listener(SUBSCRIPTIONS_CHANNEL, self._on_notify)
+
+    def _on_notify(self, connection, pid, channel, payload):
+        try:
+            change = json.loads(payload)
+            if change["op"] == "delete":
+                self.remove(change["user_id"], change["service_id"])
+            else:
+                self.upsert(
+                    change["user_id"], change["service_id"],
+                    change["notification_time"], change.get("discount_threshold")
+                )
+        except Exception as e:
+            logger.error(f"Некорректное уведомление об изменении подписки {payload!r}: {e}")
@@ -0,0 +1,46 @@
+# conftest.py – Общие фикстуры тестов: временный PostgreSQL со схемой проекта
+#
+# База: BENCH_DSN, иначе – временный кластер через initdb/pg_ctl (PG_BINDIR или pg_ctl в PATH; не от root).
+# Без PostgreSQL тесты с базой пропускаются.
+import asyncio
+import subprocess
+import uuid
+
+import asyncpg
+import pytest
+
+from tests.postgres import BENCH_DSN, create_schema, drop_schema, temporary_postgres
+
+# Сервис, на котором тесты заводят скидки напрямую SQL
+TEST_SERVICE = "Bench"
+
+
+@pytest.fixture(scope="session")
+def postgres_dsn():
+    if BENCH_DSN:
+        yield BENCH_DSN
+        return
+    cluster = temporary_postgres()
+    try:
+        dsn = cluster.__enter__()
+    except (RuntimeError, OSError, subprocess.CalledProcessError) as e:
+        pytest.skip(f"PostgreSQL недоступен: {e}")
+    try:
+        yield dsn
+    finally:
+        cluster.__exit__(None, None, None)
+
+
+@pytest.fixture
+def connect_pool(postgres_dsn):
+    """Корутина, открывающая пул к отдельной схеме с таблицами проекта (схема удаляется после теста)."""
+    schema = f"test_{uuid.uuid4().hex[:12]}"
+    asyncio.run(create_schema(postgres_dsn, schema, services=(TEST_SERVICE,)))
+
+    async def connect():
+        return await asyncpg.create_pool(
+            postgres_dsn, min_size=1, max_size=4, server_settings={"search_path": schema}
+        )
+
+    yield connect
+    asyncio.run(drop_schema(postgres_dsn, schema))
@@ -0,0 +1,84 @@
+# postgres.py – Временный PostgreSQL и схема проекта для тестов и бенчмарков
+#
+# База: BENCH_DSN, иначе – временный кластер через initdb/pg_ctl (PG_BINDIR или pg_ctl в PATH; не от root).
+# Таблицы создаются в отдельной схеме, которая удаляется после тестов или замеров.
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+from contextlib import contextmanager
+
+import asyncpg
+
+BENCH_DSN = os.getenv("BENCH_DSN")
+PG_BINDIR = os.getenv("PG_BINDIR")
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "base_stracture.sql")
+
+
+# ======= Временный PostgreSQL ======= #
+def _bin(name):
+    if PG_BINDIR:
+        return os.path.join(PG_BINDIR, name)
+    path = shutil.which(name)
+    if path is None:
+        try:
+            bindir = subprocess.run(["pg_config", "--bindir"], capture_output=True, text=True, check=True).stdout
+        except (OSError, subprocess.CalledProcessError):
+            raise RuntimeError("PostgreSQL не найден: задайте BENCH_DSN или PG_BINDIR")
+        path = os.path.join(bindir.strip(), name)
+    return path
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def temporary_postgres():
+    """Кластер PostgreSQL во временной папке; возвращает DSN и удаляет кластер при выходе."""
+    datadir = tempfile.mkdtemp(prefix="bench_pg_")
+    port = _free_port()
+    try:
+        subprocess.run(
+            [_bin("initdb"), "-D", datadir, "-U", "bench", "--auth=trust", "-E", "UTF8"],
+            check=True, stdout=subprocess.DEVNULL,
+        )
+        subprocess.run(
+            [_bin("pg_ctl"), "-D", datadir, "-w", "-l", os.path.join(datadir, "server.log"),
+             "-o", f"-p {port} -k {datadir} -c listen_addresses=127.0.0.1", "start"],
+            check=True, stdout=subprocess.DEVNULL,
+        )
+        print(f"🐘 Временный PostgreSQL на порту {port}")
+        try:
+            yield f"postgresql://bench@127.0.0.1:{port}/postgres"
+        finally:
+            subprocess.run([_bin("pg_ctl"), "-D", datadir, "-m", "fast", "stop"], stdout=subprocess.DEVNULL)
+    finally:
+        shutil.rmtree(datadir, ignore_errors=True)
+
+
+# ======= Схема ======= #
+async def create_schema(dsn, schema, services=()):
+    """Отдельная схема с таблицами проекта (и сервисами services) – рабочие данные не трогаются."""
+    conn = await asyncpg.connect(dsn)
+    try:
+        with open(SCHEMA_PATH, encoding="utf-8") as file:
+            ddl = file.read()
+        await conn.execute(f"CREATE SCHEMA {schema}; SET search_path TO {schema};")
+        await conn.execute(ddl)
+        for service_name in services:
+            await conn.execute("INSERT INTO services (service_name) VALUES ($1);", service_name)
+    finally:
+        await conn.close()
+
+
+async def drop_schema(dsn, schema):
+    conn = await asyncpg.connect(dsn)
+    try:
+        await conn.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE;")
+    finally:
+        await conn.close()
@@ -0,0 +1,203 @@
+# test_change_detection.py – Запись только изменившихся товаров: категории и идентичность (бренд, название)
+import asyncio
+
+import pytest
+
+from change_detection import diff_products, product_fingerprint
+from db import Repository, get_parsed_discounts, update_parsed_discounts
+from service_parsers.crawler import CrawlIncomplete, crawl
+from service_parsers.records import ProductBatch
+from tests.test_crawler import CATALOG_URL, fake_catalog
+
+SERVICE = "Lamoda"
+
+# Остальные товары категории: пропажа одного из десятка укладывается в DEACTIVATE_MIN_RATIO
+FILLER = [(f"Носки {index}", "Uniqlo", 10) for index in range(9)]
+
+
+def make_batch(*products):
+    """Пакет из кортежей (название, бренд, процент скидки)."""
+    batch = ProductBatch()
+    for name, brand, percent in products:
+        batch.append(name, 700_000, 1_000_000, percent, brand=brand, rating="4.8", sizes="S, M")
+    return batch
+
+
+def existing_row(discount_id, batch, index, categories, is_active=True):
+    return {
+        "discount_id": discount_id,
+        "brand": batch.brands[index],
+        "product_name": batch.names[index],
+        "content_hash": product_fingerprint(batch[index]),
+        "is_active": is_active,
+        "categories": categories,
+    }
+
+
+# ======= diff_products ======= #
+def test_product_in_second_category_is_not_changed():
+    batch = make_batch(("Кроссовки", "Nike", 30))
+    diff = diff_products(batch, [existing_row(1, batch, 0, ["women"])], "men")
+
+    assert diff.changed == []
+    assert diff.unchanged == 1
+    assert diff.joined_ids == [1]
+    assert diff.disappeared_ids == []
+
+
+def category_rows(batch, first_categories):
+    """Строки базы: первый товар пакета – в first_categories, остальные – только в men."""
+    return [
+        existing_row(index + 1, batch, index, first_categories if index == 0 else ["men"])
+        for index in range(len(batch))
+    ]
+
+
+def test_product_leaving_one_category_stays_active():
+    batch = make_batch(("Кроссовки", "Nike", 30), *FILLER)
+
+    diff = diff_products(batch[1:], category_rows(batch, ["women", "men"]), "men")
+
+    assert diff.left_ids == [1]
+    assert diff.disappeared_ids == []
+
+
+def test_product_leaving_last_category_is_deactivated():
+    batch = make_batch(("Кроссовки", "Nike", 30), *FILLER)
+
+    diff = diff_products(batch[1:], category_rows(batch, ["men"]), "men")
+
+    assert diff.left_ids == [1]
+    assert diff.disappeared_ids == [1]
+
+
+def test_short_batch_deactivates_nothing():
+    # 8 товаров из 10 – скорее урезанная выдача, чем распродажа двух товаров
+    batch = make_batch(("Кроссовки", "Nike", 30), *FILLER)
+
+    diff = diff_products(batch[2:], category_rows(batch, ["men"]), "men")
+
+    assert diff.left_ids == [] and diff.disappeared_ids == []
+
+
+def test_incomplete_crawl_deactivates_nothing():
+    batch = make_batch(("Кроссовки", "Nike", 30), *FILLER)
+
+    diff = diff_products(batch[1:], category_rows(batch, ["men"]), "men", complete=False)
+
+    assert diff.unchanged == 9
+    assert diff.left_ids == [] and diff.disappeared_ids == []
+
+
+def test_same_name_different_brands_are_different_products():
+    batch = make_batch(("Футболка", "Nike", 30), ("Футболка", "Adidas", 30))
+    diff = diff_products(batch, [existing_row(1, batch, 0, ["men"])], "men")
+
+    assert diff.unchanged == 1
+    assert [record.brand for record, _ in diff.changed] == ["Adidas"]
+
+
+# ======= update_parsed_discounts ======= #
+def test_product_in_two_categories_is_written_once(connect_pool):
+    shared = ("Кроссовки", "Nike", 30)
+    women = make_batch(shared, ("Платье", "Zarina", 40))
+    men = make_batch(shared, ("Рубашка", "Baon", 25))
+
+    async def scenario():
+        pool = await connect_pool()
+        try:
+            first = [
+                await update_parsed_discounts(pool, SERVICE, women, category="women"),
+                await update_parsed_discounts(pool, SERVICE, men, category="men"),
+            ]
+            second = [
+                await update_parsed_discounts(pool, SERVICE, women, category="women"),
+                await update_parsed_discounts(pool, SERVICE, men, category="men"),
+            ]
+            snapshots = {
+                category: {row['product_name'] for row in await get_parsed_discounts(pool, SERVICE, category)}
+                for category in ("women", "men")
+            }
+            return first, second, snapshots
+        finally:
+            await pool.close()
+
+    first, second, snapshots = asyncio.run(scenario())
+
+    assert [counts["inserted"] for counts in first] == [2, 1]
+    assert [counts["updated"] for counts in first] == [0, 0]
+    for counts in second:
+        assert (counts["inserted"], counts["updated"], counts["deactivated"]) == (0, 0, 0)
+        assert counts["unchanged"] == 2
+    assert snapshots == {"women": {"Кроссовки", "Платье"}, "men": {"Кроссовки", "Рубашка"}}
+
+
+def test_product_gone_from_one_category_stays_in_other(connect_pool):
+    shared = ("Кроссовки", "Nike", 30)
+    women = make_batch(shared, ("Платье", "Zarina", 40))
+    men = make_batch(shared, ("Рубашка", "Baon", 25), ("Джинсы", "Levi's", 35), *FILLER)
+
+    async def scenario():
+        pool = await connect_pool()
+        try:
+            await update_parsed_discounts(pool, SERVICE, women, category="women")
+            await update_parsed_discounts(pool, SERVICE, men, category="men")
+            counts = await update_parsed_discounts(pool, SERVICE, men[1:], category="men")
+            men_names = {row['product_name'] for row in await get_parsed_discounts(pool, SERVICE, "men")}
+            women_names = {row['product_name'] for row in await get_parsed_discounts(pool, SERVICE, "women")}
+            return counts, men_names, women_names
+        finally:
+            await pool.close()
+
+    counts, men_names, women_names = asyncio.run(scenario())
+
+    assert counts["deactivated"] == 0
+    assert men_names == {"Рубашка", "Джинсы", *(name for name, _, _ in FILLER)}
+    assert women_names == {"Кроссовки", "Платье"}
+
+
+def test_page_failing_mid_crawl_deactivates_nothing(connect_pool):
+    # 20 страниц по 3 товара; без страницы 7 в пакете 57 из 60 – выше DEACTIVATE_MIN_RATIO,
+    # так что от отключения защищает только признак неполного обхода
+    full = crawl(CATALOG_URL, fake_catalog(20), max_pages=20)
+    with pytest.raises(CrawlIncomplete) as failure:
+        crawl(CATALOG_URL, fake_catalog(20, failing={7}), max_pages=20)
+    partial = failure.value.products
+
+    async def scenario():
+        pool = await connect_pool()
+        try:
+            await update_parsed_discounts(pool, SERVICE, full, category="men")
+            counts = await update_parsed_discounts(pool, SERVICE, partial, category="men", complete=False)
+            names = {row['product_name'] for row in await get_parsed_discounts(pool, SERVICE, "men")}
+            return counts, names
+        finally:
+            await pool.close()
+
+    counts, names = asyncio.run(scenario())
+
+    assert len(partial) == 57
+    assert counts["deactivated"] == 0 and counts["unchanged"] == 57
+    assert names == set(full.names)
+
+
+def test_parsed_discounts_by_registry_id(connect_pool):
+    batch = make_batch(("Кроссовки", "Nike", 30), ("Платье", "Zarina", 40))
+
+    async def scenario():
+        repository = Repository(await connect_pool())
+        try:
+            await repository.load_services()
+            await update_parsed_discounts(repository, SERVICE, batch, category="women")
+            return (
+                [row['product_name'] for row in await get_parsed_discounts(repository, SERVICE, "women")],
+                await get_parsed_discounts(repository, "Нет такого сервиса"),
+                SERVICE in repository.services,
+            )
+        finally:
+            await repository.close()
+
+    names, unknown, registered = asyncio.run(scenario())
+
+    assert names == ["Платье", "Кроссовки"]
+    assert unknown == [] and registered
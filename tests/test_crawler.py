@@ -0,0 +1,47 @@
+# test_crawler.py – Обход каталога: неудачные страницы делают обход неполным
+import pytest
+
+from service_parsers.crawler import CrawlIncomplete, crawl, page_url
+from service_parsers.records import ProductBatch
+
+CATALOG_URL = "https://shop.example/catalog?sale=1"
+
+
+def fake_catalog(pages, failing=(), pagination=True, per_page=3):
+    """fetch_page(url) для каталога из pages страниц; страницы failing бросают ошибку."""
+    by_url = {page_url(CATALOG_URL, page): page for page in range(1, pages + 10)}
+
+    def fetch_page(url):
+        page = by_url[url]
+        if page in failing:
+            raise TimeoutError(f"страница {page} не дождалась карточек")
+        batch = ProductBatch()
+        if page <= pages:
+            for index in range(per_page):
+                batch.append(f"Товар {page}-{index}", 100_000, 200_000, 50)
+        html = f'<a href="?sale=1&page={pages}">{pages}</a>' if pagination else ""
+        return batch, html
+
+    return fetch_page
+
+
+def test_complete_crawl_returns_all_pages():
+    products = crawl(CATALOG_URL, fake_catalog(5), max_pages=10)
+    assert len(products) == 15
+
+
+def test_failed_page_raises_with_collected_products():
+    with pytest.raises(CrawlIncomplete) as failure:
+        crawl(CATALOG_URL, fake_catalog(5, failing={3}), max_pages=10)
+    assert failure.value.failed_pages == [3]
+    assert len(failure.value.products) == 12
+
+
+def test_failure_past_end_of_feed_is_not_a_gap():
+    # Бесконечная лента: страницы за концом ленты не отдаются вовсе
+    fetch_page = fake_catalog(6, failing=set(range(7, 20)), pagination=False)
+    assert len(crawl(CATALOG_URL, fetch_page, max_pages=12)) == 18
+
+    with pytest.raises(CrawlIncomplete) as failure:
+        crawl(CATALOG_URL, fake_catalog(6, failing={2}, pagination=False), max_pages=12)
+    assert failure.value.failed_pages == [2]
@@ -0,0 +1,82 @@
+# test_discount_cache.py – Single-flight загрузка снимков: отмена ожидающих, ошибки, устаревший снимок
+import asyncio
+
+import pytest
+
+from discount_cache import DiscountSnapshotCache
+
+
+class SlowLoader:
+    """Загрузчик, который ждёт release и считает вызовы."""
+
+    def __init__(self, result="fresh"):
+        self.calls = 0
+        self.result = result
+        self.release = asyncio.Event()
+        self.error = None
+
+    async def __call__(self, store, category):
+        self.calls += 1
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return [self.result, self.calls]
+
+
+def test_leader_cancellation_does_not_fail_waiters():
+    async def scenario():
+        loader = SlowLoader()
+        cache = DiscountSnapshotCache(loader)
+        leader = asyncio.create_task(cache.get("magnum"))
+        waiter = asyncio.create_task(cache.get("magnum"))
+        await asyncio.sleep(0)
+
+        leader.cancel()
+        await asyncio.sleep(0)
+        loader.release.set()
+
+        assert await waiter == ["fresh", 1]
+        assert leader.cancelled()
+        assert loader.calls == 1
+        # Результат остался в кэше, хотя первый вызов ушёл
+        assert await cache.get("magnum") == ["fresh", 1]
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_load_is_retried_for_waiters():
+    async def scenario():
+        loader = SlowLoader()
+        cache = DiscountSnapshotCache(loader)
+        waiter = asyncio.create_task(cache.get("magnum"))
+        while not loader.calls:
+            await asyncio.sleep(0)
+
+        cache._inflight[("magnum", None)].cancel()
+        await asyncio.sleep(0)
+        loader.release.set()
+
+        assert await waiter == ["fresh", 2]
+        assert not cache._inflight
+
+    asyncio.run(scenario())
+
+
+def test_failed_load_is_cleared_and_stale_snapshot_served():
+    async def scenario():
+        loader = SlowLoader()
+        cache = DiscountSnapshotCache(loader, ttl=0)
+        loader.release.set()
+        assert await cache.get("magnum") == ["fresh", 1]
+
+        loader.error = ConnectionError("db down")
+        assert await asyncio.gather(cache.get("magnum"), cache.get("magnum")) == [["fresh", 1]] * 2
+        assert not cache._inflight
+
+        # Без снимка ошибка доходит до вызывающего, следующая попытка снова идёт в базу
+        with pytest.raises(ConnectionError):
+            await cache.get("lamoda")
+        loader.error = None
+        assert await cache.get("lamoda") == ["fresh", 4]
+
+    asyncio.run(scenario())
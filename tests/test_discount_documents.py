@@ -0,0 +1,39 @@
+# test_discount_documents.py – Документы скидок пересобираются только при изменении снимка
+from discount_documents import DiscountDocuments
+from service_parsers.records import ProductBatch
+
+
+def make_batch(percents):
+    batch = ProductBatch()
+    for index, percent in enumerate(percents):
+        batch.append(f"Товар {index}", 700_000, 1_000_000, percent, brand="Nike", rating="4.8")
+    return batch
+
+
+def test_reload_with_same_content_keeps_documents():
+    documents = DiscountDocuments()
+    documents.rebuild("lamoda", "men", make_batch([15, 35, 55]))
+    document = documents.get("lamoda", "men", 30)
+    documents.remember_file_id(document, "file-1")
+
+    # Перезагрузка по TTL: новый объект пакета с теми же товарами
+    reloaded = make_batch([15, 35, 55])
+    documents.rebuild("lamoda", "men", reloaded)
+
+    assert documents.get("lamoda", "men", 30) is document
+    assert documents.file_id(documents.get("lamoda", "men", 30)) == "file-1"
+    assert documents._stores[("lamoda", "men")].batch is reloaded
+
+
+def test_changed_content_rebuilds_documents():
+    documents = DiscountDocuments()
+    documents.rebuild("lamoda", "men", make_batch([15, 35, 55]))
+    document = documents.get("lamoda", "men", 30)
+    documents.remember_file_id(document, "file-1")
+
+    documents.rebuild("lamoda", "men", make_batch([15, 35, 60]))
+
+    rebuilt = documents.get("lamoda", "men", 30)
+    assert rebuilt is not document and rebuilt.count == 2
+    assert documents.file_id(rebuilt) is None
+    assert documents.get("lamoda", "men", 50).count == 1
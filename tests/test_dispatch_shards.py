@@ -0,0 +1,106 @@
+# test_dispatch_shards.py – Ведра рассылки: брошенное незавершённое ведро рассылает другая реплика
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+os.environ.setdefault("BOT_TOKEN", "123456:test")
+
+import scheduler  # noqa: E402
+from db import add_subscription, add_user, update_parsed_discounts  # noqa: E402
+from dispatch_shards import ShardCoordinator, bucket_of  # noqa: E402
+from notification_dispatcher import NotificationDispatcher  # noqa: E402
+from service_parsers.records import ProductBatch  # noqa: E402
+from tests.conftest import TEST_SERVICE  # noqa: E402
+from tests.test_notification_dispatcher import UNLIMITED_RATE, FakeBot  # noqa: E402
+
+USER_ID = 7
+TICK = datetime(2026, 3, 1, 9, 30)
+
+
+class DueIndex:
+    """Индекс подписок: в минуту due_time рассылка для user_ids, в остальные – ни для кого."""
+
+    def __init__(self, due_time, user_ids):
+        self.due_time = due_time
+        self.user_ids = user_ids
+
+    def due_user_ids(self, value):
+        return list(self.user_ids) if value == self.due_time else []
+
+
+async def claim_row(pool, tick):
+    return await pool.fetchrow(
+        "SELECT replica_id, finished_at IS NOT NULL AS finished FROM dispatch_claims WHERE tick = $1;", tick
+    )
+
+
+def test_live_claim_is_kept_and_expired_claim_is_taken_over(connect_pool):
+    async def scenario():
+        pool = await connect_pool()
+        try:
+            alive = ShardCoordinator("replica-a", claim_lease_seconds=60)
+            dead = ShardCoordinator("replica-b", claim_lease_seconds=0)
+            taker = ShardCoordinator("replica-c")
+            live_tick, dead_tick = TICK, TICK + timedelta(minutes=1)
+
+            claims = {
+                "alive": await alive.claim(pool, live_tick, [USER_ID], orphans=True),
+                "dead": await dead.claim(pool, dead_tick, [USER_ID], orphans=True),
+            }
+            await asyncio.sleep(0.05)
+            claims["taker_live"] = await taker.claim(pool, live_tick, [USER_ID], orphans=True)
+            claims["taker_dead"] = await taker.claim(pool, dead_tick, [USER_ID], orphans=True)
+            # Упавшая реплика «ожила» и закрывает ведро, которое уже не её
+            await dead.finish(pool, dead_tick, claims["dead"])
+            after_late_finish = await claim_row(pool, dead_tick)
+            await taker.finish(pool, dead_tick, claims["taker_dead"])
+            return claims, after_late_finish, await claim_row(pool, dead_tick)
+        finally:
+            await pool.close()
+
+    claims, after_late_finish, finished = asyncio.run(scenario())
+    bucket = bucket_of(USER_ID)
+
+    assert claims == {"alive": {bucket}, "dead": {bucket}, "taker_live": set(), "taker_dead": {bucket}}
+    assert (after_late_finish['replica_id'], after_late_finish['finished']) == ("replica-c", False)
+    assert (finished['replica_id'], finished['finished']) == ("replica-c", True)
+
+
+def test_claimed_unfinished_bucket_is_dispatched_by_another_replica(connect_pool, monkeypatch):
+    now = datetime.now(scheduler.almaty_timezone).replace(second=0, microsecond=0, tzinfo=None)
+    tick = now - timedelta(minutes=2)
+    bot = FakeBot()
+    monkeypatch.setattr(scheduler, "dispatcher", NotificationDispatcher(
+        bot, global_rate=UNLIMITED_RATE, per_chat_rate=UNLIMITED_RATE
+    ))
+    monkeypatch.setattr(scheduler, "subscription_index", DueIndex(tick.time(), [USER_ID]))
+
+    async def scenario():
+        pool = await connect_pool()
+        try:
+            batch = ProductBatch()
+            batch.append("Кроссовки", 700_000, 1_000_000, 30, brand="Nike")
+            await update_parsed_discounts(pool, TEST_SERVICE, batch)
+            await add_user(pool, USER_ID)
+            await add_subscription(pool, USER_ID, TEST_SERVICE, 20, tick.time())
+
+            # Реплика взяла ведро минуты и упала, не закончив рассылку
+            dead = ShardCoordinator("replica-dead", claim_lease_seconds=0)
+            await dead.claim(pool, tick, [USER_ID], orphans=True)
+            await asyncio.sleep(0.05)
+
+            monkeypatch.setattr(scheduler, "shards", ShardCoordinator("replica-live"))
+            await scheduler.send_discount_notifications(pool, orphans=True)
+            sent = await pool.fetchval("SELECT COUNT(*) FROM sent_discounts WHERE user_id = $1;", USER_ID)
+            # Повторный проход ничего не рассылает: ведро закрыто
+            await scheduler.send_discount_notifications(pool, orphans=True)
+            return await claim_row(pool, tick), sent
+        finally:
+            await pool.close()
+
+    claim, sent = asyncio.run(scenario())
+
+    assert [chat_id for _, chat_id, _ in bot.messages] == [USER_ID]
+    assert "Кроссовки" in bot.messages[0][2]
+    assert sent == 1
+    assert (claim['replica_id'], claim['finished']) == ("replica-live", True)
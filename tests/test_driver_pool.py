@@ -0,0 +1,104 @@
+# test_driver_pool.py – Профили загрузки страниц: шаблоны Fetch и блокировщик запросов на поддельном DevTools
+import json
+import socket
+import threading
+import time
+
+from wsproto import ConnectionType, WSConnection
+from wsproto.events import AcceptConnection, CloseConnection, Request, TextMessage
+
+from service_parsers.driver_pool import RENDER_PROFILES, RequestBlocker
+
+TAB_ID = "TAB-1"
+
+
+class FakeDevTools:
+    """Вкладка DevTools: отвечает на команды, а после Fetch.enable приостанавливает один запрос картинки."""
+
+    def __init__(self):
+        self.commands = []
+        self.headers = {}
+        self.target = None
+        self._sock = socket.socket()
+        self._sock.bind(("127.0.0.1", 0))
+        self._sock.listen(1)
+        self.address = f"127.0.0.1:{self._sock.getsockname()[1]}"
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        conn, _ = self._sock.accept()
+        ws = WSConnection(ConnectionType.SERVER)
+
+        def send(message):
+            conn.sendall(ws.send(TextMessage(json.dumps(message))))
+
+        while True:
+            data = conn.recv(65536)
+            if not data:
+                break
+            ws.receive_data(data)
+            for event in ws.events():
+                if isinstance(event, Request):
+                    self.target = event.target
+                    self.headers = {name.decode().lower(): value for name, value in event.extra_headers}
+                    conn.sendall(ws.send(AcceptConnection()))
+                elif isinstance(event, TextMessage):
+                    command = json.loads(event.data)
+                    self.commands.append(command)
+                    send({"id": command["id"], "result": {}})
+                    if command["method"] == "Fetch.enable":
+                        send({"method": "Fetch.requestPaused", "params": {"requestId": "r-1", "resourceType": "Image"}})
+                elif isinstance(event, CloseConnection):
+                    conn.sendall(ws.send(event.response()))
+                    conn.close()
+                    return
+
+    def methods(self):
+        return [command["method"] for command in self.commands]
+
+    def wait_for(self, method, timeout=5):
+        deadline = time.monotonic() + timeout
+        while method not in self.methods():
+            assert time.monotonic() < deadline, f"{method} не пришёл: {self.methods()}"
+            time.sleep(0.01)
+
+
+class FakeDriver:
+    def __init__(self, address):
+        self.capabilities = {"goog:chromeOptions": {"debuggerAddress": address}}
+        self.current_window_handle = TAB_ID
+
+
+def test_light_profile_blocks_by_resource_type():
+    light = RENDER_PROFILES["light"]
+
+    patterns = light.fetch_patterns()
+    with_styles = light.fetch_patterns(allow=("styles", "*mc.yandex.ru*"))
+
+    assert RENDER_PROFILES["full"].fetch_patterns() == []
+    assert [pattern.get("resourceType") for pattern in patterns[:4]] == ["Image", "Media", "Font", "Stylesheet"]
+    assert all(pattern["urlPattern"] == "*" for pattern in patterns[:4])
+    assert {"urlPattern": "*mc.yandex.ru*", "requestStage": "Request"} in patterns
+    assert "Stylesheet" not in [pattern.get("resourceType") for pattern in with_styles]
+    assert len(with_styles) == len(patterns) - 2
+
+
+def test_blocker_fails_paused_requests():
+    devtools = FakeDevTools()
+    blocker = RequestBlocker(FakeDriver(devtools.address))
+    try:
+        patterns = RENDER_PROFILES["light"].fetch_patterns()
+        blocker.set_patterns(patterns)
+        devtools.wait_for("Fetch.failRequest")
+        # Те же шаблоны для следующей страницы – повторно не отправляются
+        blocker.set_patterns(list(patterns))
+        blocker.set_patterns([])
+        devtools.wait_for("Fetch.disable")
+    finally:
+        blocker.close()
+
+    assert devtools.target == f"/devtools/page/{TAB_ID}"
+    assert "origin" not in devtools.headers
+    assert devtools.methods() == ["Fetch.enable", "Fetch.failRequest", "Fetch.disable"]
+    assert devtools.commands[0]["params"]["patterns"] == patterns
+    assert devtools.commands[1]["params"] == {"requestId": "r-1", "errorReason": "BlockedByClient"}
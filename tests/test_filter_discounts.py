@@ -0,0 +1,42 @@
+# test_filter_discounts.py – ThresholdMatcher против построчного фильтра filter_discounts_by_threshold
+import random
+
+import pytest
+
+from scripts.filter_discounts import ThresholdMatcher, filter_discounts_by_threshold, match_subscriptions
+
+
+def random_discounts(gen, size):
+    """Словари парсера с процентом 0..150 или без скидки (None)."""
+    return [
+        {"name": f"Товар {index}", "discount_percent": None if gen.random() < 0.1 else gen.randint(0, 150)}
+        for index in range(size)
+    ]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_matcher_agrees_with_scalar_filter(seed):
+    gen = random.Random(seed)
+    discounts = random_discounts(gen, gen.randint(0, 300))
+    thresholds = [gen.choice((gen.randint(-50, 160), gen.randint(-100_000, 100_000))) for _ in range(50)]
+    thresholds += [0, 100, 32_767, 32_768, 40_000, -32_769, 2 ** 40]
+
+    matcher = ThresholdMatcher([item["discount_percent"] for item in discounts])
+    counts = matcher.counts(thresholds)
+
+    for threshold, count in zip(thresholds, counts):
+        expected = filter_discounts_by_threshold(discounts, threshold)
+        matched = [discounts[index] for index in matcher.indices(threshold)]
+        assert count == len(expected)
+        assert sorted(matched, key=lambda item: item["name"]) == sorted(expected, key=lambda item: item["name"])
+        # От большей скидки к меньшей, при равной – в порядке парсера
+        assert matched == sorted(expected, key=lambda item: -item["discount_percent"])
+
+
+def test_huge_threshold_matches_nothing():
+    matcher = ThresholdMatcher([10, 50, 99])
+
+    assert list(matcher.counts([40_000])) == [0]
+    assert match_subscriptions(
+        {1: matcher}, [{"user_id": 7, "service_id": 1, "discount_threshold": 40_000}]
+    ) == {}
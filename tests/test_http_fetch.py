@@ -0,0 +1,156 @@
+# test_http_fetch.py – Загрузка без браузера на записанных ответах Magnum и Lamoda (tests/fixtures)
+import os
+import shutil
+
+import pytest
+
+from service_parsers import http_fetch
+from service_parsers.http_fetch import (
+    SCHEMA_ORG_MAPPING,
+    extract_embedded_state,
+    fetch_products_http,
+    products_from_html,
+    products_from_state
+)
+from service_parsers.lamoda_discount_parser import LAMODA_STATE_MAPPING, lamoda_extractor
+from service_parsers.magnum_discount_parser import MAGNUM_STATE_MAPPING, magnum_extractor
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+MAGNUM_URL = "https://magnum.kz/catalog?discountType=all&city=almaty"
+LAMODA_URL = "https://www.lamoda.kz/c/4153/default-women/?is_sale=1"
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as file:
+        return file.read()
+
+
+def by_name(products):
+    return {product["name"]: product for product in products}
+
+
+@pytest.fixture
+def replay_dir(tmp_path, monkeypatch):
+    """HTTP_REPLAY_DIR с записанными ответами: record(url, fixture) кладёт файл под именем записи url."""
+    monkeypatch.setattr(http_fetch, "HTTP_REPLAY_DIR", str(tmp_path))
+
+    def record(url, fixture):
+        shutil.copy(os.path.join(FIXTURES_DIR, fixture), http_fetch._recording_path(str(tmp_path), url))
+
+    return record
+
+
+# ======= Встроенное состояние ======= #
+def test_extract_next_data():
+    states = extract_embedded_state(read_fixture("magnum_next_data.html"))
+
+    assert len(states) == 1
+    assert states[0]["props"]["pageProps"]["catalog"]["totalPages"] == 3
+
+
+def test_extract_window_state():
+    states = extract_embedded_state(read_fixture("lamoda_window_state.html"))
+
+    assert len(states) == 1
+    assert [p["sku"] for p in states[0]["catalog"]["products"]] == ["MP002XW0A1B2", "MP002XW0C3D4"]
+
+
+def test_extract_ld_json():
+    states = extract_embedded_state(read_fixture("magnum_schema_org.html"))
+
+    assert [state["@type"] for state in states] == ["ItemList"]
+
+
+def test_page_without_state():
+    assert extract_embedded_state(read_fixture("lamoda_cards.html")) == []
+
+
+# ======= Товары из состояния ======= #
+def test_magnum_mapping_projects_fields():
+    states = extract_embedded_state(read_fixture("magnum_next_data.html"))
+    products = by_name(products_from_state(states, MAGNUM_STATE_MAPPING))
+
+    assert set(products) == {"Молоко Моя Семья 3,2% 1 л", "Кофе Jacobs Monarch 95 г", "Шоколад Казахстан 100 г"}
+    assert all(set(product) == set(MAGNUM_STATE_MAPPING.fields) for product in products.values())
+    assert products["Молоко Моя Семья 3,2% 1 л"] == {
+        "name": "Молоко Моя Семья 3,2% 1 л", "price": "599 ₸", "old_price": "799 ₸", "discount": "−25%",
+    }
+    # Скидки нет в состоянии – считается по ценам
+    assert products["Кофе Jacobs Monarch 95 г"]["discount"] == "−24%"
+
+
+def test_lamoda_mapping_reads_nested_values():
+    states = extract_embedded_state(read_fixture("lamoda_window_state.html"))
+    products = by_name(products_from_state(states, LAMODA_STATE_MAPPING))
+
+    assert products["Кроссовки Air Max"] == {
+        "brand": "Nike", "name": "Кроссовки Air Max", "price": "45 990 ₸", "old_price": "65 990 ₸",
+        "discount": "−30%", "rating": "4.7", "sizes": "40, 41, 42",
+    }
+    assert products["Платье миди"]["discount"] == "−50%"
+    assert products["Платье миди"]["rating"] == "Нет"
+
+
+def test_store_mapping_ignores_schema_org():
+    states = extract_embedded_state(read_fixture("magnum_schema_org.html"))
+
+    assert products_from_state(states, MAGNUM_STATE_MAPPING) == []
+
+
+def test_schema_org_mapping():
+    states = extract_embedded_state(read_fixture("magnum_schema_org.html"))
+    products = by_name(products_from_state(states, SCHEMA_ORG_MAPPING))
+
+    assert products["Сыр Ламбер 50% 1 кг"] == {
+        "brand": "Ламбер", "name": "Сыр Ламбер 50% 1 кг", "price": "4 390 ₸", "old_price": "Нет",
+        "discount": "Нет", "rating": "4.6", "sizes": "",
+    }
+    assert products["Чай Пиала 100 пак."]["brand"] == "Нет"
+
+
+def test_schema_org_fallback_projects_store_fields():
+    products = products_from_html(
+        read_fixture("magnum_schema_org.html"), MAGNUM_URL, MAGNUM_STATE_MAPPING, magnum_extractor
+    )
+
+    assert by_name(products)["Сыр Ламбер 50% 1 кг"] == {
+        "name": "Сыр Ламбер 50% 1 кг", "price": "4 390 ₸", "old_price": "Нет", "discount": "Нет",
+    }
+    assert len(products) == 2
+
+
+def test_html_extractor_fallback():
+    products = products_from_html(read_fixture("lamoda_cards.html"), LAMODA_URL, LAMODA_STATE_MAPPING, lamoda_extractor)
+
+    assert [product["name"] for product in products] == ["Куртка", "Блузка"]
+    assert products[0]["discount"] == "−50%"
+    assert products[0]["sizes"] == "M, L"
+    assert products[1]["old_price"] == "Нет"
+
+
+# ======= Воспроизведение записанных ответов ======= #
+def test_fetch_magnum_from_replay(replay_dir):
+    replay_dir(MAGNUM_URL, "magnum_next_data.html")
+
+    products, html = fetch_products_http(MAGNUM_URL, MAGNUM_STATE_MAPPING, magnum_extractor)
+
+    assert html == read_fixture("magnum_next_data.html")
+    assert len(products) == 3
+    assert by_name(products)["Шоколад Казахстан 100 г"]["old_price"] == "600 ₸"
+
+
+def test_fetch_lamoda_from_replay(replay_dir):
+    replay_dir(LAMODA_URL, "lamoda_window_state.html")
+    replay_dir(LAMODA_URL + "&page=2", "lamoda_cards.html")
+
+    first, _ = fetch_products_http(LAMODA_URL, LAMODA_STATE_MAPPING, lamoda_extractor)
+    second, _ = fetch_products_http(LAMODA_URL + "&page=2", LAMODA_STATE_MAPPING, lamoda_extractor)
+
+    assert set(by_name(first)) == {"Кроссовки Air Max", "Платье миди"}
+    assert [product["name"] for product in second] == ["Куртка", "Блузка"]
+
+
+def test_replay_without_recording(replay_dir):
+    with pytest.raises(FileNotFoundError):
+        fetch_products_http(MAGNUM_URL, MAGNUM_STATE_MAPPING, magnum_extractor)
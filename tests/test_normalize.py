@@ -0,0 +1,75 @@
+# test_normalize.py – Цены и скидки в тех форматах, которые приходят от Magnum и Lamoda
+import pytest
+
+from service_parsers.normalize import (
+    format_percent,
+    format_price,
+    normalize_product,
+    parse_percent,
+    parse_price_minor
+)
+
+
+@pytest.mark.parametrize("text, minor", [
+    # Карточки (текст с пробелами и неразрывными пробелами)
+    ("12 990 ₸", 1_299_000),
+    ("129 960 ₸", 12_996_000),
+    ("1 299 ₸", 129_900),
+    ("1 299 ₸", 129_900),
+    ("599 ₸", 59_900),
+    # Встроенное состояние и schema.org: строки и числа
+    ("45 990", 4_599_000),
+    ("4390", 439_000),
+    ("12990.00", 1_299_000),
+    ("12990.5", 1_299_050),
+    (14990, 1_499_000),
+    (450.5, 45_050),
+    # Точка или запятая как разделитель разрядов
+    ("1.299 ₸", 129_900),
+    ("1,299 ₸", 129_900),
+    ("1.299.000 ₸", 129_900_000),
+    ("1,299.50", 129_950),
+    ("1.299,50 ₸", 129_950),
+    ("12 990,50 ₸", 1_299_050),
+    ("12,5", 1_250),
+    ("Цена: 0,99 ₸", 99),
+    # Цены нет
+    (None, None),
+    ("Нет", None),
+    ("Цена отсутствует", None),
+])
+def test_parse_price_minor(text, minor):
+    assert parse_price_minor(text) == minor
+
+
+@pytest.mark.parametrize("minor, text", [
+    (1_299_000, "12 990 ₸"),
+    (1_299_050, "12 990,50 ₸"),
+    (5, "0,05 ₸"),
+    (0, "0 ₸"),
+    (-5, "−0,05 ₸"),
+    (-129_950, "−1 299,50 ₸"),
+    (None, "Нет"),
+])
+def test_format_price(minor, text):
+    assert format_price(minor) == text
+
+
+@pytest.mark.parametrize("minor", [1_299_000, 129_950, 99, 12_996_000])
+def test_format_price_round_trip(minor):
+    assert parse_price_minor(format_price(minor)) == minor
+
+
+@pytest.mark.parametrize("text, percent", [
+    ("−30%", 30), ("-30 %", 30), ("Скидка 15%", 15), (30, 30), (-30, 30), ("Нет", None), (None, None),
+])
+def test_parse_percent(text, percent):
+    assert parse_percent(text) == percent
+
+
+def test_normalize_product_computes_missing_percent():
+    product = normalize_product({"price": "7 000 ₸", "old_price": "10.000 ₸", "discount": None})
+
+    assert (product["price_minor"], product["old_price_minor"]) == (700_000, 1_000_000)
+    assert product["discount_percent"] == 30
+    assert format_percent(product["discount_percent"]) == "−30%"
@@ -0,0 +1,93 @@
+# test_notification_dispatcher.py – Рассылка с фейковым ботом: лимиты, RetryAfter, деление на части
+import asyncio
+import time
+
+from telegram.error import Forbidden, RetryAfter
+
+from notification_dispatcher import Delivery, NotificationDispatcher, split_message
+
+UNLIMITED_RATE = 1_000_000
+
+
+class FakeBot:
+    """Бот, который запоминает отправленное и по очереди бросает заданные ошибки."""
+
+    def __init__(self, errors=None):
+        self.messages = []  # (время отправки, chat_id, текст)
+        self.errors = errors or {}  # Номер вызова send_message -> исключение
+
+    async def send_message(self, chat_id, text):
+        call = len(self.messages)
+        self.messages.append((time.monotonic(), chat_id, text))
+        error = self.errors.pop(call, None)
+        if error is not None:
+            raise error
+
+
+def make_delivery(chat_id, blocks, size):
+    """Уведомление из блоков по size символов; sent – номера блоков."""
+    text, ends = "", []
+    for block in range(blocks):
+        text += f"{block:0{size - 1}d}\n"
+        ends.append(len(text))
+    return Delivery(chat_id, text, list(range(blocks)), ends)
+
+
+def test_long_message_is_split_and_sent_in_order():
+    delivery = make_delivery(1, blocks=10, size=1000)
+    bot = FakeBot()
+    dispatcher = NotificationDispatcher(bot, global_rate=UNLIMITED_RATE, per_chat_rate=UNLIMITED_RATE)
+
+    [result] = asyncio.run(dispatcher.dispatch([delivery]))
+
+    texts = [text for _, _, text in bot.messages]
+    assert texts == split_message(delivery.text)
+    assert len(texts) == 3 and all(len(text) <= 4096 for text in texts)
+    assert "".join(texts) == delivery.text
+    assert result.ok and result.sent == delivery.sent
+
+
+def test_global_and_per_chat_rates_are_respected():
+    bot = FakeBot()
+    dispatcher = NotificationDispatcher(bot, global_rate=20, per_chat_rate=UNLIMITED_RATE)
+    asyncio.run(dispatcher.dispatch([Delivery(chat_id, "hi") for chat_id in range(5)]))
+    sent_at = [at for at, _, _ in bot.messages]
+    assert sent_at[-1] - sent_at[0] >= 4 / 20 * 0.9
+
+    bot = FakeBot()
+    dispatcher = NotificationDispatcher(bot, global_rate=UNLIMITED_RATE, per_chat_rate=10)
+    asyncio.run(dispatcher.dispatch([make_delivery(1, blocks=12, size=1000)]))
+    sent_at = [at for at, _, _ in bot.messages]
+    assert len(sent_at) == 3 and sent_at[-1] - sent_at[0] >= 2 / 10 * 0.9
+
+
+def test_retry_after_pauses_every_chat():
+    # Первая отправка получает RetryAfter – отправка во второй чат ждёт ту же паузу
+    bot = FakeBot({0: RetryAfter(0.3)})
+    dispatcher = NotificationDispatcher(bot, global_rate=UNLIMITED_RATE, per_chat_rate=UNLIMITED_RATE)
+
+    results = asyncio.run(dispatcher.dispatch([Delivery(1, "first"), Delivery(2, "second")]))
+
+    assert all(result.ok for result in results)
+    (failed_at, _, _), *others = bot.messages
+    assert [chat_id for _, chat_id, _ in others] == [2, 1]
+    assert all(at - failed_at >= 0.3 * 0.9 for at, _, _ in others)
+
+
+def test_failed_chunk_marks_only_delivered_blocks():
+    delivery = make_delivery(1, blocks=10, size=1000)
+    bot = FakeBot({1: Forbidden("bot was blocked by the user")})
+    dispatcher = NotificationDispatcher(bot, global_rate=UNLIMITED_RATE, per_chat_rate=UNLIMITED_RATE)
+
+    [result] = asyncio.run(dispatcher.dispatch([delivery]))
+
+    first_chunk = split_message(delivery.text)[0]
+    assert not result.ok and result.partial
+    assert result.delivered_chars == len(first_chunk)
+    assert result.sent == [0, 1, 2, 3]
+    # Без разметки блоков недоставленное сообщение не отмечается
+    bare = Delivery(1, delivery.text, delivery.sent)
+    [result] = asyncio.run(NotificationDispatcher(
+        FakeBot({1: Forbidden("blocked")}), global_rate=UNLIMITED_RATE, per_chat_rate=UNLIMITED_RATE
+    ).dispatch([bare]))
+    assert result.partial and result.sent == ()
@@ -0,0 +1,49 @@
+# test_records.py – ProductBatch: строки базы -> колонки -> ThresholdMatcher и сериализация
+from scripts.filter_discounts import ThresholdMatcher
+from service_parsers.records import MISSING, ProductBatch
+
+ROWS = [
+    {"discount_id": 1, "product_name": "Кроссовки", "brand": "Nike", "price_new": 700_000,
+     "price_old": 1_000_000, "discount_percent": 30, "rating": "4.8", "sizes": "41, 42"},
+    {"discount_id": 2, "product_name": "Носки", "brand": None, "price_new": 50_000,
+     "price_old": None, "discount_percent": None, "rating": None, "sizes": None},
+    {"discount_id": 3, "product_name": "Уценённое пальто", "brand": "Zarina", "price_new": 0,
+     "price_old": 2_000_000, "discount_percent": 150, "rating": None, "sizes": "M"},
+    {"discount_id": 4, "product_name": "Шапка", "brand": "Uniqlo", "price_new": 500_000,
+     "price_old": 500_000, "discount_percent": 0, "rating": "5.0", "sizes": None},
+]
+
+
+def test_rows_to_matcher_round_trip():
+    batch = ProductBatch.from_rows(ROWS)
+    matcher = ThresholdMatcher.from_batch(batch)
+
+    assert list(batch.percents) == [30, MISSING, 150, 0]
+    assert len(matcher) == 4
+    # Процент выше 100 проходит любой порог до 150, товар без скидки – никакой
+    assert [list(matcher.indices(threshold)) for threshold in (0, 31, 100, 150, 151)] == [
+        [2, 0, 3], [2], [2], [2], [],
+    ]
+    assert [batch.discount_ids[index] for index in matcher.indices(1)] == [3, 1]
+    assert list(matcher.counts([0, 30, 151])) == [3, 2, 0]
+
+
+def test_matcher_from_batch_equals_matcher_from_list():
+    batch = ProductBatch.from_rows(ROWS)
+    thresholds = [-5, 0, 1, 30, 100, 150, 40_000]
+
+    from_batch = ThresholdMatcher.from_batch(batch)
+    from_list = ThresholdMatcher([row["discount_percent"] for row in ROWS])
+
+    assert list(from_batch.order) == list(from_list.order)
+    assert list(from_batch.counts(thresholds)) == list(from_list.counts(thresholds))
+
+
+def test_bytes_round_trip_keeps_columns():
+    batch = ProductBatch.from_rows(ROWS)
+
+    restored = ProductBatch.from_bytes(batch.to_bytes())
+
+    assert list(restored) == list(batch)
+    assert restored[1].discount_percent is None and restored[1].old_price_minor is None
+    assert list(ThresholdMatcher.from_batch(restored).indices(0)) == [2, 0, 3]
@@ -0,0 +1,78 @@
+# test_scrape_queue.py – Очередь парсинга: одно задание – одному воркеру, брошенная аренда забирается
+import asyncio
+
+from db import (
+    claim_scrape_job,
+    complete_scrape_job,
+    enqueue_crawls,
+    fail_scrape_job,
+    get_crawl_pages,
+    heartbeat_scrape_job
+)
+from service_parsers.records import ProductBatch
+
+CRAWLS = 6
+
+
+def crawl_rows(count):
+    return [
+        ("Lamoda", f"category-{index}", None, f"https://shop.example/c/{index}", 1)
+        for index in range(count)
+    ]
+
+
+def test_concurrent_claimers_never_share_a_job(connect_pool):
+    async def scenario():
+        pool = await connect_pool()
+        try:
+            crawl_ids = await enqueue_crawls(pool, crawl_rows(CRAWLS))
+            claims = await asyncio.gather(*(
+                claim_scrape_job(pool, f"worker-{index}", 60) for index in range(CRAWLS * 3)
+            ))
+            # Пока аренды действуют, забирать больше нечего
+            again = await claim_scrape_job(pool, "late-worker", 60)
+            return crawl_ids, claims, again
+        finally:
+            await pool.close()
+
+    crawl_ids, claims, again = asyncio.run(scenario())
+    jobs = [job for job in claims if job is not None]
+
+    assert len(crawl_ids) == CRAWLS
+    assert len(jobs) == CRAWLS
+    assert len({job['job_id'] for job in jobs}) == CRAWLS
+    assert sorted(job['crawl_id'] for job in jobs) == sorted(crawl_ids)
+    assert again is None
+
+
+def test_expired_lease_is_reclaimed(connect_pool):
+    async def scenario():
+        pool = await connect_pool()
+        try:
+            [crawl_id] = await enqueue_crawls(pool, crawl_rows(1))
+            # Воркер взял страницу и пропал: аренда на 0 секунд истекает сразу
+            lost = await claim_scrape_job(pool, "dead-worker", 0)
+            await asyncio.sleep(0.05)
+            reclaimed = await claim_scrape_job(pool, "live-worker", 60)
+
+            outcomes = {
+                "dead_heartbeat": await heartbeat_scrape_job(pool, lost['job_id'], "dead-worker", 60),
+                "dead_complete": await complete_scrape_job(pool, lost, "dead-worker", b"", 0),
+                "dead_fail": await fail_scrape_job(pool, lost, "dead-worker", "timeout", 0),
+                "live_complete": await complete_scrape_job(
+                    pool, reclaimed, "live-worker", ProductBatch().to_bytes(), 0
+                ),
+            }
+            pages = await get_crawl_pages(pool, crawl_id, with_results=False)
+            return lost, reclaimed, outcomes, pages
+        finally:
+            await pool.close()
+
+    lost, reclaimed, outcomes, pages = asyncio.run(scenario())
+
+    assert reclaimed is not None and reclaimed['job_id'] == lost['job_id']
+    assert (lost['attempts'], reclaimed['attempts']) == (1, 2)
+    assert outcomes == {
+        "dead_heartbeat": False, "dead_complete": "lost", "dead_fail": "lost", "live_complete": "ready",
+    }
+    assert [(page['page'], page['status']) for page in pages] == [(1, "done")]
@@ -0,0 +1,119 @@
+# test_seen_index.py – Индекс просмотренных: догрузка строк, зафиксированных не по порядку sent_id, и перечитывание
+import asyncio
+from datetime import datetime
+
+import seen_index
+from db import purge_inactive_discounts
+from seen_index import SeenIndex
+
+USERS = (101, 102)
+
+
+async def prepare(pool, discounts=3):
+    async with pool.acquire() as conn:
+        service_id = await conn.fetchval("SELECT service_id FROM services WHERE service_name = 'Bench';")
+        await conn.executemany("INSERT INTO users (user_id) VALUES ($1);", [(user_id,) for user_id in USERS])
+        rows = await conn.fetch("""
+            INSERT INTO parsed_discounts (service_id, product_name, discount_percent)
+            SELECT $1, 'Товар ' || n, 30 FROM generate_series(1, $2::INT) AS n
+            RETURNING discount_id;
+        """, service_id, discounts)
+    return service_id, [row['discount_id'] for row in rows]
+
+
+async def insert_sent(conn, user_id, service_id, discount_id):
+    await conn.execute(
+        "INSERT INTO sent_discounts (user_id, service_id, discount_id) VALUES ($1, $2, $3);",
+        user_id, service_id, discount_id
+    )
+
+
+def test_refresh_picks_up_rows_committed_out_of_order(connect_pool):
+    async def scenario():
+        pool = await connect_pool()
+        try:
+            service_id, (first, second, _) = await prepare(pool)
+            index = SeenIndex()
+            await index.warm(pool, snapshot_path="")
+            async with pool.acquire() as slow, pool.acquire() as fast:
+                transaction = slow.transaction()
+                await transaction.start()
+                await insert_sent(slow, USERS[0], service_id, first)    # Меньший sent_id, фиксируется позже
+                await insert_sent(fast, USERS[1], service_id, second)
+                await index.refresh(pool)
+                before = index.contains(USERS[0], first)
+                await transaction.commit()
+            await index.refresh(pool)
+            return before, index.contains(USERS[0], first), index.contains(USERS[1], second)
+        finally:
+            await pool.close()
+
+    before, late, early = asyncio.run(scenario())
+
+    assert not before
+    assert late
+    assert early
+
+
+def test_reload_drops_marks_of_purged_discounts(connect_pool):
+    async def scenario():
+        pool = await connect_pool()
+        try:
+            service_id, (kept, purged, _) = await prepare(pool)
+            async with pool.acquire() as conn:
+                await insert_sent(conn, USERS[0], service_id, kept)
+                await insert_sent(conn, USERS[0], service_id, purged)
+            index = SeenIndex()
+            await index.warm(pool, snapshot_path="")
+            async with pool.acquire() as conn:
+                await conn.execute("""
+                    UPDATE parsed_discounts SET is_active = FALSE, deactivated_at = NOW() - INTERVAL '40 days'
+                    WHERE discount_id = $1;
+                """, purged)
+            await purge_inactive_discounts(pool)
+            before = len(index)
+            await index.reload(pool)
+            return before, len(index), index.contains(USERS[0], kept), index.contains(USERS[0], purged)
+        finally:
+            await pool.close()
+
+    before, after, has_kept, has_purged = asyncio.run(scenario())
+
+    assert (before, after) == (2, 1)
+    assert has_kept
+    assert not has_purged
+
+
+def test_reload_of_buckets_keeps_other_users(monkeypatch):
+    async def no_rows(pool, *args):
+        return []
+
+    async def db_time(pool):
+        return datetime(2026, 10, 18, 3, 30)
+
+    monkeypatch.setattr(seen_index, "get_sent_discounts_since", no_rows)
+    monkeypatch.setattr(seen_index, "get_db_time", db_time)
+    index = SeenIndex()
+    index.add(100, [1, 2])
+    index.add(101, [3])
+
+    asyncio.run(index.reload(None, {0}, 2))
+
+    assert not index.contains(100, 1)
+    assert index.contains(101, 3)
+
+
+def test_snapshot_keeps_sync_time(tmp_path):
+    index = SeenIndex()
+    index.add(100, [5, 1, 3])
+    index.last_sent_id = 42
+    index.checked_at = datetime(2026, 10, 18, 3, 30, 15)
+    path = str(tmp_path / "seen_index.bin")
+    index.save(path)
+
+    loaded = SeenIndex()
+    loaded.load(path)
+
+    assert loaded.last_sent_id == 42
+    assert loaded.checked_at == index.checked_at
+    assert [loaded.contains(100, discount_id) for discount_id in (1, 2, 3, 5)] == [True, False, True, True]
@@ -0,0 +1,68 @@
+# test_sent_discounts.py – Отметки об отправке без повторов при параллельной записи
+import asyncio
+
+from db import lock_sent_buckets, mark_discounts_as_sent_bulk
+
+USERS = (101, 102, 103)
+DISCOUNTS = 20
+
+
+async def prepare(pool):
+    """Пользователи и скидки сервиса Bench; возвращает кортежи (user_id, service_id, discount_id)."""
+    async with pool.acquire() as conn:
+        service_id = await conn.fetchval("SELECT service_id FROM services WHERE service_name = 'Bench';")
+        await conn.executemany("INSERT INTO users (user_id) VALUES ($1);", [(user_id,) for user_id in USERS])
+        discount_ids = await conn.fetch("""
+            INSERT INTO parsed_discounts (service_id, product_name, discount_percent)
+            SELECT $1, 'Товар ' || n, 30 FROM generate_series(1, $2::INT) AS n
+            RETURNING discount_id;
+        """, service_id, DISCOUNTS)
+    return [(user_id, service_id, row['discount_id']) for user_id in USERS for row in discount_ids]
+
+
+async def count_sent(pool):
+    async with pool.acquire() as conn:
+        return await conn.fetchval("SELECT COUNT(*) FROM sent_discounts;")
+
+
+def test_concurrent_marking_writes_each_discount_once(connect_pool):
+    async def scenario():
+        pool = await connect_pool()
+        try:
+            sent = await prepare(pool)
+            inserted = await asyncio.gather(*(mark_discounts_as_sent_bulk(pool, sent) for _ in range(8)))
+            return sent, inserted, await count_sent(pool)
+        finally:
+            await pool.close()
+
+    sent, inserted, total = asyncio.run(scenario())
+
+    assert sum(inserted) == len(sent)
+    assert total == len(sent)
+
+
+def test_marking_waits_for_writer_of_same_user(connect_pool):
+    async def scenario():
+        pool = await connect_pool()
+        try:
+            sent = await prepare(pool)
+            async with pool.acquire() as writer:
+                transaction = writer.transaction()
+                await transaction.start()
+                await lock_sent_buckets(writer, [sent[0][0]])
+                await writer.execute(
+                    "INSERT INTO sent_discounts (user_id, service_id, discount_id) VALUES ($1, $2, $3);", *sent[0]
+                )
+                marking = asyncio.create_task(mark_discounts_as_sent_bulk(pool, sent[:1]))
+                await asyncio.sleep(0.3)
+                waited = not marking.done()
+                await transaction.commit()
+            return waited, await marking, await count_sent(pool)
+        finally:
+            await pool.close()
+
+    waited, inserted, total = asyncio.run(scenario())
+
+    assert waited
+    assert inserted == 0
+    assert total == 1
@@ -0,0 +1,217 @@
+# worker.py – Воркер очереди парсинга: берёт страницы каталогов из scrape_jobs и записывает обходы в базу
+import asyncio
+import logging
+import os
+import socket
+from concurrent.futures import ThreadPoolExecutor
+
+from db import (
+    claim_scrape_job,
+    complete_scrape_job,
+    connect_db,
+    fail_scrape_job,
+    finish_crawl,
+    get_crawl_pages,
+    heartbeat_scrape_job,
+    update_parsed_discounts
+)
+from metrics import WORKER_METRICS_PORT, span, start_metrics_server
+from service_parsers.crawler import batch_keys, discover_page_count, merge_products, page_url
+from service_parsers.driver_pool import DRIVER_POOL_SIZE, shutdown_driver_pool
+from service_parsers.records import ProductBatch
+from service_parsers.sources import find_source
+
+# Логирование
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# Имя воркера в scrape_jobs.worker_id (по умолчанию – хост и PID)
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}"
+# Сколько страниц воркер загружает одновременно (по умолчанию – по числу браузеров в пуле)
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", str(DRIVER_POOL_SIZE)))
+
+SCRAPE_LEASE_SECONDS = int(os.getenv("SCRAPE_LEASE_SECONDS", "120"))          # Аренда задания без продления
+SCRAPE_HEARTBEAT_SECONDS = int(os.getenv("SCRAPE_HEARTBEAT_SECONDS", "30"))   # Как часто продлевать аренду
+SCRAPE_POLL_SECONDS = float(os.getenv("SCRAPE_POLL_SECONDS", "5"))            # Пауза, когда заданий нет
+SCRAPE_RETRY_SECONDS = int(os.getenv("SCRAPE_RETRY_SECONDS", "60"))           # Пауза перед повтором (× номер попытки)
+
+# Загрузка страниц блокирующая (Selenium / HTTP) – выполняем её в отдельных потоках
+page_executor = ThreadPoolExecutor(max_workers=WORKER_CONCURRENCY, thread_name_prefix="page")
+
+
+def crawl_label(job):
+    return f"{job['service_name']} ({job['category'] or 'все'}{', ' + job['city'] if job['city'] else ''})"
+
+
+# ======= 🔗 Следующие страницы обхода ======= #
+async def plan_next_pages(pool, job, products, html):
+    """
+    Какие страницы поставить в очередь после этой – так же, как обходит crawler.crawl:
+    по первой странице определяется число страниц, и все они ставятся сразу;
+    если пагинации нет, страницы пробуются по одной, пока приходят новые товары.
+
+    :return: кортежи (page, url, probe)
+    """
+    max_pages = job['max_pages']
+    if not products or job['page'] >= max_pages:
+        return []
+
+    if job['page'] == 1:
+        page_count = min(discover_page_count(html), max_pages)
+        if page_count > 1:
+            return [(page, page_url(job['crawl_url'], page), False) for page in range(2, page_count + 1)]
+        return [(2, page_url(job['crawl_url'], 2), True)]
+
+    if not job['probe']:
+        return []
+    seen = set()
+    for row in await get_crawl_pages(pool, job['crawl_id']):
+        if row['page'] < job['page'] and row['result']:
+            seen |= batch_keys(ProductBatch.from_bytes(row['result']))
+    if not batch_keys(products) - seen:
+        return []
+    return [(job['page'] + 1, page_url(job['crawl_url'], job['page'] + 1), True)]
+
+
+# ======= 🚀 Выполнение заданий ======= #
+async def keep_lease(pool, job):
+    """Продлевать аренду, пока страница загружается."""
+    while True:
+        await asyncio.sleep(SCRAPE_HEARTBEAT_SECONDS)
+        try:
+            if not await heartbeat_scrape_job(pool, job['job_id'], WORKER_ID, SCRAPE_LEASE_SECONDS):
+                logger.warning(f"⚠️ Аренда страницы {job['page']} {crawl_label(job)} потеряна")
+                return
+        except Exception as e:
+            logger.warning(f"Не удалось продлить аренду задания {job['job_id']}: {e}")
+
+
+async def run_job(pool, job):
+    """Загрузить одну страницу и сохранить результат; последняя страница обхода запускает запись в базу."""
+    label = crawl_label(job)
+    source = find_source(job['service_name'], job['category'], job['city'])
+
+    if job['attempts'] > job['max_attempts']:
+        # Аренда истекала на каждой попытке (воркеры падали на этой странице)
+        outcome = await fail_scrape_job(pool, job, WORKER_ID, "Аренда истекла на всех попытках", 0)
+    elif source is None:
+        outcome = await fail_scrape_job(
+            pool, job, WORKER_ID, "Источник не найден в service_parsers.sources", SCRAPE_RETRY_SECONDS
+        )
+    else:
+        loop = asyncio.get_running_loop()
+        heartbeat = asyncio.create_task(keep_lease(pool, job))
+        try:
+            with span(f"scrape:{job['service_name']}:{job['category'] or 'all'}"):
+                products, html = await loop.run_in_executor(page_executor, source.fetch_page, job['url'])
+        except Exception as e:
+            logger.warning(f"Ошибка при загрузке страницы {job['page']} {label} (попытка {job['attempts']}): {e}")
+            outcome = await fail_scrape_job(pool, job, WORKER_ID, str(e), SCRAPE_RETRY_SECONDS)
+        else:
+            next_pages = await plan_next_pages(pool, job, products, html)
+            outcome = await complete_scrape_job(
+                pool, job, WORKER_ID, products.to_bytes(), len(products), next_pages
+            )
+            logger.info(
+                f"📄 {label}: страница {job['page']} – товаров {len(products)}"
+                + (f", в очередь страниц {len(next_pages)}" if next_pages else "")
+            )
+        finally:
+            heartbeat.cancel()
+
+    if outcome == "lost":
+        logger.warning(f"⚠️ Результат страницы {job['page']} {label} отброшен: задание забрал другой воркер")
+    elif outcome == "ready":
+        await ingest_crawl(pool, job)
+
+
+async def ingest_crawl(pool, job):
+    """Склеить страницы завершённого обхода по порядку и записать скидки в базу."""
+    label = crawl_label(job)
+    try:
+        pages = await get_crawl_pages(pool, job['crawl_id'])
+        if not pages or pages[0]['status'] != 'done':
+            error = pages[0]['error'] if pages else None
+            await finish_crawl(pool, job['crawl_id'], "failed", error or "Первая страница не загружена")
+            logger.error(f"Обход {label} не удался: {error}")
+            return
+
+        products = merge_products(
+            ProductBatch.from_bytes(row['result']) for row in pages if row['status'] == 'done'
+        )
+        if not products:
+            await finish_crawl(pool, job['crawl_id'], "failed", "Товары не найдены")
+            logger.warning(f"⚠️ Обход {label}: товары не найдены")
+            return
+
+        # Страница, не загрузившаяся за все попытки, – неполный обход: пропавшие товары не отключаются.
+        # Пробная страница за концом ленты (после последней страницы с товарами) пропуском не считается
+        last_page = max(row['page'] for row in pages if row['status'] == 'done' and row['products'])
+        failed = sum(
+            1 for row in pages
+            if row['status'] != 'done' and (not row['probe'] or row['page'] < last_page)
+        )
+        with span(f"ingest:{job['service_name']}:{job['category'] or 'all'}"):
+            counts = await update_parsed_discounts(
+                pool, job['service_name'], products, category=job['category'], complete=not failed
+            )
+        await finish_crawl(pool, job['crawl_id'], "done")
+        logger.info(
+            f"✅ Обновлены скидки для {label}: страниц {len(pages) - failed}"
+            + (f" (не загружено {failed}, отключение пропавших пропущено)" if failed else "")
+            + f", новых {counts['inserted']}, изменённых {counts['updated']}, "
+            f"без изменений {counts['unchanged']}, пропало {counts['deactivated']}"
+        )
+    except Exception as e:
+        logger.error(f"Ошибка при сохранении скидок {label}: {e}")
+        try:
+            await finish_crawl(pool, job['crawl_id'], "failed", str(e))
+        except Exception as finish_error:
+            logger.error(f"Не удалось закрыть обход {job['crawl_id']}: {finish_error}")
+
+
+async def worker_loop(pool):
+    """Брать задания, пока они есть; без заданий – ждать SCRAPE_POLL_SECONDS."""
+    while True:
+        try:
+            job = await claim_scrape_job(pool, WORKER_ID, SCRAPE_LEASE_SECONDS)
+        except Exception as e:
+            logger.error(f"Ошибка при получении задания: {e}")
+            job = None
+        if job is None:
+            await asyncio.sleep(SCRAPE_POLL_SECONDS)
+            continue
+        try:
+            await run_job(pool, job)
+        except Exception as e:
+            # Задание вернётся в очередь по истечении аренды
+            logger.error(f"Ошибка при выполнении задания {job['job_id']}: {e}")
+
+
+async def start_worker():
+    """
+    Запуск воркера: WORKER_CONCURRENCY циклов над общей очередью. Воркеров можно
+    запускать на нескольких машинах с одной базой. Страницы, которые остановленный
+    воркер не успел загрузить, другие воркеры заберут по истечении аренды.
+    """
+    start_metrics_server(WORKER_METRICS_PORT)
+    pool = await connect_db()
+    logger.info(f"👷 Воркер {WORKER_ID} запущен, одновременно страниц: {WORKER_CONCURRENCY}")
+    try:
+        await asyncio.gather(*(worker_loop(pool) for _ in range(WORKER_CONCURRENCY)))
+    finally:
+        logger.info("⛔ Воркер остановлен.")
+        page_executor.shutdown(wait=False, cancel_futures=True)
+        shutdown_driver_pool()
+        await pool.close()
+
+
+# ======= 🚀 Запуск ======= #
+if __name__ == "__main__":
+    try:
+        asyncio.run(start_worker())
+    except KeyboardInterrupt:
+        pass